@@ -2,18 +2,124 @@
 Client per l'API Amadeus - Ricerca voli e prezzi
 """
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from amadeus import Client, ResponseError
 from dotenv import load_dotenv
 
+from flight_cache import FlightSearchCache
+from flight_offer import cheapest_offers, parse_offers
+from rate_limiter import RETRYABLE_STATUS, AmadeusUnavailableError, get_rate_limiter
+from token_cache import SharedAccessToken, TokenCache
+
 # Carica variabili d'ambiente
 load_dotenv()
 
+# Numero massimo di combinazioni di date per una ricerca flessibile
+MAX_FLEXIBLE_COMBINATIONS = 60
+
+
+def parse_flight_offers(offers_data):
+    """
+    Parsifica i dati delle offerte voli
+    
+    Args:
+        offers_data: Dati raw dall'API Amadeus
+    
+    Returns:
+        list: Lista di dizionari con info voli semplificate
+    """
+    parsed_offers = []
+    
+    for offer in offers_data:
+        flight_info = {
+            'id': offer.get('id'),
+            'price': {
+                'total': float(offer['price']['total']),
+                'currency': offer['price']['currency']
+            },
+            'itineraries': []
+        }
+        
+        for itinerary in offer.get('itineraries', []):
+            itinerary_info = {
+                'duration': itinerary.get('duration'),
+                'segments': []
+            }
+            
+            for segment in itinerary.get('segments', []):
+                segment_info = {
+                    'departure': {
+                        'iataCode': segment['departure']['iataCode'],
+                        'at': segment['departure']['at']
+                    },
+                    'arrival': {
+                        'iataCode': segment['arrival']['iataCode'],
+                        'at': segment['arrival']['at']
+                    },
+                    'carrier': segment.get('carrierCode'),
+                    'flight_number': segment.get('number'),
+                    'duration': segment.get('duration')
+                }
+                itinerary_info['segments'].append(segment_info)
+            
+            flight_info['itineraries'].append(itinerary_info)
+        
+        parsed_offers.append(flight_info)
+    
+    return parsed_offers
+
+
+def amadeus_connection_options():
+    """
+    Host dell'API dalle variabili AMADEUS_HOSTNAME, AMADEUS_HOST, AMADEUS_SSL e
+    AMADEUS_PORT (es. per usare mock_amadeus_server.py in locale)
+    
+    Returns:
+        dict: Opzioni hostname, ssl, port e host per amadeus.Client
+    """
+    ssl = os.getenv('AMADEUS_SSL', 'true').lower() not in ('false', '0', 'no')
+    options = {
+        'hostname': os.getenv('AMADEUS_HOSTNAME', 'test'),
+        'ssl': ssl,
+        'port': int(os.getenv('AMADEUS_PORT', '443' if ssl else '80'))
+    }
+    host = os.getenv('AMADEUS_HOST')
+    if host:
+        options['host'] = host
+    return options
+
+
+def _retry_after(response):
+    """Secondi indicati dall'header Retry-After della risposta, se presente"""
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _rejected_token(response):
+    """Token OAuth usato dalla richiesta rifiutata, se disponibile"""
+    request = getattr(response, 'request', None)
+    bearer = getattr(request, 'bearer_token', None) or ''
+    return bearer[len('Bearer '):] if bearer.startswith('Bearer ') else None
+
 
 class AmadeusFlightClient:
     """Client per interagire con l'API Amadeus"""
     
-    def __init__(self):
-        """Inizializza il client Amadeus con le credenziali"""
+    def __init__(self, cache=None, rate_limiter=None, token_cache=None):
+        """
+        Inizializza il client Amadeus con le credenziali
+        
+        Args:
+            cache: Cache delle risposte (oggetto con get/set/make_key, es. FlightSearchCache);
+                   se None viene configurata dalle variabili FLIGHT_CACHE_*
+            rate_limiter: Limitatore delle richieste; se None usa quello condiviso dal processo
+            token_cache: Cache condivisa del token OAuth; se None viene configurata da AMADEUS_TOKEN_CACHE
+        """
         api_key = os.getenv('AMADEUS_API_KEY')
         api_secret = os.getenv('AMADEUS_API_SECRET')
         
@@ -24,11 +130,19 @@ class AmadeusFlightClient:
         
         self.client = Client(
             client_id=api_key,
-            client_secret=api_secret
+            client_secret=api_secret,
+            **amadeus_connection_options()
         )
+        self.cache = cache if cache is not None else FlightSearchCache.from_env()
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        
+        # Il token OAuth è condiviso con gli altri processi dell'host
+        token_cache = token_cache if token_cache is not None else TokenCache.from_env()
+        if token_cache is not None:
+            self.client.access_token = SharedAccessToken(self.client, token_cache)
     
     def search_flights(self, origin, destination, departure_date, adults=1, 
-                      max_results=10, currency='EUR'):
+                      max_results=10, currency='EUR', compact=False):
         """
         Cerca voli disponibili
         
@@ -39,28 +153,27 @@ class AmadeusFlightClient:
             adults (int): Numero di adulti
             max_results (int): Numero massimo di risultati
             currency (str): Valuta per i prezzi (EUR, USD, etc.)
+            compact (bool): Restituisce oggetti FlightOffer invece di dict
         
         Returns:
             list: Lista di offerte voli con prezzi
         """
         try:
-            response = self.client.shopping.flight_offers_search.get(
-                originLocationCode=origin,
-                destinationLocationCode=destination,
-                departureDate=departure_date,
-                adults=adults,
-                max=max_results,
-                currencyCode=currency
+            offers_data = self._fetch_offers(
+                origin, destination, departure_date, None,
+                adults, max_results, currency
             )
             
-            return self._parse_flight_offers(response.data)
+            if compact:
+                return parse_offers(offers_data)
+            return self._parse_flight_offers(offers_data)
             
         except ResponseError as error:
             print(f"Errore API Amadeus: {error}")
             return []
     
     def search_round_trip(self, origin, destination, departure_date, return_date,
-                         adults=1, max_results=10, currency='EUR'):
+                         adults=1, max_results=10, currency='EUR', compact=False):
         """
         Cerca voli andata e ritorno
         
@@ -72,76 +185,118 @@ class AmadeusFlightClient:
             adults (int): Numero di adulti
             max_results (int): Numero massimo di risultati
             currency (str): Valuta per i prezzi
+            compact (bool): Restituisce oggetti FlightOffer invece di dict
         
         Returns:
             list: Lista di offerte voli con prezzi
         """
         try:
-            response = self.client.shopping.flight_offers_search.get(
-                originLocationCode=origin,
-                destinationLocationCode=destination,
-                departureDate=departure_date,
-                returnDate=return_date,
-                adults=adults,
-                max=max_results,
-                currencyCode=currency
+            offers_data = self._fetch_offers(
+                origin, destination, departure_date, return_date,
+                adults, max_results, currency
             )
             
-            return self._parse_flight_offers(response.data)
+            if compact:
+                return parse_offers(offers_data)
+            return self._parse_flight_offers(offers_data)
             
         except ResponseError as error:
             print(f"Errore API Amadeus: {error}")
             return []
     
-    def _parse_flight_offers(self, offers_data):
+    def _fetch_offers(self, origin, destination, departure_date, return_date,
+                      adults, max_results, currency):
         """
-        Parsifica i dati delle offerte voli
-        
-        Args:
-            offers_data: Dati raw dall'API Amadeus
+        Dati raw delle offerte, dalla cache se la stessa ricerca è ancora valida
         
         Returns:
-            list: Lista di dizionari con info voli semplificate
-        """
-        parsed_offers = []
-        
-        for offer in offers_data:
-            flight_info = {
-                'id': offer.get('id'),
-                'price': {
-                    'total': float(offer['price']['total']),
-                    'currency': offer['price']['currency']
-                },
-                'itineraries': []
-            }
-            
-            for itinerary in offer.get('itineraries', []):
-                itinerary_info = {
-                    'duration': itinerary.get('duration'),
-                    'segments': []
-                }
-                
-                for segment in itinerary.get('segments', []):
-                    segment_info = {
-                        'departure': {
-                            'iataCode': segment['departure']['iataCode'],
-                            'at': segment['departure']['at']
-                        },
-                        'arrival': {
-                            'iataCode': segment['arrival']['iataCode'],
-                            'at': segment['arrival']['at']
-                        },
-                        'carrier': segment.get('carrierCode'),
-                        'flight_number': segment.get('number'),
-                        'duration': segment.get('duration')
-                    }
-                    itinerary_info['segments'].append(segment_info)
-                
-                flight_info['itineraries'].append(itinerary_info)
-            
-            parsed_offers.append(flight_info)
+            list: Offerte raw come restituite dall'API Amadeus
+        
+        Raises:
+            ResponseError: Se l'API rifiuta la richiesta (gli errori non vengono messi in cache)
+            AmadeusUnavailableError: Se quota o server continuano a rifiutarla dopo i tentativi
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(
+                origin, destination, departure_date, return_date,
+                adults, max_results, currency
+            )
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
+        params = {
+            'originLocationCode': origin,
+            'destinationLocationCode': destination,
+            'departureDate': departure_date,
+            'adults': adults,
+            'max': max_results,
+            'currencyCode': currency
+        }
+        if return_date:
+            params['returnDate'] = return_date
+        
+        response = self._request(self.client.shopping.flight_offers_search.get, **params)
+        
+        if key is not None:
+            self.cache.set(key, response.data)
+        return response.data
+    
+    def _request(self, method, **params):
+        """
+        Esegue una chiamata all'API rispettando il limite di richieste del processo;
+        su 429, 5xx o errori di rete la ripete dopo un'attesa esponenziale con jitter,
+        su 401 rinnova il token e la ripete una volta
+        
+        Raises:
+            ResponseError: Per errori non ripetibili (es. parametri non validi)
+            AmadeusUnavailableError: Se i tentativi si esauriscono
+        """
+        attempt = 0
+        reauthenticated = False
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                return method(**params)
+            except ResponseError as error:
+                status = getattr(error.response, 'status_code', None)
+                if status == 401 and not reauthenticated:
+                    # Token revocato o ruotato: lo scarta e riprova una volta con uno nuovo
+                    self._invalidate_token(_rejected_token(error.response))
+                    reauthenticated = True
+                    continue
+                if not self.rate_limiter.should_retry(status, attempt):
+                    if status in RETRYABLE_STATUS:
+                        raise self.rate_limiter.give_up(status, error) from error
+                    raise
+                time.sleep(self.rate_limiter.backoff(attempt, status, _retry_after(error.response)))
+                attempt += 1
+    
+    def _invalidate_token(self, rejected_token=None):
+        """
+        Forza il rinnovo del token OAuth alla prossima richiesta, ma solo se il
+        token attuale è quello rifiutato (un 401 in ritardo su un token già
+        rinnovato non deve scartare quello nuovo)
+        """
+        access_token = self.client.access_token
+        if isinstance(access_token, SharedAccessToken):
+            access_token.invalidate(rejected_token)
+        elif rejected_token is None or access_token.access_token == rejected_token:
+            access_token.access_token, access_token.expires_at = None, 0
+    
+    def cache_stats(self):
+        """
+        Statistiche della cache delle risposte
         
-        return parsed_offers
+        Returns:
+            dict: Hit, miss e occupazione, o None se la cache è disattivata
+        """
+        return self.cache.stats() if self.cache is not None else None
+    
+    def _parse_flight_offers(self, offers_data):
+        """Parsifica i dati delle offerte voli (vedi parse_flight_offers)"""
+        return parse_flight_offers(offers_data)
     
     def get_cheapest_flight(self, origin, destination, departure_date, 
                            return_date=None, adults=1, currency='EUR'):
@@ -151,20 +306,151 @@ class AmadeusFlightClient:
         Returns:
             dict: Info del volo più economico o None se non trovato
         """
-        if return_date:
-            offers = self.search_round_trip(
-                origin, destination, departure_date, return_date, 
-                adults, max_results=50, currency=currency
+        cheapest = self.get_cheapest_flights(
+            origin, destination, departure_date, return_date,
+            adults, currency, k=1
+        )
+        return cheapest[0] if cheapest else None
+    
+    def get_cheapest_flights(self, origin, destination, departure_date,
+                             return_date=None, adults=1, currency='EUR', k=5,
+                             max_results=50):
+        """
+        Trova i k voli più economici: delle offerte ricevute viene letto solo
+        il prezzo e vengono parsificate per intero solo le k scelte
+        
+        Args:
+            k (int): Numero di offerte da restituire
+            max_results (int): Offerte richieste all'API tra cui scegliere
+        
+        Returns:
+            list: Fino a k offerte, dalla più economica
+        """
+        try:
+            offers_data = self._fetch_offers(
+                origin, destination, departure_date, return_date,
+                adults, max_results, currency
             )
+        except ResponseError as error:
+            print(f"Errore API Amadeus: {error}")
+            return []
+        
+        return [offer.to_dict() for offer in cheapest_offers(offers_data, k)]
+    
+    def search_flexible_dates(self, origin, destination, departure_from, departure_to,
+                              min_stay=None, max_stay=None, adults=1, currency='EUR',
+                              max_workers=4):
+        """
+        Cerca il volo più economico in una finestra di date di partenza,
+        con durata del soggiorno opzionale (andata e ritorno)
+        
+        Args:
+            origin (str): Codice aeroporto IATA di partenza
+            destination (str): Codice aeroporto IATA di destinazione
+            departure_from (str): Prima data di partenza YYYY-MM-DD
+            departure_to (str): Ultima data di partenza YYYY-MM-DD
+            min_stay (int): Notti minime di soggiorno (None per solo andata)
+            max_stay (int): Notti massime di soggiorno (default pari a min_stay)
+            adults (int): Numero di adulti
+            currency (str): Valuta per i prezzi
+            max_workers (int): Ricerche eseguite in parallelo
+        
+        Returns:
+            dict: departure_dates, stays, matrix (prezzo minimo per data e
+                  soggiorno, None se nessuna offerta), results (offerte di ogni
+                  combinazione, con error se la ricerca è fallita), cheapest
+                  (combinazione più economica) e errors (ricerche fallite)
+        
+        Raises:
+            ValueError: Se la finestra non è valida o contiene troppe combinazioni
+            AmadeusUnavailableError: Se tutte le ricerche falliscono
+        """
+        start = datetime.strptime(departure_from, '%Y-%m-%d')
+        end = datetime.strptime(departure_to, '%Y-%m-%d')
+        if end < start:
+            raise ValueError("La data finale della finestra precede quella iniziale")
+        
+        if min_stay is None and max_stay is not None:
+            min_stay = max_stay
+        if min_stay is not None:
+            max_stay = min_stay if max_stay is None else max_stay
+            if min_stay < 0 or max_stay < min_stay:
+                raise ValueError("Durata del soggiorno non valida")
+            stays = list(range(min_stay, max_stay + 1))
         else:
-            offers = self.search_flights(
-                origin, destination, departure_date, 
-                adults, max_results=50, currency=currency
+            stays = [None]
+        
+        departure_dates = [
+            (start + timedelta(days=i)).strftime('%Y-%m-%d')
+            for i in range((end - start).days + 1)
+        ]
+        combinations = [(d, stay) for d in departure_dates for stay in stays]
+        if len(combinations) > MAX_FLEXIBLE_COMBINATIONS:
+            raise ValueError(
+                f"Troppe combinazioni di date ({len(combinations)}), "
+                f"massimo {MAX_FLEXIBLE_COMBINATIONS}"
             )
         
-        if not offers:
-            return None
+        failures = []
+        
+        def search(combination):
+            departure_date, stay = combination
+            return_date = None
+            if stay is not None:
+                return_date = (datetime.strptime(departure_date, '%Y-%m-%d')
+                               + timedelta(days=stay)).strftime('%Y-%m-%d')
+            result = {
+                'departure_date': departure_date,
+                'return_date': return_date,
+                'stay': stay,
+                'offers': [],
+                'cheapest': None
+            }
+            
+            # Una combinazione fallita non fa perdere quelle già ottenute
+            try:
+                if return_date is None:
+                    offers = self.search_flights(
+                        origin, destination, departure_date,
+                        adults, max_results=50, currency=currency
+                    )
+                else:
+                    offers = self.search_round_trip(
+                        origin, destination, departure_date, return_date,
+                        adults, max_results=50, currency=currency
+                    )
+            except AmadeusUnavailableError as e:
+                failures.append(e)
+                result['error'] = str(e)
+                return result
+            
+            result['offers'] = offers
+            result['cheapest'] = min(offers, key=lambda x: x['price']['total']) if offers else None
+            return result
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(search, combinations))
+        
+        if len(failures) == len(results):
+            raise failures[0]
+        
+        # Matrice date di partenza x durata del soggiorno
+        matrix = [
+            [
+                result['cheapest']['price']['total'] if result['cheapest'] else None
+                for result in results[row * len(stays):(row + 1) * len(stays)]
+            ]
+            for row in range(len(departure_dates))
+        ]
+        
+        priced = [result for result in results if result['cheapest']]
+        cheapest = min(priced, key=lambda x: x['cheapest']['price']['total']) if priced else None
         
-        # Ordina per prezzo e restituisci il più economico
-        cheapest = min(offers, key=lambda x: x['price']['total'])
-        return cheapest
+        return {
+            'departure_dates': departure_dates,
+            'stays': stays,
+            'matrix': matrix,
+            'results': results,
+            'cheapest': cheapest,
+            'errors': len(failures)
+        }
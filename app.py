@@ -4,7 +4,14 @@ Flight Price Tracker - Web App con Flask
 from flask import Flask, render_template, request, jsonify
 from flask_cors import CORS
 from amadeus_client import AmadeusFlightClient
-from price_storage import PriceStorage
+from flight_cache import FlightSearchCache
+from pagination import (DEFAULT_LIMIT, decode_cursor, encode_cursor, paginate,
+                        parse_fields, parse_limit, project)
+from price_alerts import attach_alerts
+from price_storage import create_storage
+from rate_limiter import AmadeusUnavailableError
+from route_index import RouteSummaryIndex
+from single_flight import SingleFlight
 from datetime import datetime
 import os
 
@@ -14,14 +21,83 @@ CORS(app)
 # Inizializza client e storage
 try:
     client = AmadeusFlightClient()
-    storage = PriceStorage()
+    storage = create_storage()
     api_ready = True
 except ValueError as e:
     print(f"⚠️ API non configurata: {e}")
     client = None
-    storage = PriceStorage()
+    storage = create_storage()
     api_ready = False
 
+# Regole di alert valutate a ogni ricerca salvata
+alerts = attach_alerts(storage)
+
+# Ricerche identiche concorrenti condividono la stessa chiamata e lo stesso record
+search_flight = SingleFlight()
+
+# Offerte delle ricerche paginate, per servire le pagine successive senza ripetere la ricerca
+search_pages = FlightSearchCache(ttl=600, max_entries=128)
+DEFAULT_SEARCH_PAGE = 10
+
+# Ordinamenti ammessi per la paginazione
+ROUTE_SORTS = {
+    'last_price': lambda entry: entry.get('last_price'),
+    'last_search': lambda entry: entry.get('last_search')
+}
+HISTORY_SORTS = {
+    'timestamp': lambda record: record.get('timestamp'),
+    'price': lambda record: record.get('cheapest_price')
+}
+
+
+def search_page_key(key):
+    """Chiave di search_pages per (origin, destination, departure_date, return_date, adults)"""
+    return search_pages.make_key(*key, max_results=10, currency='EUR')
+
+
+def search_page_offers(key):
+    """
+    Offerte ordinate per prezzo di una ricerca paginata
+    Se non sono più in memoria (scadute o servite da un altro worker) la ricerca
+    viene ripetuta senza salvarla, di solito dalla cache delle risposte
+    
+    Returns:
+        list: Offerte dalla più economica
+    """
+    offers = search_pages.get(search_page_key(key))
+    if offers is None:
+        origin, destination, departure_date, return_date, adults = key
+        if return_date:
+            offers = client.search_round_trip(origin, destination, departure_date, return_date, adults)
+        else:
+            offers = client.search_flights(origin, destination, departure_date, adults)
+        offers = sorted(offers, key=lambda offer: offer['price']['total'])
+        search_pages.set(search_page_key(key), offers)
+    return offers
+
+
+def run_search(origin, destination, departure_date, return_date, adults):
+    """
+    Esegue la ricerca sull'API e salva il risultato nello storico
+    
+    Returns:
+        list: Offerte trovate
+    """
+    if return_date:
+        offers = client.search_round_trip(
+            origin, destination, departure_date, return_date, adults
+        )
+    else:
+        offers = client.search_flights(
+            origin, destination, departure_date, adults
+        )
+    
+    # Salva risultati
+    if offers:
+        storage.save_search(origin, destination, departure_date, return_date, offers)
+    
+    return offers
+
 
 @app.route('/')
 def index():
@@ -39,11 +115,33 @@ def search_flights():
         }), 500
     
     data = request.json
-    origin = data.get('origin', '').strip().upper()
-    destination = data.get('destination', '').strip().upper()
-    departure_date = data.get('departure_date', '').strip()
-    return_date = data.get('return_date', '').strip() or None
-    adults = int(data.get('adults', 1))
+    
+    # Pagina successiva: la ricerca è nel cursore, non viene salvata di nuovo
+    cursor = data.get('cursor')
+    try:
+        limit = parse_limit(data.get('limit'), default=None)
+        fields = parse_fields(data.get('fields'))
+        if cursor:
+            state = decode_cursor(cursor)
+            origin, destination, departure_date, return_date, adults = state['query']
+            if not all(isinstance(value, str) for value in (origin, destination, departure_date)):
+                raise ValueError('Cursore non valido')
+            adults = int(adults)
+            offset = int(state['offset'])
+            limit = limit or DEFAULT_SEARCH_PAGE
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e) if isinstance(e, ValueError) else 'Cursore non valido'
+        }), 400
+    
+    if not cursor:
+        origin = data.get('origin', '').strip().upper()
+        destination = data.get('destination', '').strip().upper()
+        departure_date = data.get('departure_date', '').strip()
+        return_date = data.get('return_date', '').strip() or None
+        adults = int(data.get('adults', 1))
+        offset = 0
     
     # Validazione
     if not origin or not destination or not departure_date:
@@ -53,24 +151,131 @@ def search_flights():
         }), 400
     
     try:
-        # Ricerca voli
-        if return_date:
-            offers = client.search_round_trip(
-                origin, destination, departure_date, return_date, adults
-            )
+        key = (origin, destination, departure_date, return_date, adults)
+        if cursor:
+            offers = search_page_offers(key)
+            shared = False
         else:
-            offers = client.search_flights(
-                origin, destination, departure_date, adults
+            # Ricerca voli (una sola chiamata per richieste identiche in corso)
+            offers, shared = search_flight.do(
+                key,
+                lambda: run_search(origin, destination, departure_date, return_date, adults)
             )
         
-        # Salva risultati
-        if offers:
-            storage.save_search(origin, destination, departure_date, return_date, offers)
+        if limit is None:
+            return jsonify({
+                'success': True,
+                'offers': [project(offer, fields) for offer in offers],
+                'count': len(offers),
+                'coalesced': shared
+            })
+        
+        # Con limit le offerte arrivano a pagine, dalla più economica
+        if not cursor:
+            offers = sorted(offers, key=lambda offer: offer['price']['total'])
+            search_pages.set(search_page_key(key), offers)
+        page = offers[offset:offset + limit]
+        next_cursor = None
+        if offset + limit < len(offers):
+            next_cursor = encode_cursor({'query': list(key), 'offset': offset + limit})
         
         return jsonify({
             'success': True,
-            'offers': offers,
-            'count': len(offers)
+            'offers': [project(offer, fields) for offer in page],
+            'count': len(page),
+            'total': len(offers),
+            'next_cursor': next_cursor,
+            'coalesced': shared
+        })
+    
+    except AmadeusUnavailableError as e:
+        # Quota esaurita o server non disponibile: non è un "nessun volo trovato"
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/search/flexible', methods=['POST'])
+def search_flexible():
+    """Endpoint per cercare il volo più economico in una finestra di date"""
+    if not api_ready:
+        return jsonify({
+            'success': False,
+            'error': 'API non configurata. Controlla il file .env'
+        }), 500
+    
+    data = request.json
+    origin = data.get('origin', '').strip().upper()
+    destination = data.get('destination', '').strip().upper()
+    departure_from = data.get('departure_from', '').strip()
+    departure_to = data.get('departure_to', '').strip() or departure_from
+    min_stay = data.get('min_stay')
+    max_stay = data.get('max_stay')
+    adults = int(data.get('adults', 1))
+    
+    # Validazione
+    if not origin or not destination or not departure_from:
+        return jsonify({
+            'success': False,
+            'error': 'Compila tutti i campi obbligatori'
+        }), 400
+    
+    try:
+        result = client.search_flexible_dates(
+            origin, destination, departure_from, departure_to,
+            min_stay=int(min_stay) if min_stay not in (None, '') else None,
+            max_stay=int(max_stay) if max_stay not in (None, '') else None,
+            adults=adults
+        )
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except AmadeusUnavailableError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
+    
+    try:
+        # Tutte le combinazioni con offerte vengono salvate con una sola scrittura
+        saved = storage.save_searches(
+            {
+                'origin': origin,
+                'destination': destination,
+                'departure_date': cell['departure_date'],
+                'return_date': cell['return_date'],
+                'offers': cell['offers']
+            }
+            for cell in result['results'] if cell['offers']
+        )
+        
+        cheapest = result['cheapest']
+        return jsonify({
+            'success': True,
+            'departure_dates': result['departure_dates'],
+            'stays': result['stays'],
+            'matrix': result['matrix'],
+            'cheapest': {
+                'departure_date': cheapest['departure_date'],
+                'return_date': cheapest['return_date'],
+                'stay': cheapest['stay'],
+                'offer': cheapest['cheapest']
+            } if cheapest else None,
+            'saved': saved,
+            # Combinazioni non cercate (quota o API non disponibili): restano None nella matrice
+            'failed': [
+                {'departure_date': cell['departure_date'], 'stay': cell['stay'], 'error': cell['error']}
+                for cell in result['results'] if 'error' in cell
+            ]
         })
     
     except Exception as e:
@@ -94,32 +299,147 @@ def get_price_history():
             'error': 'Parametri mancanti'
         }), 400
     
-    trend = storage.get_price_trend(origin, destination, departure_date, return_date)
+    # Con limit (o cursor) restituisce anche le ricerche dello storico, a pagine
+    cursor = request.args.get('cursor')
+    try:
+        limit = parse_limit(request.args.get('limit'), default=None)
+        fields = parse_fields(request.args.get('fields'))
+        history = page = None
+        if limit or cursor:
+            history = storage.get_price_history(origin, destination, departure_date, return_date)
+            page, next_cursor = paginate(
+                history,
+                HISTORY_SORTS,
+                request.args.get('sort', 'timestamp'),
+                request.args.get('order', 'desc'),
+                cursor,
+                limit or DEFAULT_LIMIT,
+                tiebreak=lambda record: record.get('id') or record['timestamp']
+            )
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     
-    return jsonify({
-        'success': True,
-        'trend': trend
-    })
+    response = {'success': True}
+    # Il trend serve solo con la prima pagina, calcolato dallo storico già letto
+    if not cursor:
+        if history is None:
+            response['trend'] = storage.get_price_trend(origin, destination, departure_date, return_date)
+        else:
+            response['trend'] = storage.price_trend_from_history(history)
+    if page is not None:
+        response['history'] = [project(record, fields) for record in page]
+        response['count'] = len(page)
+        response['next_cursor'] = next_cursor
+    
+    return jsonify(response)
 
 
 @app.route('/api/routes', methods=['GET'])
 def get_routes():
-    """Endpoint per ottenere tutte le rotte monitorate"""
+    """
+    Endpoint per ottenere le rotte monitorate, a pagine se riceve limit o cursor
+    (senza, tutte le rotte come nelle versioni precedenti)
+    
+    Parametri: limit, cursor (next_cursor della pagina precedente),
+    sort (last_search o last_price), order (asc o desc), fields (es. route,last_price)
+    """
     routes = storage.get_all_routes()
+    cursor = request.args.get('cursor')
+    
+    if not request.args.get('limit') and not cursor:
+        return jsonify({
+            'success': True,
+            'routes': routes,
+            'count': len(routes)
+        })
+    
+    try:
+        page, next_cursor = paginate(
+            routes,
+            ROUTE_SORTS,
+            request.args.get('sort', 'last_search'),
+            request.args.get('order', 'desc'),
+            cursor,
+            parse_limit(request.args.get('limit'), default=DEFAULT_LIMIT),
+            tiebreak=lambda entry: RouteSummaryIndex.route_key(entry['route'])
+        )
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     
     return jsonify({
         'success': True,
-        'routes': routes,
-        'count': len(routes)
+        'routes': [project(entry, fields) for entry in page],
+        'count': len(page),
+        'total': len(routes),
+        'next_cursor': next_cursor
     })
 
 
+@app.route('/api/alerts', methods=['GET'])
+def get_alerts():
+    """Endpoint per ottenere le regole di alert e gli ultimi alert scattati"""
+    return jsonify({
+        'success': True,
+        'rules': alerts.list_rules(),
+        'recent_alerts': list(alerts.recent)
+    })
+
+
+@app.route('/api/alerts', methods=['POST'])
+def create_alert():
+    """Endpoint per registrare una regola di alert su una rotta"""
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        rule = alerts.add_rule(
+            data.get('origin', '').strip().upper(),
+            data.get('destination', '').strip().upper(),
+            data.get('departure_date', '').strip(),
+            (data.get('return_date') or '').strip() or None,
+            rule_type=data.get('type', 'all_time_low'),
+            threshold=data.get('threshold'),
+            percent=data.get('percent')
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        'rule': rule
+    }), 201
+
+
+@app.route('/api/alerts/<rule_id>', methods=['DELETE'])
+def delete_alert(rule_id):
+    """Endpoint per eliminare una regola di alert"""
+    if not alerts.remove_rule(rule_id):
+        return jsonify({
+            'success': False,
+            'error': 'Regola non trovata'
+        }), 404
+    
+    return jsonify({'success': True})
+
+
 @app.route('/api/status', methods=['GET'])
 def get_status():
     """Endpoint per verificare lo stato dell'API"""
     return jsonify({
         'success': True,
-        'api_ready': api_ready
+        'api_ready': api_ready,
+        'cache': client.cache_stats() if client else None,
+        'search_coalescing': search_flight.stats(),
+        'rate_limiter': client.rate_limiter.stats() if client else None
     })
 
 
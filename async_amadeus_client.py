@@ -0,0 +1,323 @@
+"""
+Client asincrono per l'API Amadeus - Ricerche in parallelo su molte rotte
+Stessi metodi e stesso formato delle offerte di AmadeusFlightClient, ma con
+una sessione HTTP condivisa (connessioni riusate) e un limite di richieste
+contemporanee, per eseguire centinaia di ricerche per ciclo di polling
+"""
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+from amadeus import Client
+from dotenv import load_dotenv
+
+from amadeus_client import amadeus_connection_options, parse_flight_offers
+from flight_cache import FlightSearchCache
+from flight_offer import cheapest_offers, parse_offers
+from rate_limiter import RETRYABLE_STATUS, get_rate_limiter
+from token_cache import TOKEN_PATH, TokenCache
+
+# Carica variabili d'ambiente
+load_dotenv()
+
+FLIGHT_OFFERS_PATH = '/v2/shopping/flight-offers'
+
+
+class AmadeusAPIError(Exception):
+    """Risposta di errore dell'API Amadeus"""
+
+    def __init__(self, status_code: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"[{status_code}] {message}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def amadeus_base_url() -> str:
+    """URL base dell'API, configurato come per il client sincrono (amadeus_connection_options)"""
+    options = amadeus_connection_options()
+    host = options.get('host') or Client.HOSTS[options['hostname']]
+    ssl, port = options['ssl'], options['port']
+    scheme = 'https' if ssl else 'http'
+
+    if (ssl and port == 443) or (not ssl and port == 80):
+        return f"{scheme}://{host}"
+    return f"{scheme}://{host}:{port}"
+
+
+class AsyncAmadeusFlightClient:
+    """Client asincrono per interagire con l'API Amadeus"""
+
+    def __init__(self, max_concurrency: Optional[int] = None, pool_size: Optional[int] = None,
+                 timeout: float = 30, cache=None, rate_limiter=None, token_cache=None):
+        """
+        Args:
+            max_concurrency: Richieste contemporanee massime (default AMADEUS_MAX_CONCURRENCY o 20)
+            pool_size: Connessioni HTTP massime nel pool (default pari a max_concurrency)
+            timeout: Secondi massimi per richiesta
+            cache: Cache delle risposte; se None viene configurata dalle variabili FLIGHT_CACHE_*
+            rate_limiter: Limitatore delle richieste; se None usa quello condiviso dal processo
+            token_cache: Cache condivisa del token OAuth; se None viene configurata da AMADEUS_TOKEN_CACHE
+        """
+        self.api_key = os.getenv('AMADEUS_API_KEY')
+        self.api_secret = os.getenv('AMADEUS_API_SECRET')
+
+        if not self.api_key or not self.api_secret:
+            raise ValueError(
+                "AMADEUS_API_KEY e AMADEUS_API_SECRET devono essere configurati nel file .env"
+            )
+
+        self.max_concurrency = max_concurrency or int(os.getenv('AMADEUS_MAX_CONCURRENCY', '20'))
+        self.pool_size = pool_size or self.max_concurrency
+        self.timeout = timeout
+        self.base_url = amadeus_base_url()
+        self.cache = cache if cache is not None else FlightSearchCache.from_env()
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.token_cache = token_cache if token_cache is not None else TokenCache.from_env()
+        self._token_key = TokenCache.make_key(urlparse(self.base_url).hostname, self.api_key)
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._token_lock: Optional[asyncio.Lock] = None
+        self._access_token: Optional[str] = None
+        self._token_expires_at = 0.0
+
+    async def __aenter__(self) -> 'AsyncAmadeusFlightClient':
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """Chiude la sessione HTTP e le connessioni del pool"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def search_flights(self, origin: str, destination: str, departure_date: str,
+                             adults: int = 1, max_results: int = 10,
+                             currency: str = 'EUR', compact: bool = False) -> List:
+        """
+        Cerca voli disponibili (solo andata)
+        Con compact=True restituisce oggetti FlightOffer invece di dict
+
+        Returns:
+            list: Lista di offerte voli nel formato di parse_flight_offers
+        """
+        try:
+            offers_data = await self._fetch_offers(
+                origin, destination, departure_date, None,
+                adults, max_results, currency
+            )
+            return parse_offers(offers_data) if compact else parse_flight_offers(offers_data)
+        except (AmadeusAPIError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+            print(f"Errore API Amadeus: {error}")
+            return []
+
+    async def search_round_trip(self, origin: str, destination: str, departure_date: str,
+                                return_date: str, adults: int = 1, max_results: int = 10,
+                                currency: str = 'EUR', compact: bool = False) -> List:
+        """
+        Cerca voli andata e ritorno
+        Con compact=True restituisce oggetti FlightOffer invece di dict
+
+        Returns:
+            list: Lista di offerte voli nel formato di parse_flight_offers
+        """
+        try:
+            offers_data = await self._fetch_offers(
+                origin, destination, departure_date, return_date,
+                adults, max_results, currency
+            )
+            return parse_offers(offers_data) if compact else parse_flight_offers(offers_data)
+        except (AmadeusAPIError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+            print(f"Errore API Amadeus: {error}")
+            return []
+
+    async def get_cheapest_flight(self, origin: str, destination: str, departure_date: str,
+                                  return_date: Optional[str] = None, adults: int = 1,
+                                  currency: str = 'EUR') -> Optional[Dict]:
+        """
+        Trova il volo più economico
+
+        Returns:
+            dict: Info del volo più economico o None se non trovato
+        """
+        cheapest = await self.get_cheapest_flights(
+            origin, destination, departure_date, return_date,
+            adults, currency, k=1
+        )
+        return cheapest[0] if cheapest else None
+
+    async def get_cheapest_flights(self, origin: str, destination: str, departure_date: str,
+                                   return_date: Optional[str] = None, adults: int = 1,
+                                   currency: str = 'EUR', k: int = 5,
+                                   max_results: int = 50) -> List[Dict]:
+        """
+        Trova i k voli più economici, parsificando per intero solo quelli
+
+        Returns:
+            list: Fino a k offerte, dalla più economica
+        """
+        try:
+            offers_data = await self._fetch_offers(
+                origin, destination, departure_date, return_date,
+                adults, max_results, currency
+            )
+        except (AmadeusAPIError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+            print(f"Errore API Amadeus: {error}")
+            return []
+
+        return [offer.to_dict() for offer in cheapest_offers(offers_data, k)]
+
+    async def get_cheapest_flights_many(self, routes: List[Dict]) -> List[Optional[Dict]]:
+        """
+        Volo più economico per ciascuna rotta, con le richieste in parallelo
+
+        Args:
+            routes: Lista di dict con origin, destination, departure_date e
+                    opzionalmente return_date, adults, currency
+
+        Returns:
+            list: Volo più economico (o None) per ogni rotta, nello stesso ordine
+        """
+        return await asyncio.gather(*(self.get_cheapest_flight(**route) for route in routes))
+
+    async def _fetch_offers(self, origin: str, destination: str, departure_date: str,
+                            return_date: Optional[str], adults: int, max_results: int,
+                            currency: str) -> List[Dict]:
+        """
+        Dati raw delle offerte, dalla cache se la stessa ricerca è ancora valida
+
+        Raises:
+            AmadeusAPIError: Se l'API rifiuta la richiesta
+            AmadeusUnavailableError: Se quota o server continuano a rifiutarla dopo i tentativi
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(
+                origin, destination, departure_date, return_date,
+                adults, max_results, currency
+            )
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        params = {
+            'originLocationCode': origin,
+            'destinationLocationCode': destination,
+            'departureDate': departure_date,
+            'adults': adults,
+            'max': max_results,
+            'currencyCode': currency
+        }
+        if return_date:
+            params['returnDate'] = return_date
+
+        body = await self._get(FLIGHT_OFFERS_PATH, params)
+        offers_data = body.get('data', [])
+
+        if key is not None:
+            self.cache.set(key, offers_data)
+        return offers_data
+
+    async def _get(self, path: str, params: Dict) -> Dict:
+        """
+        GET autenticato, limitato dal semaforo e dal limite di richieste del processo;
+        su 429, 5xx o errori di rete ripete dopo un'attesa esponenziale con jitter
+        """
+        session = self._get_session()
+
+        async with self._semaphore:
+            attempt = 0
+            while True:
+                await self.rate_limiter.acquire_async()
+                try:
+                    return await self._get_authenticated(session, path, params)
+                except (AmadeusAPIError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+                    status = getattr(error, 'status_code', None)
+                    if not self.rate_limiter.should_retry(status, attempt):
+                        if status in RETRYABLE_STATUS:
+                            raise self.rate_limiter.give_up(status, error) from error
+                        raise
+                    await asyncio.sleep(self.rate_limiter.backoff(
+                        attempt, status, getattr(error, 'retry_after', None)
+                    ))
+                    attempt += 1
+
+    async def _get_authenticated(self, session: aiohttp.ClientSession, path: str, params: Dict) -> Dict:
+        """Singola GET con il token corrente; un 401 rinnova il token e riprova una volta"""
+        rejected = None
+        for attempt in range(2):
+            token = await self._get_token(rejected=rejected)
+            async with session.get(self.base_url + path, params=params,
+                                   headers={'Authorization': f"Bearer {token}"}) as response:
+                if response.status == 401 and attempt == 0:
+                    rejected = token
+                    continue
+                return await self._read_json(response)
+
+    async def _get_token(self, rejected: Optional[str] = None) -> str:
+        """
+        Token OAuth valido, condiviso con gli altri processi tramite la cache dei token
+        se configurata; rejected è il token rifiutato con un 401, scartato solo se è
+        ancora quello attuale (se un'altra richiesta l'ha già rinnovato si usa il nuovo)
+        """
+        async with self._token_lock:
+            force = rejected is not None and rejected == self._access_token
+            if rejected is not None and self.token_cache is not None:
+                await asyncio.to_thread(self.token_cache.invalidate, self._token_key, rejected)
+
+            margin = self.token_cache.refresh_margin if self.token_cache is not None else 10
+            if force or not self._access_token or self._token_expires_at - time.time() < margin:
+                if self.token_cache is not None:
+                    self._access_token, self._token_expires_at = await self.token_cache.get_token_async(
+                        self._token_key, self._fetch_token
+                    )
+                else:
+                    body = await self._fetch_token()
+                    self._access_token = body['access_token']
+                    self._token_expires_at = time.time() + int(body.get('expires_in', 0))
+            return self._access_token
+
+    async def _fetch_token(self) -> Dict:
+        """Richiede un nuovo token all'API"""
+        session = self._get_session()
+        async with session.post(self.base_url + TOKEN_PATH, data={
+            'grant_type': 'client_credentials',
+            'client_id': self.api_key,
+            'client_secret': self.api_secret
+        }) as response:
+            return await self._read_json(response)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Sessione HTTP condivisa, creata al primo uso all'interno dell'event loop"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._token_lock = asyncio.Lock()
+        return self._session
+
+    @staticmethod
+    async def _read_json(response: aiohttp.ClientResponse) -> Dict:
+        """Corpo JSON della risposta, o AmadeusAPIError se lo stato indica un errore"""
+        try:
+            body = await response.json(content_type=None)
+        except ValueError:
+            body = {}
+
+        if response.status >= 400:
+            errors = body.get('errors') or [{}]
+            message = errors[0].get('detail') or errors[0].get('title') \
+                or body.get('error_description') or response.reason
+            try:
+                retry_after = float(response.headers.get('Retry-After'))
+            except (TypeError, ValueError):
+                retry_after = None
+            raise AmadeusAPIError(response.status, message, retry_after)
+        return body
@@ -0,0 +1,104 @@
+"""
+Microbenchmark del parsing delle offerte Amadeus
+Confronta il parser a dict annidati (parse_flight_offers) con la forma
+compatta di flight_offer, su risposte registrate o sintetiche
+
+Uso:
+    python benchmark_parser.py                       # 200 risposte sintetiche da 50 offerte
+    python benchmark_parser.py risposta1.json ...    # risposte registrate (campo "data" o lista)
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from amadeus_client import parse_flight_offers
+from flight_offer import cheapest_offers, parse_offers
+from synthetic_offers import generate_offers
+
+
+def load_payloads(paths: List[str]) -> List[List[Dict]]:
+    """Carica risposte registrate: file con {"data": [...]} o direttamente la lista"""
+    payloads = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            body = json.load(f)
+        payloads.append(body['data'] if isinstance(body, dict) else body)
+    return payloads
+
+
+def synthetic_payloads(responses: int, offers: int) -> List[List[Dict]]:
+    """Risposte sintetiche andata e ritorno su rotte e date diverse"""
+    routes = [('FCO', 'JFK'), ('MXP', 'LHR'), ('LIN', 'CDG'), ('NAP', 'BCN'), ('VCE', 'AMS')]
+    payloads = []
+    for i in range(responses):
+        origin, destination = routes[i % len(routes)]
+        day = 1 + i % 28
+        payloads.append(generate_offers(
+            origin, destination, f"2026-03-{day:02d}", f"2026-04-{day:02d}", count=offers
+        ))
+    return payloads
+
+
+def measure(name: str, fn: Callable[[List[Dict]], object], payloads: List[List[Dict]],
+            repeat: int) -> Dict:
+    """Tempo medio per risposta (migliore di `repeat` passate) e memoria trattenuta dai risultati"""
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        for payload in payloads:
+            fn(payload)
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    results = [fn(payload) for payload in payloads]
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+
+    return {
+        'name': name,
+        'us_per_response': best / len(payloads) * 1e6,
+        'retained_kb': retained / 1024
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del parsing delle offerte")
+    parser.add_argument('payloads', nargs='*', help="File JSON di risposte registrate")
+    parser.add_argument('--responses', type=int, default=200, help="Risposte sintetiche")
+    parser.add_argument('--offers', type=int, default=50, help="Offerte per risposta sintetica")
+    parser.add_argument('--repeat', type=int, default=5, help="Ripetizioni per misura")
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.payloads) if args.payloads else \
+        synthetic_payloads(args.responses, args.offers)
+    offers_count = sum(len(p) for p in payloads)
+
+    cases = [
+        ('dict (parse_flight_offers)', parse_flight_offers),
+        ('compatto (parse_offers)', parse_offers),
+        ('compatto + to_dict di tutte', lambda data: [o.to_dict() for o in parse_offers(data)]),
+        ('compatto + to_dict del minimo', lambda data: min(
+            parse_offers(data), key=lambda o: o.price_total).to_dict() if data else None),
+        ('top-1 (solo prezzi + heap)', lambda data: [o.to_dict() for o in cheapest_offers(data, 1)]),
+        ('top-5 (solo prezzi + heap)', lambda data: [o.to_dict() for o in cheapest_offers(data, 5)]),
+    ]
+
+    print(f"\n⏱️  PARSING OFFERTE - {len(payloads)} risposte, {offers_count} offerte")
+    print("=" * 70)
+    baseline = None
+    for name, fn in cases:
+        result = measure(name, fn, payloads, args.repeat)
+        baseline = baseline or result['us_per_response']
+        print(f"{result['name']:<32} {result['us_per_response']:>9.1f} µs/risposta "
+              f"({baseline / result['us_per_response']:.2f}x)  "
+              f"{result['retained_kb']:>9.1f} KB trattenuti")
+
+
+if __name__ == '__main__':
+    main()
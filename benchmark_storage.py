@@ -0,0 +1,206 @@
+"""
+Benchmark dello storage al crescere dello storico
+Genera storici sintetici di dimensione crescente (con offerte realistiche) per
+ogni backend e misura tempo e memoria di picco di save_search,
+get_price_history, get_price_trend e get_all_routes. I risultati vengono
+scritti in JSON per confrontare backend e versioni nel tempo
+
+Uso: python benchmark_storage.py [--backends json sqlite segments]
+                                 [--sizes 1000 10000 100000 1000000]
+                                 [--output benchmark_storage.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from amadeus_client import parse_flight_offers
+from price_storage import create_storage
+from synthetic_offers import generate_offers
+
+
+ORIGINS = ['FCO', 'MXP', 'LIN', 'NAP', 'VCE', 'BLQ', 'CTA', 'PMO', 'BGY', 'TRN']
+DESTINATIONS = ['JFK', 'LHR', 'CDG', 'BCN', 'AMS', 'MAD', 'BER', 'ATH', 'LIS', 'DXB']
+
+DB_FILES = {
+    'json': 'price_history.json',
+    'sqlite': 'price_history.db',
+    'segments': 'price_history_log'
+}
+
+
+def make_routes(count: int) -> List[Tuple[str, str, str, str]]:
+    """Rotte distinte (origine, destinazione, partenza, ritorno)"""
+    routes = []
+    day = 0
+    while len(routes) < count:
+        for origin in ORIGINS:
+            for destination in DESTINATIONS:
+                departure = f"2030-{1 + day // 28:02d}-{1 + day % 28:02d}"
+                routes.append((origin, destination, departure, None))
+                if len(routes) == count:
+                    return routes
+        day += 1
+    return routes
+
+
+class HistoryGenerator:
+    """Ricerche sintetiche sulle rotte, con offerte parsificate una volta per rotta"""
+
+    def __init__(self, routes: List[Tuple], offers_per_search: int, seed: int = 0):
+        self.routes = routes
+        self.offers_per_search = offers_per_search
+        self.rng = random.Random(seed)
+        self._templates: Dict[Tuple, List[Dict]] = {}
+
+    def search(self, index: int) -> Dict:
+        """Ricerca numero `index`: stessa rotta ogni len(routes) ricerche, prezzi variabili"""
+        route = self.routes[index % len(self.routes)]
+        template = self._templates.get(route)
+        if template is None:
+            template = parse_flight_offers(generate_offers(*route, count=self.offers_per_search))
+            self._templates[route] = template
+
+        # Stessi voli a ogni interrogazione, cambia solo il prezzo
+        factor = self.rng.uniform(0.85, 1.15)
+        offers = [
+            dict(offer, price={
+                'total': round(offer['price']['total'] * factor, 2),
+                'currency': offer['price']['currency']
+            })
+            for offer in template
+        ]
+        origin, destination, departure_date, return_date = route
+        return {
+            'origin': origin,
+            'destination': destination,
+            'departure_date': departure_date,
+            'return_date': return_date,
+            'offers': offers
+        }
+
+
+def grow(storage, generator: HistoryGenerator, start: int, end: int, batch_size: int):
+    """Porta lo storico da `start` a `end` ricerche con scritture a blocchi"""
+    for batch_start in range(start, end, batch_size):
+        batch_end = min(end, batch_start + batch_size)
+        storage.save_searches(generator.search(i) for i in range(batch_start, batch_end))
+
+
+def measure(fn: Callable[[], object], calls: int) -> Dict:
+    """Tempo per chiamata (medio e minimo) e memoria di picco di una chiamata"""
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'calls': calls,
+        'mean_ms': sum(timings) / len(timings) * 1000,
+        'min_ms': min(timings) * 1000,
+        'peak_kb': peak / 1024
+    }
+
+
+def benchmark_backend(backend: str, sizes: List[int], workdir: str, routes: List[Tuple],
+                      offers_per_search: int, calls: int, batch_size: int) -> List[Dict]:
+    """Esegue le misure per un backend su tutte le dimensioni, facendo crescere lo stesso storico"""
+    results = []
+    storage = create_storage(backend, os.path.join(workdir, DB_FILES[backend]))
+    generator = HistoryGenerator(routes, offers_per_search)
+    rng = random.Random(1)
+    size = 0
+
+    try:
+        for target in sorted(sizes):
+            start = time.perf_counter()
+            grow(storage, generator, size, target, batch_size)
+            build_seconds = time.perf_counter() - start
+            size = target
+            print(f"\n📦 {backend} - {target} ricerche (generate in {build_seconds:.1f}s)")
+
+            sample_routes = [rng.choice(routes) for _ in range(calls)]
+            route_iter = iter(sample_routes * 4)
+            operations = {
+                'save_search': lambda: storage.save_search(**generator.search(size)),
+                'get_price_history': lambda: storage.get_price_history(*next(route_iter)),
+                'get_price_trend': lambda: storage.get_price_trend(*next(route_iter)),
+                'get_all_routes': storage.get_all_routes
+            }
+
+            for name, fn in operations.items():
+                result = measure(fn, calls)
+                if name == 'save_search':
+                    size += calls + 1
+                result.update({'backend': backend, 'size': target, 'operation': name})
+                results.append(result)
+                print(f"   {name:<18} {result['mean_ms']:>10.2f} ms  "
+                      f"(min {result['min_ms']:.2f})  picco {result['peak_kb']:>10.1f} KB")
+    finally:
+        if hasattr(storage, 'close'):
+            storage.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backends', nargs='+', choices=list(DB_FILES), default=list(DB_FILES))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--routes', type=int, default=500, help="Rotte distinte nello storico")
+    parser.add_argument('--offers', type=int, default=10, help="Offerte per ricerca")
+    parser.add_argument('--calls', type=int, default=5, help="Chiamate misurate per operazione")
+    parser.add_argument('--batch-size', type=int, default=20000, help="Ricerche per scrittura in generazione")
+    parser.add_argument('--output', default='benchmark_storage.json', help="File JSON dei risultati")
+    parser.add_argument('--workdir', help="Cartella per gli storici generati (default temporanea, rimossa)")
+    args = parser.parse_args()
+
+    routes = make_routes(args.routes)
+    results = []
+
+    for backend in args.backends:
+        workdir = args.workdir and os.path.join(args.workdir, backend)
+        if workdir:
+            os.makedirs(workdir, exist_ok=True)
+        else:
+            workdir = tempfile.mkdtemp(prefix=f'bench_{backend}_')
+        try:
+            results.extend(benchmark_backend(
+                backend, args.sizes, workdir, routes, args.offers, args.calls, args.batch_size
+            ))
+        finally:
+            if not args.workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'parameters': {
+            'sizes': sorted(args.sizes),
+            'routes': args.routes,
+            'offers_per_search': args.offers,
+            'calls': args.calls
+        },
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Risultati salvati in {args.output}")
+
+
+if __name__ == '__main__':
+    main()
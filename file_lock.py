@@ -0,0 +1,135 @@
+"""
+Lock tra processi e scritture atomiche per i file di storage
+Permettono a più worker (gunicorn, CLI, GUI) di scrivere lo stesso storico
+senza perdere record né esporre file scritti a metà
+"""
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, TextIO
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Lock esclusivo su file, valido tra processi diversi e tra thread"""
+
+    def __init__(self, path: str, timeout: float = 30, poll_interval: float = 0.01):
+        """
+        Args:
+            path: Path del file di lock (creato se non esiste)
+            timeout: Secondi di attesa massima (None per attendere all'infinito)
+            poll_interval: Secondi tra due tentativi di acquisizione
+        """
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._fd = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Acquisisce il lock
+
+        Args:
+            blocking: Se False ritorna subito invece di attendere
+
+        Returns:
+            bool: True se il lock è stato acquisito
+
+        Raises:
+            TimeoutError: Se il lock non si libera entro il timeout
+        """
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+
+        while True:
+            try:
+                self._lock_fd(fd)
+                self._fd = fd
+                return True
+            except OSError:
+                if not blocking:
+                    os.close(fd)
+                    return False
+                if deadline is not None and time.monotonic() >= deadline:
+                    os.close(fd)
+                    raise TimeoutError(f"Timeout in attesa del lock {self.path}")
+                time.sleep(self.poll_interval)
+
+    def release(self):
+        """Rilascia il lock"""
+        if self._fd is None:
+            return
+        try:
+            self._unlock_fd(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> 'FileLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    @staticmethod
+    def _lock_fd(fd: int):
+        """Tentativo non bloccante di lock esclusivo (solleva OSError se occupato)"""
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+
+    @staticmethod
+    def _unlock_fd(fd: int):
+        """Rilascia il lock sul descrittore"""
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def atomic_writer(path: str) -> Iterator[TextIO]:
+    """
+    Apre in scrittura un file temporaneo che sostituisce `path` con un rename
+    atomico alla chiusura; in caso di errore il file originale resta intatto
+    I lettori vedono sempre la versione precedente o quella nuova, mai una a metà
+
+    Args:
+        path: Path del file di destinazione
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path), suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_json(path: str, data: Dict, **dump_kwargs):
+    """
+    Scrive un file JSON in modo atomico (file temporaneo + rename)
+
+    Args:
+        path: Path del file di destinazione
+        data: Dati da serializzare
+        **dump_kwargs: Opzioni passate a json.dump
+    """
+    with atomic_writer(path) as f:
+        json.dump(data, f, **dump_kwargs)
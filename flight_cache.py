@@ -0,0 +1,180 @@
+"""
+Cache delle risposte di ricerca voli
+Evita di richiamare l'API Amadeus per la stessa rotta e data cercata da poco:
+livello in memoria con TTL ed eviction LRU, più un livello opzionale su disco
+(SQLite) che sopravvive ai riavvii ed è condiviso tra processi
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class FlightSearchCache:
+    """Cache TTL + LRU indicizzata sulla query normalizzata"""
+
+    def __init__(self, ttl: float = 300, max_entries: int = 256, disk_path: Optional[str] = None):
+        """
+        Args:
+            ttl: Secondi di validità di una risposta
+            max_entries: Numero massimo di risposte in memoria (le meno usate vengono scartate)
+            disk_path: Database SQLite per il livello su disco (None per disattivarlo)
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if disk_path:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS flight_cache (
+                        key TEXT PRIMARY KEY,
+                        expires_at REAL NOT NULL,
+                        payload TEXT NOT NULL
+                    )
+                    """
+                )
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_flight_cache_expiry ON flight_cache (expires_at)')
+                conn.commit()
+            finally:
+                conn.close()
+
+    @classmethod
+    def from_env(cls) -> Optional['FlightSearchCache']:
+        """
+        Crea la cache dalle variabili FLIGHT_CACHE_TTL, FLIGHT_CACHE_SIZE e FLIGHT_CACHE_DB
+
+        Returns:
+            FlightSearchCache: Cache configurata, o None se FLIGHT_CACHE_TTL è 0
+        """
+        ttl = float(os.getenv('FLIGHT_CACHE_TTL', '300'))
+        if ttl <= 0:
+            return None
+        return cls(
+            ttl=ttl,
+            max_entries=int(os.getenv('FLIGHT_CACHE_SIZE', '256')),
+            disk_path=os.getenv('FLIGHT_CACHE_DB') or None
+        )
+
+    @staticmethod
+    def make_key(origin: str, destination: str, departure_date: str,
+                 return_date: Optional[str], adults: int, max_results: int,
+                 currency: str) -> str:
+        """Chiave normalizzata di una ricerca (maiuscole, spazi rimossi, tipi uniformi)"""
+        return json.dumps([
+            origin.strip().upper(),
+            destination.strip().upper(),
+            departure_date.strip(),
+            return_date.strip() if return_date else None,
+            int(adults),
+            int(max_results),
+            currency.strip().upper()
+        ])
+
+    def get(self, key: str) -> Optional[Any]:
+        """Restituisce la risposta in cache o None se assente o scaduta"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        if self.disk_path:
+            value = self._disk_get(key, now)
+            if value is not None:
+                expires_at, value = value
+                with self._lock:
+                    self._store(key, expires_at, value)
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any):
+        """Salva una risposta in memoria e, se configurato, su disco"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, expires_at, value)
+        if self.disk_path:
+            self._disk_set(key, expires_at, value)
+
+    def clear(self):
+        """Svuota la cache (entrambi i livelli)"""
+        with self._lock:
+            self._entries.clear()
+        if self.disk_path:
+            conn = self._connect()
+            try:
+                conn.execute('DELETE FROM flight_cache')
+                conn.commit()
+            finally:
+                conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contatori di hit/miss e occupazione"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl
+            }
+
+    def _store(self, key: str, expires_at: float, value: Any):
+        """Inserisce in memoria scartando le voci meno usate oltre max_entries (lock già acquisito)"""
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Connessione al database della cache su disco"""
+        return sqlite3.connect(self.disk_path, timeout=10)
+
+    def _disk_get(self, key: str, now: float) -> Optional[tuple]:
+        """Legge una voce valida dal disco: (scadenza, valore) o None"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT expires_at, payload FROM flight_cache WHERE key = ? AND expires_at > ?',
+                (key, now)
+            ).fetchone()
+        finally:
+            conn.close()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def _disk_set(self, key: str, expires_at: float, value: Any):
+        """Scrive una voce su disco eliminando quelle scadute"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM flight_cache WHERE expires_at <= ?', (time.time(),))
+                conn.execute(
+                    'INSERT OR REPLACE INTO flight_cache (key, expires_at, payload) VALUES (?, ?, ?)',
+                    (key, expires_at, json.dumps(value, ensure_ascii=False))
+                )
+        finally:
+            conn.close()
@@ -0,0 +1,142 @@
+"""
+Rappresentazione compatta delle offerte voli
+Al posto dei dict annidati di parse_flight_offers ogni offerta è un oggetto
+con __slots__, e itinerari e tratte sono tuple semplici (sono la gran parte
+degli oggetti: una classe per tratta costerebbe più del dict che sostituisce).
+Codici IATA, vettori, valute e durate sono internati (una sola copia in memoria)
+e la conversione in dict avviene solo per le offerte da restituire o salvare
+
+Struttura:
+    itinerario = (duration, (tratta, ...))
+    tratta     = (departure_iata, departure_at, arrival_iata, arrival_at,
+                  carrier, flight_number, duration)
+"""
+import heapq
+import sys
+from typing import Dict, List, Optional, Tuple
+
+# Posizioni dei campi nelle tuple
+ITINERARY_DURATION, ITINERARY_SEGMENTS = range(2)
+(SEGMENT_DEPARTURE_IATA, SEGMENT_DEPARTURE_AT, SEGMENT_ARRIVAL_IATA, SEGMENT_ARRIVAL_AT,
+ SEGMENT_CARRIER, SEGMENT_FLIGHT_NUMBER, SEGMENT_DURATION) = range(7)
+
+
+class FlightOffer:
+    """Offerta volo con prezzo e itinerari in forma compatta"""
+
+    __slots__ = ('id', 'price_total', 'currency', 'itineraries')
+
+    def __init__(self, id: Optional[str], price_total: float, currency: str, itineraries: Tuple):
+        self.id = id
+        self.price_total = price_total
+        self.currency = currency
+        self.itineraries = itineraries
+
+    @property
+    def carriers(self) -> List[str]:
+        """Vettori delle tratte, senza ripetizioni e nell'ordine di volo"""
+        carriers = []
+        for _, segments in self.itineraries:
+            for segment in segments:
+                carrier = segment[SEGMENT_CARRIER]
+                if carrier and carrier not in carriers:
+                    carriers.append(carrier)
+        return carriers
+
+    @property
+    def stops(self) -> int:
+        """Scali dell'itinerario di andata"""
+        return len(self.itineraries[0][ITINERARY_SEGMENTS]) - 1 if self.itineraries else 0
+
+    def to_dict(self) -> Dict:
+        """Offerta nel formato di parse_flight_offers (per risposte JSON e storage)"""
+        return {
+            'id': self.id,
+            'price': {'total': self.price_total, 'currency': self.currency},
+            'itineraries': [
+                {
+                    'duration': duration,
+                    'segments': [
+                        {
+                            'departure': {'iataCode': dep_iata, 'at': dep_at},
+                            'arrival': {'iataCode': arr_iata, 'at': arr_at},
+                            'carrier': carrier,
+                            'flight_number': flight_number,
+                            'duration': segment_duration
+                        }
+                        for (dep_iata, dep_at, arr_iata, arr_at,
+                             carrier, flight_number, segment_duration) in segments
+                    ]
+                }
+                for duration, segments in self.itineraries
+            ]
+        }
+
+    def __repr__(self) -> str:
+        return f"FlightOffer(id={self.id!r}, price={self.price_total} {self.currency})"
+
+
+def parse_offers(offers_data: List[Dict]) -> List[FlightOffer]:
+    """
+    Parsifica le offerte raw in forma compatta
+
+    Args:
+        offers_data: Dati raw dall'API Amadeus
+
+    Returns:
+        List[FlightOffer]: Offerte compatte, convertibili con to_dict()
+    """
+    # Nomi locali: il ciclo interno gira una volta per tratta
+    intern = sys.intern
+    offer_class = FlightOffer
+    parsed = []
+
+    for offer in offers_data:
+        price = offer['price']
+        itineraries = []
+        for itinerary in offer.get('itineraries', ()):
+            segments = []
+            for segment in itinerary.get('segments', ()):
+                departure = segment['departure']
+                arrival = segment['arrival']
+                carrier = segment.get('carrierCode')
+                duration = segment.get('duration')
+                segments.append((
+                    intern(departure['iataCode']),
+                    departure['at'],
+                    intern(arrival['iataCode']),
+                    arrival['at'],
+                    intern(carrier) if carrier else carrier,
+                    segment.get('number'),
+                    intern(duration) if duration else duration
+                ))
+            duration = itinerary.get('duration')
+            itineraries.append((intern(duration) if duration else duration, tuple(segments)))
+
+        parsed.append(offer_class(
+            offer.get('id'),
+            float(price['total']),
+            intern(price['currency']),
+            tuple(itineraries)
+        ))
+    return parsed
+
+
+def raw_price(offer: Dict) -> float:
+    """Prezzo totale di un'offerta raw, senza parsificare il resto"""
+    return float(offer['price']['total'])
+
+
+def cheapest_offers(offers_data: List[Dict], k: int = 1) -> List[FlightOffer]:
+    """
+    Le k offerte più economiche, in ordine di prezzo: dalle offerte raw viene
+    letto solo il prezzo e solo le k scelte vengono parsificate
+
+    Args:
+        offers_data: Dati raw dall'API Amadeus
+        k: Numero di offerte da restituire
+
+    Returns:
+        List[FlightOffer]: Offerte compatte, dalla più economica
+    """
+    return parse_offers(heapq.nsmallest(k, offers_data, key=raw_price))
@@ -1,11 +1,23 @@
 """
 Flight Price Tracker - Script principale
 Traccia i prezzi dei voli e monitora le variazioni nel tempo
+
+Uso:
+    python flight_tracker.py                            # menu interattivo
+    python flight_tracker.py rotte.csv [--parallel 4] [--json] [--output riepilogo.json]
 """
+import argparse
+import csv
+import json
 import sys
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
 from amadeus_client import AmadeusFlightClient
-from price_storage import PriceStorage
+from price_alerts import attach_alerts
+from price_storage import create_storage
+from rate_limiter import AmadeusUnavailableError
 
 
 def format_price(price_info):
@@ -57,14 +69,19 @@ def search_flights(client, storage):
     
     print("\n⏳ Ricerca in corso...")
     
-    if return_date:
-        offers = client.search_round_trip(
-            origin, destination, departure_date, return_date, adults
-        )
-    else:
-        offers = client.search_flights(
-            origin, destination, departure_date, adults
-        )
+    try:
+        if return_date:
+            offers = client.search_round_trip(
+                origin, destination, departure_date, return_date, adults
+            )
+        else:
+            offers = client.search_flights(
+                origin, destination, departure_date, adults
+            )
+    except AmadeusUnavailableError as e:
+        print(f"⚠️ {e}")
+        print("   Riprova tra qualche minuto.")
+        return
     
     if not offers:
         print("❌ Nessun volo trovato.")
@@ -122,6 +139,9 @@ def view_price_history(storage):
     print(f"   💰 Prezzo più alto: {trend['highest_price']:.2f} {trend['currency']}")
     print(f"   💰 Prezzo medio: {trend['average_price']:.2f} {trend['currency']}")
     print(f"   💰 Prezzo attuale: {trend['current_price']:.2f} {trend['currency']}")
+    print(f"   📊 Mediana: {trend['percentiles']['p50']:.2f} {trend['currency']}")
+    print(f"   📊 Volatilità: {trend['volatility'] * 100:.1f}%")
+    print(f"   📊 Sopra il minimo storico: {trend['drawdown_from_low'] * 100:+.1f}%")
     
     if trend['price_change'] != 0:
         emoji = "📉" if trend['price_change'] < 0 else "📈"
@@ -150,6 +170,280 @@ def view_all_routes(storage):
         print(f"   Ultima ricerca: {format_datetime(route_info['last_search'])}")
 
 
+# Codici di uscita della modalità batch
+EXIT_OK = 0
+EXIT_ERROR = 1      # nessuna ricerca riuscita o errore imprevisto
+EXIT_USAGE = 2      # file rotte o configurazione non validi (come gli errori di argparse)
+EXIT_PARTIAL = 3    # alcune ricerche non riuscite
+
+
+def load_routes(path):
+    """
+    Legge il file delle rotte: CSV con intestazione oppure JSON
+    (lista di oggetti o {"routes": [...]})
+    
+    Colonne: origin, destination, departure_from (o departure_date),
+    departure_to, return_date, stay (notti), adults; solo le prime tre obbligatorie
+    
+    Returns:
+        list: Righe del file come dict
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.lower().endswith('.json'):
+            data = json.load(f)
+            rows = data['routes'] if isinstance(data, dict) else data
+        else:
+            rows = list(csv.DictReader(f))
+    
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise ValueError("il file deve contenere una lista di rotte")
+    return rows
+
+
+def expand_searches(rows):
+    """
+    Espande le righe del file rotte nelle singole ricerche (una per data di partenza)
+    
+    Returns:
+        list: Dict con origin, destination, departure_date, return_date, adults
+    
+    Raises:
+        ValueError: Se una riga non è valida (il messaggio indica quale)
+    """
+    def field(row, name):
+        value = row.get(name)
+        return str(value).strip() if value not in (None, '') else None
+    
+    def parse_date(value, line):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError(f"riga {line}: data non valida '{value}' (formato YYYY-MM-DD)")
+    
+    searches = []
+    for line, row in enumerate(rows, 1):
+        origin = (field(row, 'origin') or '').upper()
+        destination = (field(row, 'destination') or '').upper()
+        start = field(row, 'departure_from') or field(row, 'departure_date')
+        if not origin or not destination or not start:
+            raise ValueError(f"riga {line}: origin, destination e departure_from sono obbligatori")
+        
+        departure_from = parse_date(start, line)
+        departure_to = parse_date(field(row, 'departure_to') or start, line)
+        if departure_to < departure_from:
+            raise ValueError(f"riga {line}: departure_to precede departure_from")
+        return_date = field(row, 'return_date')
+        return_day = parse_date(return_date, line) if return_date else None
+        
+        try:
+            stay = int(field(row, 'stay')) if field(row, 'stay') else None
+            adults = int(field(row, 'adults') or 1)
+        except ValueError:
+            raise ValueError(f"riga {line}: stay e adults devono essere numeri interi")
+        
+        day = departure_from
+        while day <= departure_to:
+            if stay is not None:
+                return_day = day + timedelta(days=stay)
+            # Con un ritorno fisso le partenze successive vengono saltate
+            if return_day is None or return_day >= day:
+                searches.append({
+                    'origin': origin,
+                    'destination': destination,
+                    'departure_date': day.isoformat(),
+                    'return_date': return_day.isoformat() if return_day else None,
+                    'adults': adults
+                })
+            day += timedelta(days=1)
+    return searches
+
+
+def run_search(client, search, max_results):
+    """
+    Esegue una ricerca della modalità batch
+    
+    Returns:
+        tuple: (offerte, messaggio di errore o None)
+    """
+    try:
+        if search['return_date']:
+            offers = client.search_round_trip(
+                search['origin'], search['destination'], search['departure_date'],
+                search['return_date'], search['adults'], max_results
+            )
+        else:
+            offers = client.search_flights(
+                search['origin'], search['destination'], search['departure_date'],
+                search['adults'], max_results
+            )
+        return offers, None
+    except AmadeusUnavailableError as e:
+        return [], str(e)
+    except Exception as e:
+        return [], f"Errore imprevisto: {e}"
+
+
+def run_batch(client, storage, searches, parallel=4, batch_size=50, max_results=10):
+    """
+    Esegue le ricerche in parallelo e salva i risultati a blocchi
+    
+    Args:
+        client: AmadeusFlightClient
+        storage: Storage in cui salvare le ricerche con offerte
+        searches: Ricerche di expand_searches
+        parallel: Ricerche contemporanee
+        batch_size: Ricerche salvate per scrittura
+        max_results: Offerte richieste per ricerca
+    
+    Returns:
+        list: Esito di ogni ricerca, nell'ordine del file
+    """
+    results = [None] * len(searches)
+    pending = []
+    
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = {
+            executor.submit(run_search, client, search, max_results): index
+            for index, search in enumerate(searches)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            index = futures[future]
+            search = searches[index]
+            offers, error = future.result()
+            
+            result = dict(search, status='error' if error else ('ok' if offers else 'empty'),
+                          offers=len(offers), cheapest_price=None, currency=None,
+                          carriers=[], error=error)
+            if offers:
+                cheapest = min(offers, key=lambda x: x['price']['total'])
+                result['cheapest_price'] = cheapest['price']['total']
+                result['currency'] = cheapest['price']['currency']
+                result['carriers'] = sorted({
+                    segment['carrier'] for itinerary in cheapest['itineraries']
+                    for segment in itinerary['segments'] if segment['carrier']
+                })
+                pending.append({
+                    'origin': search['origin'],
+                    'destination': search['destination'],
+                    'departure_date': search['departure_date'],
+                    'return_date': search['return_date'],
+                    'offers': offers
+                })
+            results[index] = result
+            
+            print(f"   [{done}/{len(searches)}] {search['origin']} → {search['destination']} "
+                  f"{search['departure_date']}: {result['status']}", file=sys.stderr)
+            
+            if len(pending) >= batch_size:
+                storage.save_searches(pending)
+                pending = []
+    
+    if pending:
+        storage.save_searches(pending)
+    return results
+
+
+def format_results_table(results):
+    """Tabella di testo con l'esito delle ricerche batch"""
+    header = f"{'Rotta':<12}{'Partenza':<12}{'Ritorno':<12}{'Offerte':>8}  {'Prezzo minimo':>16}  Esito"
+    lines = [header, '-' * len(header)]
+    for result in results:
+        price = '-'
+        if result['cheapest_price'] is not None:
+            price = f"{result['cheapest_price']:.2f} {result['currency']}"
+        status = result['error'] if result['status'] == 'error' else result['status']
+        lines.append(
+            f"{result['origin'] + '-' + result['destination']:<12}{result['departure_date']:<12}"
+            f"{result['return_date'] or '-':<12}{result['offers']:>8}  {price:>16}  {status}"
+        )
+    return '\n'.join(lines)
+
+
+def _positive_int(value):
+    """Tipo argparse per gli interi maggiori di zero (errore = EXIT_USAGE)"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"non è un intero: {value}")
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"deve essere maggiore di zero: {value}")
+    return number
+
+
+def batch_main(argv):
+    """
+    Modalità non interattiva: esegue le ricerche di un file di rotte
+    
+    Returns:
+        int: Codice di uscita (EXIT_*)
+    """
+    parser = argparse.ArgumentParser(
+        prog='flight_tracker.py',
+        description="Ricerca batch delle rotte di un file CSV o JSON (senza argomenti: menu interattivo)"
+    )
+    parser.add_argument('routes_file', help="File CSV o JSON delle rotte")
+    parser.add_argument('--parallel', type=_positive_int, default=4, help="Ricerche contemporanee")
+    parser.add_argument('--batch-size', type=_positive_int, default=50, help="Ricerche salvate per scrittura")
+    parser.add_argument('--max-results', type=_positive_int, default=10, help="Offerte richieste per ricerca")
+    parser.add_argument('--json', action='store_true', help="Riepilogo in JSON invece che in tabella")
+    parser.add_argument('--output', help="File in cui scrivere il riepilogo (default: stdout)")
+    args = parser.parse_args(argv)
+    
+    try:
+        searches = expand_searches(load_routes(args.routes_file))
+    except (OSError, ValueError, KeyError, csv.Error) as e:
+        print(f"❌ File rotte non valido: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    if not searches:
+        print("❌ Nessuna ricerca nel file rotte", file=sys.stderr)
+        return EXIT_USAGE
+    
+    start = time.time()
+    # I messaggi di client e alert vanno su stderr: stdout resta al riepilogo
+    with redirect_stdout(sys.stderr):
+        try:
+            client = AmadeusFlightClient()
+        except ValueError as e:
+            print(f"❌ Errore di configurazione: {e}")
+            return EXIT_USAGE
+        storage = create_storage()
+        attach_alerts(storage)
+        
+        print(f"🔍 {len(searches)} ricerche, {args.parallel} in parallelo")
+        try:
+            results = run_batch(client, storage, searches, args.parallel,
+                                args.batch_size, args.max_results)
+        except Exception as e:
+            # Es. storage non scrivibile: codice di uscita invece del traceback
+            print(f"❌ Errore nel salvataggio delle ricerche: {type(e).__name__}: {e}")
+            return EXIT_ERROR
+        finally:
+            if hasattr(storage, 'close'):
+                storage.close()
+    
+    counts = {status: sum(1 for r in results if r['status'] == status) for status in ('ok', 'empty', 'error')}
+    summary = dict(searches=len(results), elapsed_seconds=round(time.time() - start, 2), **counts)
+    
+    if args.json:
+        output = json.dumps({'summary': summary, 'results': results}, indent=2, ensure_ascii=False)
+    else:
+        output = format_results_table(results) + (
+            f"\n\n{summary['searches']} ricerche in {summary['elapsed_seconds']:.1f}s: "
+            f"{counts['ok']} con offerte, {counts['empty']} senza offerte, {counts['error']} errori"
+        )
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        print(f"💾 Riepilogo salvato in {args.output}", file=sys.stderr)
+    else:
+        print(output)
+    
+    if counts['error'] == 0:
+        return EXIT_OK
+    return EXIT_ERROR if counts['error'] == len(results) else EXIT_PARTIAL
+
+
 def main_menu():
     """Menu principale dell'applicazione"""
     print("\n" + "="*50)
@@ -166,10 +460,15 @@ def main_menu():
 
 def main():
     """Funzione principale"""
+    # Con argomenti (file rotte) gira in modalità batch, senza input interattivo
+    if len(sys.argv) > 1:
+        sys.exit(batch_main(sys.argv[1:]))
+    
     try:
         # Inizializza client e storage
         client = AmadeusFlightClient()
-        storage = PriceStorage()
+        storage = create_storage()
+        attach_alerts(storage)
         
         print("\n✅ Client Amadeus inizializzato correttamente!")
         
@@ -7,7 +7,8 @@ from tkinter import ttk, messagebox, scrolledtext
 from datetime import datetime, timedelta
 import threading
 from amadeus_client import AmadeusFlightClient
-from price_storage import PriceStorage
+from price_alerts import attach_alerts
+from price_storage import create_storage
 
 
 class FlightTrackerGUI:
@@ -22,7 +23,8 @@ class FlightTrackerGUI:
         # Inizializza client e storage
         try:
             self.client = AmadeusFlightClient()
-            self.storage = PriceStorage()
+            self.storage = create_storage()
+            attach_alerts(self.storage)
             self.api_ready = True
         except ValueError as e:
             self.api_ready = False
@@ -385,7 +387,10 @@ class FlightTrackerGUI:
         result_text += f"  Prezzo più basso: {trend['lowest_price']:.2f} {trend['currency']}\n"
         result_text += f"  Prezzo più alto: {trend['highest_price']:.2f} {trend['currency']}\n"
         result_text += f"  Prezzo medio: {trend['average_price']:.2f} {trend['currency']}\n"
-        result_text += f"  Prezzo attuale: {trend['current_price']:.2f} {trend['currency']}\n\n"
+        result_text += f"  Prezzo attuale: {trend['current_price']:.2f} {trend['currency']}\n"
+        result_text += f"  Mediana: {trend['percentiles']['p50']:.2f} {trend['currency']}\n"
+        result_text += f"  Volatilità: {trend['volatility'] * 100:.1f}%\n"
+        result_text += f"  Sopra il minimo storico: {trend['drawdown_from_low'] * 100:+.1f}%\n\n"
         
         if trend['price_change'] != 0:
             emoji = "📉 SCESO" if trend['price_change'] < 0 else "📈 SALITO"
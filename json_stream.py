@@ -0,0 +1,105 @@
+"""
+Lettura incrementale di file JSON di grandi dimensioni
+Restituisce uno alla volta gli elementi di un array di primo livello,
+con memoria costante indipendentemente dalla dimensione del file
+"""
+import json
+import re
+from typing import Iterator, Any
+
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class _ChunkReader:
+    """Buffer di testo che si riempie a blocchi dal file"""
+
+    def __init__(self, f, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Legge un altro blocco scartando la parte già consumata; False a fine file"""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Primo carattere non di spaziatura (stringa vuota a fine file)"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char: str):
+        """Consuma il carattere atteso o solleva ValueError"""
+        if self.peek() != char:
+            raise ValueError(f"JSON non valido: atteso '{char}' alla posizione {self.pos}")
+        self.pos += 1
+
+    def decode(self) -> Any:
+        """Decodifica il prossimo valore JSON completo, leggendo altri blocchi se serve"""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # Un numero a fine buffer potrebbe continuare nel blocco successivo
+            if end == len(self.buffer) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(path: str, key: str, chunk_size: int = 64 * 1024) -> Iterator[Any]:
+    """
+    Itera sugli elementi dell'array `key` di un file JSON della forma {"key": [...]}
+
+    Args:
+        path: Path del file JSON
+        key: Chiave di primo livello che contiene l'array
+        chunk_size: Caratteri letti per blocco
+
+    Yields:
+        Gli elementi dell'array, uno alla volta
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = _ChunkReader(f, chunk_size)
+        reader.expect('{')
+
+        while reader.peek() != '}':
+            name = reader.decode()
+            reader.expect(':')
+
+            if name != key:
+                reader.decode()  # valore di un'altra chiave: letto e scartato
+            else:
+                reader.expect('[')
+                if reader.peek() == ']':
+                    reader.pos += 1
+                else:
+                    while True:
+                        yield reader.decode()
+                        if reader.peek() == ',':
+                            reader.pos += 1
+                            continue
+                        reader.expect(']')
+                        break
+
+            if reader.peek() == ',':
+                reader.pos += 1
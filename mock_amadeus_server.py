@@ -0,0 +1,218 @@
+"""
+Server mock dell'API Amadeus per test di carico senza rete e senza quota
+Espone gli endpoint del token OAuth e di flight-offers, con latenza e tassi
+di errore configurabili; le risposte vengono rilette da fixture registrate
+o generate in modo sintetico (deterministico per rotta e date)
+
+Uso:
+    python mock_amadeus_server.py --port 8080 --latency-ms 300 --throttle-rate 0.02
+
+Per usarlo dal tracker, nel file .env:
+    AMADEUS_HOST=localhost
+    AMADEUS_PORT=8080
+    AMADEUS_SSL=false
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from functools import lru_cache
+from typing import Dict, Optional
+
+from flask import Flask, jsonify, request
+
+from synthetic_offers import generate_offers
+
+TOKEN_PREFIX = 'mock-'
+
+
+class MockStats:
+    """Contatori delle richieste servite"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {
+            'token_requests': 0,
+            'searches': 0,
+            'fixture_responses': 0,
+            'synthetic_responses': 0,
+            'throttled': 0,
+            'server_errors': 0,
+            'unauthorized': 0
+        }
+
+    def incr(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return dict(self.counters)
+
+
+def _error(status: int, code: int, title: str, detail: str = ''):
+    """Risposta di errore nel formato dell'API Amadeus"""
+    body = {'errors': [{'status': status, 'code': code, 'title': title, 'detail': detail}]}
+    return jsonify(body), status
+
+
+def fixture_name(origin: str, destination: str, departure_date: str,
+                 return_date: Optional[str]) -> str:
+    """Nome del file fixture per una ricerca (es. FCO-JFK-2025-12-15-2025-12-22.json)"""
+    parts = [origin, destination, departure_date] + ([return_date] if return_date else [])
+    return '-'.join(parts) + '.json'
+
+
+def create_app(latency_ms: float = 0, jitter_ms: float = 0, throttle_rate: float = 0,
+               error_rate: float = 0, fixtures_dir: Optional[str] = None,
+               max_offers: int = 50, seed: Optional[int] = None) -> Flask:
+    """
+    Crea l'app Flask del server mock
+
+    Args:
+        latency_ms: Latenza media delle ricerche in millisecondi
+        jitter_ms: Variazione massima della latenza (+/-) in millisecondi
+        throttle_rate: Frazione di ricerche rifiutate con 429
+        error_rate: Frazione di ricerche che falliscono con 500
+        fixtures_dir: Cartella di risposte registrate (vedi fixture_name)
+        max_offers: Offerte massime per risposta sintetica
+        seed: Seme per latenza ed errori (None per casuale)
+    """
+    app = Flask(__name__)
+    stats = MockStats()
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    @lru_cache(maxsize=1024)
+    def synthetic(origin, destination, departure_date, return_date, count, currency):
+        return generate_offers(origin, destination, departure_date, return_date,
+                               count=count, currency=currency)
+
+    def load_fixture(name: str) -> Optional[list]:
+        if not fixtures_dir:
+            return None
+        path = os.path.join(fixtures_dir, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            body = json.load(f)
+        return body['data'] if isinstance(body, dict) else body
+
+    def roll() -> tuple:
+        """Estrae latenza ed esito della richiesta"""
+        with rng_lock:
+            delay = max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000
+            outcome = rng.random()
+        if outcome < throttle_rate:
+            return delay, 429
+        if outcome < throttle_rate + error_rate:
+            return delay, 500
+        return delay, 200
+
+    @app.route('/v1/security/oauth2/token', methods=['POST'])
+    def token():
+        stats.incr('token_requests')
+        if request.form.get('grant_type') != 'client_credentials' or not request.form.get('client_id'):
+            return _error(400, 38187, 'Invalid parameters', 'grant_type e client_id obbligatori')
+        return jsonify({
+            'type': 'amadeusOAuth2Token',
+            'username': 'mock@example.com',
+            'application_name': 'mock',
+            'client_id': request.form['client_id'],
+            'token_type': 'Bearer',
+            'access_token': TOKEN_PREFIX + uuid.uuid4().hex,
+            'expires_in': 1799,
+            'state': 'approved',
+            'scope': ''
+        })
+
+    @app.route('/v2/shopping/flight-offers', methods=['GET'])
+    def flight_offers():
+        # Sono validi tutti i token emessi dal mock, anche prima di un riavvio
+        if not request.headers.get('Authorization', '').startswith('Bearer ' + TOKEN_PREFIX):
+            stats.incr('unauthorized')
+            return _error(401, 38191, 'Invalid access token', 'The access token provided is invalid')
+
+        args = request.args
+        origin = args.get('originLocationCode')
+        destination = args.get('destinationLocationCode')
+        departure_date = args.get('departureDate')
+        if not origin or not destination or not departure_date:
+            return _error(400, 32171, 'MANDATORY DATA MISSING',
+                          'originLocationCode, destinationLocationCode e departureDate obbligatori')
+
+        delay, status = roll()
+        time.sleep(delay)
+        stats.incr('searches')
+
+        if status == 429:
+            stats.incr('throttled')
+            response, code = _error(429, 38194, 'Too many requests',
+                                    'The network rate limit is exceeded, please try again later')
+            response.headers['Retry-After'] = '1'
+            return response, code
+        if status == 500:
+            stats.incr('server_errors')
+            return _error(500, 141, 'SYSTEM ERROR HAS OCCURRED')
+
+        return_date = args.get('returnDate')
+        count = min(int(args.get('max', 250)), max_offers)
+        currency = args.get('currencyCode', 'EUR')
+
+        offers = load_fixture(fixture_name(origin, destination, departure_date, return_date))
+        if offers is not None:
+            stats.incr('fixture_responses')
+            offers = offers[:count]
+        else:
+            stats.incr('synthetic_responses')
+            offers = synthetic(origin, destination, departure_date, return_date, count, currency)
+
+        return jsonify({'meta': {'count': len(offers)}, 'data': offers, 'dictionaries': {}})
+
+    @app.route('/mock/stats', methods=['GET'])
+    def mock_stats():
+        return jsonify(stats.snapshot())
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server mock dell'API Amadeus")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency-ms', type=float, default=0, help="Latenza media delle ricerche")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="Variazione della latenza (+/-)")
+    parser.add_argument('--throttle-rate', type=float, default=0, help="Frazione di risposte 429")
+    parser.add_argument('--error-rate', type=float, default=0, help="Frazione di risposte 500")
+    parser.add_argument('--fixtures', help="Cartella con risposte registrate")
+    parser.add_argument('--max-offers', type=int, default=50, help="Offerte per risposta sintetica")
+    parser.add_argument('--seed', type=int, help="Seme per latenza ed errori")
+    args = parser.parse_args()
+
+    app = create_app(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        throttle_rate=args.throttle_rate,
+        error_rate=args.error_rate,
+        fixtures_dir=args.fixtures,
+        max_offers=args.max_offers,
+        seed=args.seed
+    )
+
+    print("\n" + "=" * 50)
+    print("🧪 MOCK AMADEUS API")
+    print("=" * 50)
+    print(f"Latenza: {args.latency_ms:.0f} ± {args.jitter_ms:.0f} ms | "
+          f"429: {args.throttle_rate:.1%} | 500: {args.error_rate:.1%}")
+    print(f"Fixture: {args.fixtures or 'nessuna (risposte sintetiche)'}")
+    print(f"\n🌐 In ascolto su: http://{args.host}:{args.port}")
+    print(f"   Contatori: http://{args.host}:{args.port}/mock/stats\n")
+
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
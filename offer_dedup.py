@@ -0,0 +1,139 @@
+"""
+Deduplicazione per contenuto di itinerari e segmenti delle offerte
+Interrogando più volte la stessa rotta si ottengono sempre gli stessi voli:
+segmenti e itinerari vengono salvati una sola volta, identificati dall'hash
+del contenuto, e ogni offerta tiene solo i riferimenti più il prezzo
+
+Uso: python offer_dedup.py [price_history.json]
+"""
+import hashlib
+import json
+import sys
+from typing import Any, Callable, Dict
+
+
+def content_hash(value: Any) -> str:
+    """Hash stabile del contenuto JSON di un valore"""
+    canonical = json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=10).hexdigest()
+
+
+def intern_offer(offer: Dict, known: Dict[str, Any], new_entries: Dict[str, Any]) -> Dict:
+    """
+    Sostituisce itinerari e segmenti di un'offerta con i loro hash
+
+    Args:
+        offer: Offerta nel formato di _parse_flight_offers
+        known: Contenuti già salvati, per hash
+        new_entries: Riceve i contenuti non ancora salvati da aggiungere alla tabella
+
+    Returns:
+        Dict: Offerta compatta con 'itineraries' come lista di hash
+    """
+    itinerary_refs = []
+    for itinerary in offer.get('itineraries', []):
+        segment_refs = [_intern(segment, known, new_entries) for segment in itinerary.get('segments', [])]
+        compact_itinerary = dict(itinerary, segments=segment_refs)
+        itinerary_refs.append(_intern(compact_itinerary, known, new_entries))
+    return dict(offer, itineraries=itinerary_refs)
+
+
+def expand_offer(offer: Dict, lookup: Callable[[str], Any]) -> Dict:
+    """
+    Ricostruisce un'offerta completa dai riferimenti (le offerte non compatte restano invariate)
+
+    Args:
+        offer: Offerta compatta o completa
+        lookup: Funzione hash -> contenuto
+    """
+    itineraries = offer.get('itineraries', [])
+    if not itineraries or not isinstance(itineraries[0], str):
+        return offer
+
+    expanded = []
+    for itinerary_ref in itineraries:
+        itinerary = lookup(itinerary_ref)
+        expanded.append(dict(itinerary, segments=[lookup(ref) for ref in itinerary.get('segments', [])]))
+    return dict(offer, itineraries=expanded)
+
+
+def referenced_hashes(offer: Dict, lookup: Callable[[str], Any]) -> set:
+    """Hash di itinerari e segmenti usati da un'offerta compatta"""
+    hashes = set()
+    for itinerary_ref in offer.get('itineraries', []):
+        if not isinstance(itinerary_ref, str):
+            continue
+        hashes.add(itinerary_ref)
+        hashes.update(lookup(itinerary_ref).get('segments', []))
+    return hashes
+
+
+def _intern(value: Any, known: Dict[str, Any], new_entries: Dict[str, Any]) -> str:
+    """Restituisce l'hash del valore, registrandolo tra i nuovi se non è già noto"""
+    ref = content_hash(value)
+    if ref not in known and ref not in new_entries:
+        new_entries[ref] = value
+    return ref
+
+
+def dedup_report(json_file: str) -> Dict:
+    """
+    Stima la riduzione di spazio della deduplicazione su uno storico esistente
+
+    Args:
+        json_file: Path del file price_history.json
+
+    Returns:
+        Dict: Dimensioni prima/dopo e numero di contenuti unici
+    """
+    from price_storage import PriceStorage
+
+    storage = PriceStorage(json_file)
+    table = {}
+    searches = offers_count = raw_bytes = compact_bytes = 0
+    segments = itineraries = 0
+
+    for search in storage._iter_searches():
+        searches += 1
+        for offer in storage.get_offers(search):
+            offers_count += 1
+            # Le offerte già compattate vengono riportate alla forma completa
+            offer = expand_offer(offer, storage.offer_store.lookup)
+            itineraries += len(offer.get('itineraries', []))
+            segments += sum(len(i.get('segments', [])) for i in offer.get('itineraries', []))
+            raw_bytes += len(json.dumps(offer, ensure_ascii=False).encode('utf-8'))
+
+            new_entries = {}
+            compact = intern_offer(offer, table, new_entries)
+            table.update(new_entries)
+            compact_bytes += len(json.dumps(compact, ensure_ascii=False).encode('utf-8'))
+
+    table_bytes = sum(
+        len(json.dumps({'h': ref, 'v': value}, ensure_ascii=False).encode('utf-8')) + 1
+        for ref, value in table.items()
+    )
+    deduped_bytes = compact_bytes + table_bytes
+
+    return {
+        'searches': searches,
+        'offers': offers_count,
+        'itineraries': itineraries,
+        'segments': segments,
+        'unique_entries': len(table),
+        'raw_bytes': raw_bytes,
+        'deduped_bytes': deduped_bytes,
+        'reduction': 1 - deduped_bytes / raw_bytes if raw_bytes else 0.0
+    }
+
+
+if __name__ == '__main__':
+    report = dedup_report(sys.argv[1] if len(sys.argv) > 1 else 'price_history.json')
+
+    print("\n📦 DEDUPLICAZIONE OFFERTE")
+    print("=" * 50)
+    print(f"Ricerche: {report['searches']} | Offerte: {report['offers']}")
+    print(f"Itinerari: {report['itineraries']} | Segmenti: {report['segments']}")
+    print(f"Contenuti unici: {report['unique_entries']}")
+    print(f"Dimensione offerte: {report['raw_bytes'] / 1024:.1f} KB → "
+          f"{report['deduped_bytes'] / 1024:.1f} KB")
+    print(f"Riduzione: {report['reduction'] * 100:.1f}%")
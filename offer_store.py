@@ -0,0 +1,228 @@
+"""
+Archivio dei payload delle offerte (dati freddi)
+I record di ricerca tengono solo il riepilogo e un riferimento alla riga
+che contiene le offerte, caricate solo quando servono.
+Itinerari e segmenti sono salvati una volta sola in una tabella indirizzata
+per contenuto (vedi offer_dedup)
+"""
+import itertools
+import json
+import os
+import re
+import threading
+from typing import Any, List, Dict, Iterable, Optional, Tuple
+
+from offer_dedup import intern_offer, expand_offer, referenced_hashes
+
+
+class OfferStore:
+    """File JSONL append-only con le offerte di ogni ricerca"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Path del file JSONL delle offerte
+        """
+        self.base_path = path
+        self.interned_path = os.path.splitext(path)[0] + '.interned.jsonl'
+        self._lock = threading.Lock()
+        self._interned: Dict[str, Any] = {}
+        self._interned_offset = 0
+        # Identità (device, inode) del file della tabella letto finora
+        self._interned_file_id: Optional[Tuple[int, int]] = None
+        self._pending: Optional[Tuple[int, str]] = None
+
+        # Ogni compattazione scrive una nuova generazione del file: si riparte dall'ultima
+        stem, ext = os.path.splitext(path)
+        pattern = re.compile(re.escape(os.path.basename(stem)) + r'\.(\d+)' + re.escape(ext) + '$')
+        directory = os.path.dirname(path) or '.'
+        generations = [
+            int(match.group(1))
+            for match in map(pattern.match, os.listdir(directory) if os.path.isdir(directory) else [])
+            if match
+        ]
+        self.generation = max(generations, default=0)
+
+    @property
+    def path(self) -> str:
+        """File in cui vengono aggiunte le nuove offerte"""
+        return self.generation_path(self.generation)
+
+    def generation_path(self, generation: int) -> str:
+        """Path del file di una generazione (la 0 è il path originale)"""
+        if generation == 0:
+            return self.base_path
+        stem, ext = os.path.splitext(self.base_path)
+        return f"{stem}.{generation}{ext}"
+
+    @staticmethod
+    def record_ref(record: Dict) -> Optional[Tuple[int, int]]:
+        """Riferimento (generazione, offset) alle offerte di un record, None se non ne ha"""
+        if record.get('offers_ref') is None:
+            return None
+        return record.get('offers_gen', 0), record['offers_ref']
+
+    @staticmethod
+    def set_record_ref(record: Dict, ref: Optional[Tuple[int, int]]):
+        """Salva nel record il riferimento restituito da append o compact"""
+        record.pop('offers_gen', None)
+        if ref is None:
+            record['offers_ref'] = None
+            return
+        generation, record['offers_ref'] = ref
+        if generation:
+            record['offers_gen'] = generation
+
+    def append(self, search_id: str, offers: List[Dict]) -> Tuple[int, int]:
+        """
+        Aggiunge le offerte di una ricerca in coda al file
+
+        Returns:
+            Tuple[int, int]: Generazione del file e offset della riga, da salvare
+                nel record con set_record_ref
+        """
+        with self._lock:
+            self._refresh_interned()
+
+            new_entries = {}
+            compact = [intern_offer(offer, self._interned, new_entries) for offer in offers]
+
+            # La tabella viene scritta prima delle offerte che la referenziano
+            if new_entries:
+                with open(self.interned_path, 'a+b') as f:
+                    # Dopo un crash l'ultima riga può essere incompleta: la chiude
+                    if f.tell() > 0:
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b'\n':
+                            f.write(b'\n')
+                    for ref, value in new_entries.items():
+                        f.write((json.dumps({'h': ref, 'v': value}, ensure_ascii=False) + '\n').encode('utf-8'))
+                self._interned.update(new_entries)
+
+            line = json.dumps({'id': search_id, 'offers': compact}, ensure_ascii=False) + '\n'
+            with open(self.path, 'ab') as f:
+                offset = f.tell()
+                f.write(line.encode('utf-8'))
+        return self.generation, offset
+
+    def load(self, ref: Tuple[int, int]) -> List[Dict]:
+        """Carica le offerte salvate al riferimento (generazione, offset) indicato"""
+        generation, offset = ref
+        with open(self.generation_path(generation), 'rb') as f:
+            f.seek(offset)
+            offers = json.loads(f.readline())['offers']
+        return [expand_offer(offer, self.lookup) for offer in offers]
+
+    def load_many(self, refs: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], List[Dict]]:
+        """Carica più righe aprendo una volta ogni file, leggendo in ordine di offset"""
+        offers_by_ref = {}
+        for generation, offsets in itertools.groupby(sorted(set(refs)), key=lambda ref: ref[0]):
+            with open(self.generation_path(generation), 'rb') as f:
+                for _, offset in offsets:
+                    f.seek(offset)
+                    offers = json.loads(f.readline())['offers']
+                    offers_by_ref[generation, offset] = [expand_offer(offer, self.lookup) for offer in offers]
+        return offers_by_ref
+
+    def lookup(self, ref: str) -> Any:
+        """Contenuto di un itinerario o segmento dato il suo hash"""
+        if ref not in self._interned:
+            # Può essere stato aggiunto da un altro processo: rilegge la coda della tabella
+            with self._lock:
+                self._refresh_interned()
+        return self._interned[ref]
+
+    def compact(self, refs: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], Tuple[int, int]]:
+        """
+        Scrive una nuova generazione del file con le sole righe ancora
+        referenziate, e la tabella dei contenuti con i soli contenuti usati.
+        I file in uso non vengono toccati: dopo aver salvato i record con i
+        nuovi riferimenti va chiamato commit_compaction, così un lettore (o un
+        crash a metà) non abbina mai un riferimento al file sbagliato
+
+        Args:
+            refs: Riferimenti (generazione, offset) delle righe da conservare
+
+        Returns:
+            Dict: Mappa vecchio riferimento -> nuovo riferimento
+        """
+        mapping = {}
+        used = set()
+        generation = self.generation + 1
+        new_path = self.generation_path(generation)
+
+        with self._lock:
+            self._refresh_interned()
+
+            with open(new_path, 'wb') as dst:
+                for old_generation, offsets in itertools.groupby(sorted(set(refs)), key=lambda ref: ref[0]):
+                    with open(self.generation_path(old_generation), 'rb') as src:
+                        for _, offset in offsets:
+                            src.seek(offset)
+                            line = src.readline()
+                            for offer in json.loads(line)['offers']:
+                                used.update(referenced_hashes(offer, self._interned.__getitem__))
+                            mapping[old_generation, offset] = (generation, dst.tell())
+                            dst.write(line)
+                dst.flush()
+                os.fsync(dst.fileno())
+
+            interned_tmp = self.interned_path + '.compact'
+            with open(interned_tmp, 'wb') as dst:
+                for ref in used:
+                    dst.write((json.dumps({'h': ref, 'v': self._interned[ref]}, ensure_ascii=False) + '\n').encode('utf-8'))
+                dst.flush()
+                os.fsync(dst.fileno())
+
+            self._pending = (generation, interned_tmp)
+        return mapping
+
+    def commit_compaction(self):
+        """
+        Passa alla generazione scritta da compact, da chiamare dopo aver salvato
+        i record con i nuovi riferimenti: sostituisce la tabella dei contenuti
+        ed elimina i file delle generazioni precedenti
+        """
+        with self._lock:
+            if self._pending is None:
+                return
+            generation, interned_tmp = self._pending
+            self._pending = None
+
+            os.replace(interned_tmp, self.interned_path)
+            for old_generation in range(generation):
+                try:
+                    os.remove(self.generation_path(old_generation))
+                except FileNotFoundError:
+                    pass
+            self.generation = generation
+            self._interned, self._interned_offset = {}, 0
+            self._refresh_interned()
+
+    def _refresh_interned(self):
+        """Legge le voci della tabella aggiunte dopo l'ultima lettura"""
+        try:
+            f = open(self.interned_path, 'rb')
+        except FileNotFoundError:
+            return
+
+        with f:
+            # Una compattazione (anche di un altro processo) sostituisce il file con
+            # os.replace: l'inode cambia anche se la nuova tabella è più grande
+            stat = os.fstat(f.fileno())
+            file_id = (stat.st_dev, stat.st_ino)
+            if file_id != self._interned_file_id or stat.st_size < self._interned_offset:
+                self._interned, self._interned_offset = {}, 0
+                self._interned_file_id = file_id
+
+            f.seek(self._interned_offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                self._interned_offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Riga troncata da un crash: le voci perse verranno riscritte
+                    continue
+                self._interned[entry['h']] = entry['v']
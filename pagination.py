@@ -0,0 +1,165 @@
+"""
+Paginazione a cursore e proiezione dei campi per le risposte delle API
+Il cursore è opaco per il client (JSON in base64 url-safe) e contiene la
+chiave di ordinamento dell'ultimo elemento restituito: la pagina successiva
+riparte da lì anche se nel frattempo sono stati aggiunti elementi, senza
+duplicati né salti come con un offset
+"""
+import base64
+import binascii
+import heapq
+import json
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+def encode_cursor(state: Dict) -> str:
+    """Codifica lo stato di paginazione in un cursore opaco"""
+    raw = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Dict:
+    """
+    Decodifica un cursore di encode_cursor
+
+    Raises:
+        ValueError: Se il cursore non è valido
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        state = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Cursore non valido")
+    if not isinstance(state, dict):
+        raise ValueError("Cursore non valido")
+    return state
+
+
+def parse_limit(value: Any, default: Optional[int] = DEFAULT_LIMIT) -> Optional[int]:
+    """
+    Dimensione della pagina richiesta, limitata a MAX_LIMIT
+
+    Raises:
+        ValueError: Se non è un intero positivo
+    """
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"limit non valido: {value}")
+    if limit <= 0:
+        raise ValueError("limit deve essere positivo")
+    return min(limit, MAX_LIMIT)
+
+
+def parse_fields(value: Any) -> Optional[List[str]]:
+    """Campi richiesti da "a,b.c" (o lista); None per tutti i campi"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    fields = [str(field).strip() for field in value if str(field).strip()]
+    return fields or None
+
+
+def project(item: Any, fields: Optional[List[str]]) -> Any:
+    """
+    Copia di item con i soli campi richiesti; i percorsi con il punto scendono
+    nei dict annidati e si applicano a ogni elemento delle liste
+    (es. "itineraries.duration")
+
+    Args:
+        item: Dict da proiettare
+        fields: Percorsi dei campi (None per restituire item invariato)
+    """
+    if not fields:
+        return item
+    result = {}
+    for path in fields:
+        _copy_path(item, result, path.split('.'))
+    return result
+
+
+def _copy_path(source: Any, target: Dict, parts: List[str]):
+    name, rest = parts[0], parts[1:]
+    if not isinstance(source, dict) or name not in source:
+        return
+    value = source[name]
+    if not rest:
+        target[name] = value
+    elif isinstance(value, list):
+        projected = target.setdefault(name, [{} for _ in value])
+        for element, element_target in zip(value, projected):
+            _copy_path(element, element_target, rest)
+    elif isinstance(value, dict):
+        _copy_path(value, target.setdefault(name, {}), rest)
+
+
+def paginate(items: Iterable[Dict], sort_keys: Dict[str, Callable[[Dict], Any]], sort: str,
+             order: str, cursor: Optional[str], limit: int,
+             tiebreak: Callable[[Dict], str]) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Una pagina di elementi ordinati, dal cursore in poi
+    Seleziona solo limit + 1 elementi con un heap invece di ordinare tutto
+
+    Args:
+        items: Elementi da paginare
+        sort_keys: Campi di ordinamento ammessi e funzione che ne estrae il valore
+        sort: Campo di ordinamento
+        order: 'asc' o 'desc' (i valori mancanti vanno sempre in fondo)
+        cursor: Cursore della pagina precedente (None per la prima)
+        limit: Elementi per pagina
+        tiebreak: Chiave univoca per ordinare gli elementi con lo stesso valore
+
+    Returns:
+        Tuple[List[Dict], Optional[str]]: Elementi della pagina e cursore della
+            successiva (None se è l'ultima)
+
+    Raises:
+        ValueError: Se ordinamento o cursore non sono validi
+    """
+    if sort not in sort_keys:
+        raise ValueError(f"Ordinamento non supportato: {sort} (ammessi: {', '.join(sort_keys)})")
+    if order not in ('asc', 'desc'):
+        raise ValueError("order deve essere 'asc' o 'desc'")
+
+    after = None
+    if cursor:
+        state = decode_cursor(cursor)
+        if state.get('sort') != sort or state.get('order') != order:
+            raise ValueError("Il cursore appartiene a un altro ordinamento")
+        after = state.get('after')
+        if not isinstance(after, list) or len(after) != 3:
+            raise ValueError("Cursore non valido")
+        after = tuple(after)
+
+    ascending = order == 'asc'
+    value_of = sort_keys[sort]
+
+    def key(item):
+        value = value_of(item)
+        if value is None:
+            # Il flag iniziale manda in fondo i valori mancanti in entrambi i versi
+            return (ascending, 0, tiebreak(item))
+        return (not ascending, value, tiebreak(item))
+
+    keyed = ((key(item), item) for item in items)
+    if after is not None:
+        keyed = ((k, item) for k, item in keyed if (k > after if ascending else k < after))
+
+    select = heapq.nsmallest if ascending else heapq.nlargest
+    try:
+        page = select(limit + 1, keyed, key=lambda pair: pair[0])
+    except TypeError:
+        # Valori del cursore non confrontabili con le chiavi (cursore manomesso)
+        raise ValueError("Cursore non valido")
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor({'sort': sort, 'order': order, 'after': list(page[-1][0])})
+    return [item for _, item in page], next_cursor
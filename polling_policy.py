@@ -0,0 +1,134 @@
+"""
+Intervalli di polling adattivi per rotta
+Le rotte con prezzi stabili vengono interrogate più di rado, quelle con prezzi
+che oscillano e quelle con la partenza vicina più spesso, sempre entro i
+limiti configurati: stessa qualità dei trend con meno chiamate all'API.
+Gli ultimi prezzi di ogni rotta restano in memoria e vengono aggiornati a ogni
+salvataggio (listener dello storage): lo storico si rilegge solo la prima volta
+o quando altri processi hanno salvato ricerche sulla rotta
+"""
+import threading
+from collections import deque
+from datetime import date, datetime
+from typing import Dict, Optional
+
+import numpy as np
+
+from route_index import RouteSummaryIndex
+
+
+class AdaptivePollingPolicy:
+    """Calcola l'intervallo di polling di una rotta dal suo storico prezzi"""
+
+    def __init__(self, base_interval: float = 3600, min_interval: float = 900,
+                 max_interval: float = 24 * 3600, reference_volatility: float = 0.02,
+                 departure_horizon_days: int = 60, window: int = 20, min_samples: int = 3):
+        """
+        Args:
+            base_interval: Intervallo per una rotta con volatilità pari a quella di
+                riferimento e partenza oltre l'orizzonte (è anche l'intervallo del
+                polling fisso con cui confrontare le chiamate risparmiate)
+            min_interval: Intervallo minimo in secondi
+            max_interval: Intervallo massimo in secondi
+            reference_volatility: Variazione percentuale tipica tra due ricerche
+                (deviazione standard) che corrisponde a base_interval
+            departure_horizon_days: Sotto questi giorni alla partenza l'intervallo
+                si riduce in proporzione
+            window: Ultime ricerche usate per stimare la volatilità
+            min_samples: Ricerche minime per adattare l'intervallo (altrimenti base_interval)
+        """
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.reference_volatility = reference_volatility
+        self.departure_horizon_days = departure_horizon_days
+        self.window = window
+        self.min_samples = min_samples
+
+        self._lock = threading.Lock()
+        # Per rotta: ultimi prezzi e ricerche già comprese (searches_count del riepilogo)
+        self._recent: Dict[str, deque] = {}
+        self._seen: Dict[str, int] = {}
+
+    def observe(self, search_record: Dict, searches_count: Optional[int] = None):
+        """
+        Aggiunge agli ultimi prezzi della rotta una ricerca appena salvata (listener dello storage)
+
+        Args:
+            search_record: Record di ricerca salvato
+            searches_count: Ricerche della rotta nello storage fino al record compreso
+        """
+        key = RouteSummaryIndex.route_key(search_record['route'])
+        with self._lock:
+            if key not in self._recent:
+                return
+            self._seen[key] += search_record.get('samples', 1)
+            if searches_count is not None and searches_count > self._seen[key]:
+                # Ricerche salvate da altri processi: gli ultimi prezzi verranno riletti
+                del self._recent[key], self._seen[key]
+                return
+            if search_record.get('cheapest_price') is not None:
+                self._recent[key].append(float(search_record['cheapest_price']))
+
+    def sync(self, route: Dict, searches_count: int):
+        """
+        Confronta gli ultimi prezzi in memoria con il riepilogo della rotta: se lo
+        storage ha ricerche non viste (salvate da altri processi) verranno riletti
+        """
+        key = RouteSummaryIndex.route_key(route)
+        with self._lock:
+            if key in self._seen and searches_count > self._seen[key]:
+                del self._recent[key], self._seen[key]
+
+    def forget(self, route: Dict):
+        """Scarta gli ultimi prezzi di una rotta non più monitorata"""
+        key = RouteSummaryIndex.route_key(route)
+        with self._lock:
+            self._recent.pop(key, None)
+            self._seen.pop(key, None)
+
+    def interval_for(self, route: Dict, storage) -> float:
+        """
+        Intervallo in secondi fino alla prossima ricerca della rotta
+
+        Args:
+            route: Rotta (origin, destination, departure_date, return_date)
+            storage: Storage da cui leggere lo storico della rotta la prima volta
+        """
+        prices = self._recent_prices(route, storage)
+
+        if len(prices) < self.min_samples:
+            interval = self.base_interval
+        else:
+            # Deviazione standard delle variazioni percentuali, come PriceSeries.volatility
+            volatility = float(np.std(np.diff(prices) / prices[:-1]))
+            if volatility > 0:
+                interval = self.base_interval * self.reference_volatility / volatility
+            else:
+                interval = self.max_interval
+
+        # Più la partenza è vicina, più spesso si interroga
+        departure = datetime.strptime(route['departure_date'], '%Y-%m-%d').date()
+        days = max(1, (departure - date.today()).days)
+        interval *= min(1.0, days / self.departure_horizon_days)
+
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def _recent_prices(self, route: Dict, storage) -> np.ndarray:
+        """Ultimi `window` prezzi della rotta, letti dallo storico solo se non in memoria"""
+        key = RouteSummaryIndex.route_key(route)
+        with self._lock:
+            if key in self._recent:
+                return np.array(self._recent[key])
+
+        # Il riepilogo prima della serie: una ricerca salvata in mezzo risulta non vista
+        summary = storage.get_route_summary(route) if hasattr(storage, 'get_route_summary') else None
+        series = storage.get_price_series(
+            route['origin'], route['destination'],
+            route['departure_date'], route.get('return_date')
+        )
+        recent = deque((float(price) for price in series.tail(self.window).cheapest), maxlen=self.window)
+        with self._lock:
+            self._recent[key] = recent
+            self._seen[key] = summary['searches_count'] if summary else len(series)
+            return np.array(recent)
@@ -0,0 +1,386 @@
+"""
+Alert sui cali di prezzo
+Gli utenti registrano regole per rotta (soglia assoluta, calo percentuale dal
+minimo delle ultime ricerche, nuovo minimo storico) che vengono valutate a ogni
+ricerca salvata, come listener dello storage. Per ogni rotta con regole viene
+tenuto in memoria uno stato incrementale (minimo storico, minimo mobile, ultimo
+prezzo): il costo di un salvataggio è proporzionale alle regole della rotta,
+senza rileggere lo storico. Lo stato viene ricaricato solo quando il numero di
+ricerche della rotta passato dallo storage mostra ricerche salvate da altri
+processi. Gli alert scattati vanno ai sink configurati (log, webhook, coda su file)
+"""
+import json
+import os
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import requests
+
+from file_lock import FileLock, atomic_write_json
+from route_index import RouteSummaryIndex
+
+RULE_TYPES = ('threshold', 'drop', 'all_time_low')
+
+
+class RouteState:
+    """Stato dei prezzi di una rotta aggiornato a ogni ricerca"""
+
+    __slots__ = ('window', 'all_time_low', 'last_price', 'searches_seen', '_count', '_mins')
+
+    def __init__(self, window: int):
+        """
+        Args:
+            window: Ricerche su cui calcolare il minimo mobile
+        """
+        self.window = window
+        self.all_time_low: Optional[float] = None
+        self.last_price: Optional[float] = None
+        # Ricerche della rotta già comprese nello stato (searches_count dello storage)
+        self.searches_seen = 0
+        self._count = 0
+        # Coda monotona (posizione, prezzo): il minimo mobile è sempre in testa
+        self._mins = deque()
+
+    @property
+    def rolling_min(self) -> Optional[float]:
+        """Prezzo minimo delle ultime `window` ricerche"""
+        return self._mins[0][1] if self._mins else None
+
+    def push(self, price: float):
+        """Aggiunge il prezzo di una ricerca (O(1) ammortizzato)"""
+        mins = self._mins
+        while mins and mins[-1][1] >= price:
+            mins.pop()
+        mins.append((self._count, price))
+        self._count += 1
+        while mins[0][0] <= self._count - 1 - self.window:
+            mins.popleft()
+
+        if self.all_time_low is None or price < self.all_time_low:
+            self.all_time_low = price
+        self.last_price = price
+        self.searches_seen += 1
+
+
+class LogSink:
+    """Stampa gli alert sulla console"""
+
+    def send(self, alert: Dict):
+        print(f"🔔 {alert['message']}")
+
+
+class WebhookSink:
+    """Invia gli alert in POST (JSON) a un URL, in background per non rallentare i salvataggi"""
+
+    def __init__(self, url: str, timeout: float = 5):
+        self.url = url
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='alert-webhook')
+
+    def send(self, alert: Dict):
+        self._executor.submit(self._post, alert)
+
+    def _post(self, alert: Dict):
+        try:
+            response = requests.post(self.url, json=alert, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"⚠️ Webhook alert non consegnato ({self.url}): {e}")
+
+
+class FileQueueSink:
+    """Accoda gli alert in un file JSONL, letto e svuotato da un altro processo con drain()"""
+
+    def __init__(self, path: str = 'price_alerts_queue.jsonl'):
+        self.path = path
+        self.lock_file = path + '.lock'
+
+    def send(self, alert: Dict):
+        with FileLock(self.lock_file):
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(alert, ensure_ascii=False) + '\n')
+
+    def drain(self) -> List[Dict]:
+        """Restituisce gli alert in coda e svuota il file"""
+        with FileLock(self.lock_file):
+            if not os.path.exists(self.path):
+                return []
+            with open(self.path, 'r', encoding='utf-8') as f:
+                alerts = [json.loads(line) for line in f if line.strip()]
+            os.remove(self.path)
+        return alerts
+
+
+class AlertEngine:
+    """Regole di alert per rotta, valutate in modo incrementale sulle ricerche salvate"""
+
+    def __init__(self, storage=None, rules_file: str = 'price_alerts.json',
+                 sinks: Optional[List] = None, window: int = 20, history_size: int = 50):
+        """
+        Args:
+            storage: Storage da cui ricostruire lo stato di una rotta la prima volta
+                (None per partire da zero)
+            rules_file: File JSON delle regole, condiviso tra i processi
+            sinks: Destinazioni degli alert (default: solo LogSink)
+            window: Ricerche su cui calcolare il minimo mobile per le regole 'drop'
+            history_size: Alert recenti tenuti in memoria per /api/alerts
+        """
+        self.storage = storage
+        self.rules_file = rules_file
+        self.lock_file = rules_file + '.lock'
+        self.sinks = sinks if sinks is not None else [LogSink()]
+        self.window = window
+        self.recent = deque(maxlen=history_size)
+
+        self._lock = threading.RLock()
+        self._rules: Dict[str, Dict] = {}
+        self._rules_by_route: Dict[str, List[Dict]] = {}
+        self._states: Dict[str, RouteState] = {}
+        self._rules_mtime = None
+        self._reload_if_changed()
+
+    @classmethod
+    def from_env(cls, storage=None) -> 'AlertEngine':
+        """Crea il motore da PRICE_ALERTS_FILE, ALERT_WEBHOOK_URL, ALERT_QUEUE_FILE e ALERT_WINDOW"""
+        sinks = [LogSink()]
+        if os.getenv('ALERT_WEBHOOK_URL'):
+            sinks.append(WebhookSink(os.getenv('ALERT_WEBHOOK_URL')))
+        if os.getenv('ALERT_QUEUE_FILE'):
+            sinks.append(FileQueueSink(os.getenv('ALERT_QUEUE_FILE')))
+        return cls(
+            storage,
+            rules_file=os.getenv('PRICE_ALERTS_FILE', 'price_alerts.json'),
+            sinks=sinks,
+            window=int(os.getenv('ALERT_WINDOW', '20'))
+        )
+
+    def add_rule(self, origin: str, destination: str, departure_date: str,
+                 return_date: Optional[str] = None, rule_type: str = 'all_time_low',
+                 threshold: Optional[float] = None, percent: Optional[float] = None) -> Dict:
+        """
+        Registra una regola di alert
+
+        Args:
+            origin: Codice IATA aeroporto partenza
+            destination: Codice IATA aeroporto destinazione
+            departure_date: Data partenza (YYYY-MM-DD)
+            return_date: Data ritorno (None per solo andata)
+            rule_type: 'threshold' (prezzo sotto threshold), 'drop' (calo di almeno
+                percent% dal minimo delle ultime ricerche) o 'all_time_low'
+            threshold: Prezzo soglia per 'threshold'
+            percent: Calo percentuale per 'drop'
+
+        Returns:
+            Dict: Regola salvata, con il suo id
+
+        Raises:
+            ValueError: Se i parametri non sono validi
+        """
+        if not origin or not destination or not departure_date:
+            raise ValueError("origin, destination e departure_date sono obbligatori")
+        for value in (departure_date, return_date):
+            if value:
+                try:
+                    datetime.strptime(value, '%Y-%m-%d')
+                except ValueError:
+                    raise ValueError(f"Data non valida: {value} (formato YYYY-MM-DD)")
+        if rule_type not in RULE_TYPES:
+            raise ValueError(f"Tipo di regola non valido: {rule_type} (ammessi: {', '.join(RULE_TYPES)})")
+        if rule_type == 'threshold' and (threshold is None or float(threshold) <= 0):
+            raise ValueError("threshold deve essere un prezzo positivo")
+        if rule_type == 'drop' and (percent is None or not 0 < float(percent) < 100):
+            raise ValueError("percent deve essere compreso tra 0 e 100")
+
+        rule = {
+            'id': uuid.uuid4().hex[:12],
+            'route': {
+                'origin': origin.upper(),
+                'destination': destination.upper(),
+                'departure_date': departure_date,
+                'return_date': return_date or None
+            },
+            'type': rule_type,
+            'threshold': float(threshold) if rule_type == 'threshold' else None,
+            'percent': float(percent) if rule_type == 'drop' else None,
+            'created_at': datetime.now().isoformat()
+        }
+
+        with self._lock, FileLock(self.lock_file):
+            rules = self._read_rules()
+            rules.append(rule)
+            self._write_rules(rules)
+        return rule
+
+    def remove_rule(self, rule_id: str) -> bool:
+        """
+        Elimina una regola
+
+        Returns:
+            bool: False se la regola non esiste
+        """
+        with self._lock, FileLock(self.lock_file):
+            rules = self._read_rules()
+            remaining = [rule for rule in rules if rule['id'] != rule_id]
+            if len(remaining) == len(rules):
+                return False
+            self._write_rules(remaining)
+        return True
+
+    def list_rules(self) -> List[Dict]:
+        """Regole registrate"""
+        with self._lock:
+            self._reload_if_changed()
+            return list(self._rules.values())
+
+    def on_search(self, search_record: Dict, searches_count: Optional[int] = None) -> List[Dict]:
+        """
+        Valuta le regole della rotta sul record appena salvato (listener dello storage)
+
+        Args:
+            search_record: Record di ricerca salvato
+            searches_count: Ricerche della rotta nello storage fino al record compreso
+                (None se non noto: lo stato non viene confrontato con lo storage)
+
+        Returns:
+            List[Dict]: Alert scattati
+        """
+        price = search_record.get('cheapest_price')
+        key = RouteSummaryIndex.route_key(search_record['route'])
+        if price is None:
+            with self._lock:
+                if key in self._states:
+                    self._states[key].searches_seen += 1
+            return []
+
+        with self._lock:
+            self._reload_if_changed()
+            rules = self._rules_by_route.get(key)
+            if not rules:
+                return []
+
+            # Altri processi (web app, poller, CLI) salvano sulla stessa rotta:
+            # se lo storage ha più ricerche di quelle viste, lo stato va ricaricato
+            state = self._states.get(key)
+            if state is None or (searches_count is not None and
+                                 searches_count != state.searches_seen + 1):
+                state = self._load_state(search_record, searches_count)
+                self._states[key] = state
+
+            alerts = []
+            for rule in rules:
+                alert = self._evaluate(rule, state, price, search_record)
+                if alert:
+                    alerts.append(alert)
+            state.push(price)
+            self.recent.extend(alerts)
+
+        for alert in alerts:
+            for sink in self.sinks:
+                try:
+                    sink.send(alert)
+                except Exception as e:
+                    print(f"⚠️ Errore nell'invio dell'alert: {e}")
+        return alerts
+
+    def _evaluate(self, rule: Dict, state: RouteState, price: float,
+                  search_record: Dict) -> Optional[Dict]:
+        """Alert della regola per il nuovo prezzo, o None (stato prima del nuovo prezzo)"""
+        route = search_record['route']
+        currency = search_record.get('currency', 'EUR')
+        label = f"{route['origin']}→{route['destination']} {route['departure_date']}"
+
+        if rule['type'] == 'threshold':
+            # Scatta quando il prezzo scende sotto la soglia, non a ogni ricerca successiva
+            reference = rule['threshold']
+            if price > reference or (state.last_price is not None and state.last_price <= reference):
+                return None
+            message = f"{label}: {price:.2f} {currency}, sotto la soglia di {reference:.2f}"
+        elif rule['type'] == 'drop':
+            reference = state.rolling_min
+            if reference is None or price > reference * (1 - rule['percent'] / 100):
+                return None
+            message = (f"{label}: {price:.2f} {currency}, -{(1 - price / reference) * 100:.1f}% "
+                       f"dal minimo delle ultime {state.window} ricerche ({reference:.2f})")
+        else:
+            reference = state.all_time_low
+            if reference is None or price >= reference:
+                return None
+            message = f"{label}: {price:.2f} {currency}, nuovo minimo storico (prima {reference:.2f})"
+
+        return {
+            'rule_id': rule['id'],
+            'type': rule['type'],
+            'route': route,
+            'price': price,
+            'currency': currency,
+            'reference': reference,
+            'timestamp': search_record.get('timestamp') or datetime.now().isoformat(),
+            'message': message
+        }
+
+    def _load_state(self, search_record: Dict, searches_count: Optional[int] = None) -> RouteState:
+        """Ricostruisce lo stato della rotta dallo storico precedente al record nuovo"""
+        state = RouteState(self.window)
+        if self.storage is None:
+            return state
+
+        route = search_record['route']
+        series = self.storage.get_price_series(
+            route['origin'], route['destination'], route['departure_date'], route.get('return_date')
+        )
+        prices = series.cheapest
+        if len(prices) and search_record.get('timestamp'):
+            # Il listener viene chiamato dopo il salvataggio di tutto il blocco: lo
+            # storico contiene già il record e quelli salvati insieme dopo di lui
+            current = np.datetime64(search_record['timestamp'], 'us')
+            prices = prices[series.timestamps < current]
+        if len(prices):
+            state.all_time_low = float(prices.min())
+        for price in prices[-self.window:]:
+            state.push(float(price))
+        # Le ricerche senza prezzo e gli aggregati contano nel conteggio ma non nella serie
+        if searches_count is not None:
+            state.searches_seen = searches_count - 1
+        return state
+
+    def _reload_if_changed(self):
+        """Rilegge le regole se il file è stato modificato (anche da un altro processo)"""
+        try:
+            mtime = os.stat(self.rules_file).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._rules_mtime:
+            return
+        self._rules_mtime = mtime
+        self._index_rules(self._read_rules())
+
+    def _index_rules(self, rules: List[Dict]):
+        """Indicizza le regole per rotta e scarta lo stato delle rotte senza più regole"""
+        self._rules = {rule['id']: rule for rule in rules}
+        self._rules_by_route = {}
+        for rule in rules:
+            self._rules_by_route.setdefault(RouteSummaryIndex.route_key(rule['route']), []).append(rule)
+        self._states = {key: state for key, state in self._states.items() if key in self._rules_by_route}
+
+    def _read_rules(self) -> List[Dict]:
+        if not os.path.exists(self.rules_file):
+            return []
+        with open(self.rules_file, 'r', encoding='utf-8') as f:
+            return json.load(f).get('rules', [])
+
+    def _write_rules(self, rules: List[Dict]):
+        atomic_write_json(self.rules_file, {'rules': rules}, indent=2, ensure_ascii=False)
+        self._rules_mtime = os.stat(self.rules_file).st_mtime_ns
+        self._index_rules(rules)
+
+
+def attach_alerts(storage) -> AlertEngine:
+    """Crea il motore degli alert dalle variabili d'ambiente e lo collega ai salvataggi dello storage"""
+    engine = AlertEngine.from_env(storage)
+    storage.add_listener(engine.on_search)
+    return engine
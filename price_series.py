@@ -0,0 +1,79 @@
+"""
+Serie storica dei prezzi di una rotta in formato colonnare (NumPy)
+Le statistiche sono calcolate in modo vettoriale, anche su decine di
+migliaia di osservazioni per rotta
+"""
+from typing import List, Dict, Sequence
+
+import numpy as np
+
+
+class PriceSeries:
+    """Timestamp, prezzo minimo e prezzo medio di ogni ricerca come array NumPy"""
+
+    def __init__(self, timestamps: np.ndarray, cheapest: np.ndarray, average: np.ndarray):
+        """
+        Args:
+            timestamps: Array datetime64 degli istanti di ricerca
+            cheapest: Prezzo più basso trovato a ogni ricerca
+            average: Prezzo medio delle offerte a ogni ricerca (NaN se assente)
+        """
+        self.timestamps = timestamps
+        self.cheapest = cheapest
+        self.average = average
+
+    @classmethod
+    def from_history(cls, history: List[Dict]) -> 'PriceSeries':
+        """
+        Costruisce la serie dai record di get_price_history,
+        scartando le ricerche senza prezzo
+
+        Returns:
+            PriceSeries: Serie ordinata come lo storico
+        """
+        priced = [h for h in history if h['cheapest_price']]
+        count = len(priced)
+
+        timestamps = np.array([h['timestamp'] for h in priced], dtype='datetime64[us]')
+        cheapest = np.fromiter((h['cheapest_price'] for h in priced), dtype=np.float64, count=count)
+        average = np.fromiter(
+            (np.nan if h.get('average_price') is None else h['average_price'] for h in priced),
+            dtype=np.float64, count=count
+        )
+        return cls(timestamps, cheapest, average)
+
+    def __len__(self) -> int:
+        return len(self.cheapest)
+
+    def tail(self, n: int) -> 'PriceSeries':
+        """Serie con le ultime n ricerche"""
+        return PriceSeries(self.timestamps[-n:], self.cheapest[-n:], self.average[-n:])
+
+    def percentiles(self, qs: Sequence[float] = (5, 25, 50, 75, 95)) -> Dict[str, float]:
+        """Percentili del prezzo più basso, es. {'p5': ..., 'p50': ...}"""
+        values = np.percentile(self.cheapest, qs)
+        return {f'p{q:g}': float(v) for q, v in zip(qs, values)}
+
+    def rolling_mean(self, window: int) -> np.ndarray:
+        """
+        Media mobile del prezzo più basso (somme cumulative, O(n))
+
+        Returns:
+            np.ndarray: Una media per ogni finestra completa (vuoto se la serie è più corta)
+        """
+        if window <= 0 or window > len(self.cheapest):
+            return np.empty(0)
+        sums = np.cumsum(np.insert(self.cheapest, 0, 0.0))
+        return (sums[window:] - sums[:-window]) / window
+
+    def volatility(self) -> float:
+        """Deviazione standard delle variazioni percentuali tra ricerche consecutive"""
+        if len(self.cheapest) < 2:
+            return 0.0
+        returns = np.diff(self.cheapest) / self.cheapest[:-1]
+        return float(np.std(returns))
+
+    def drawdown_from_low(self) -> np.ndarray:
+        """Distanza relativa di ogni prezzo dal minimo storico raggiunto fino a quel momento"""
+        running_low = np.minimum.accumulate(self.cheapest)
+        return self.cheapest / running_low - 1.0
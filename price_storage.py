@@ -3,8 +3,16 @@ Sistema di storage per salvare e gestire lo storico dei prezzi dei voli
 """
 import json
 import os
+import uuid
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Iterable, Iterator
+
+from file_lock import FileLock, atomic_writer
+from json_stream import iter_json_array
+from offer_store import OfferStore
+from price_series import PriceSeries
+from retention import RetentionPolicy, apply_retention
+from route_index import RouteSummaryIndex
 
 
 class PriceStorage:
@@ -18,13 +26,57 @@ class PriceStorage:
             db_file (str): Path del file JSON per salvare i dati
         """
         self.db_file = db_file
+        self.lock_file = db_file + '.lock'
+        self.routes_file = os.path.splitext(db_file)[0] + '.routes.json'
+        self.offer_store = OfferStore(os.path.splitext(db_file)[0] + '.offers.jsonl')
+        self._listeners: List[Callable[[Dict, int], None]] = []
         self._ensure_db_exists()
     
+    def add_listener(self, listener: Callable[[Dict, int], None]):
+        """
+        Registra una funzione chiamata con ogni record di ricerca salvato
+        (es. il motore degli alert di prezzo)
+        
+        Args:
+            listener: Funzione che riceve il record (route, timestamp, cheapest_price, ...)
+                e il numero di ricerche della rotta nello storage fino a quel record
+                compreso (più di quelle viste = salvate anche da altri processi)
+        """
+        self._listeners.append(listener)
+    
+    def _notify(self, search_records: List[Dict], searches_counts: Dict[str, int]):
+        """
+        Passa i record appena salvati ai listener; un listener che fallisce non blocca il salvataggio
+        
+        Args:
+            search_records: Record salvati, nell'ordine di salvataggio
+            searches_counts: Ricerche di ogni rotta nello storage dopo il salvataggio
+        """
+        if not self._listeners:
+            return
+        
+        # Il conteggio di ogni record esclude i record successivi della stessa rotta nel blocco
+        counts = dict(searches_counts)
+        record_counts = []
+        for search_record in reversed(search_records):
+            key = self._route_key(search_record['route'])
+            record_counts.append(counts[key])
+            counts[key] -= search_record.get('samples', 1)
+        
+        for search_record, searches_count in zip(search_records, reversed(record_counts)):
+            for listener in self._listeners:
+                try:
+                    listener(search_record, searches_count)
+                except Exception as e:
+                    print(f"⚠️ Errore nel listener dello storage: {e}")
+    
     def _ensure_db_exists(self):
         """Crea il file DB se non esiste"""
-        if not os.path.exists(self.db_file):
-            with open(self.db_file, 'w', encoding='utf-8') as f:
-                json.dump({'searches': []}, f, indent=2)
+        if os.path.exists(self.db_file):
+            return
+        with FileLock(self.lock_file):
+            if not os.path.exists(self.db_file):
+                self._write_searches([])
     
     def save_search(self, origin: str, destination: str, departure_date: str,
                     return_date: Optional[str], offers: List[Dict]):
@@ -38,9 +90,72 @@ class PriceStorage:
             return_date: Data ritorno (None per solo andata)
             offers: Lista delle offerte trovate
         """
-        data = self._load_data()
+        self.save_searches([{
+            'origin': origin,
+            'destination': destination,
+            'departure_date': departure_date,
+            'return_date': return_date,
+            'offers': offers
+        }])
+    
+    def save_searches(self, searches: Iterable[Dict]) -> int:
+        """
+        Salva più ricerche con una sola scrittura dello storico
+        
+        Args:
+            searches: Dict con origin, destination, departure_date,
+                      return_date (opzionale) e offers, come per save_search
+        
+        Returns:
+            int: Numero di ricerche salvate
+        """
+        # Load, append e riscrittura avvengono sotto lock: nessun record perso
+        # anche con più processi che scrivono in parallelo
+        with FileLock(self.lock_file):
+            search_records = [
+                self._build_search_record(
+                    search['origin'], search['destination'], search['departure_date'],
+                    search.get('return_date'), search['offers']
+                )
+                for search in searches
+            ]
+            if not search_records:
+                return 0
+            
+            # Lo storico viene ricopiato in streaming nel nuovo file: memoria costante
+            # anche con file grandi. Le offerte vanno nell'archivio separato, nel JSON
+            # resta il riepilogo (anche per i record del formato precedente)
+            def all_searches():
+                for search in self._iter_searches():
+                    yield self._store_offers(search) if 'offers' in search else search
+                for search_record in search_records:
+                    yield self._store_offers(search_record)
+            
+            total = self._write_searches(all_searches())
+            
+            # Aggiorna il riepilogo delle rotte (ricostruito se non allineato ai dati)
+            routes_index = RouteSummaryIndex.load(self.routes_file)
+            if routes_index is None or routes_index.record_count() != total - len(search_records):
+                routes_index = RouteSummaryIndex.build(self._iter_searches())
+            else:
+                for search_record in search_records:
+                    routes_index.update(search_record)
+            routes_index.save(self.routes_file)
+            searches_counts = routes_index.searches_counts(record['route'] for record in search_records)
         
-        search_record = {
+        self._notify(search_records, searches_counts)
+        return len(search_records)
+    
+    def _build_search_record(self, origin: str, destination: str, departure_date: str,
+                             return_date: Optional[str], offers: List[Dict]) -> Dict:
+        """
+        Costruisce il record di una ricerca con le statistiche di prezzo
+        
+        Returns:
+            Dict: Record pronto per essere salvato
+        """
+        return {
+            'id': uuid.uuid4().hex,
             'timestamp': datetime.now().isoformat(),
             'route': {
                 'origin': origin,
@@ -54,39 +169,121 @@ class PriceStorage:
             'currency': offers[0]['price']['currency'] if offers else 'EUR',
             'offers': offers
         }
+    
+    def _store_offers(self, search_record: Dict) -> Dict:
+        """
+        Sposta le offerte di un record nell'archivio separato
         
-        data['searches'].append(search_record)
-        self._save_data(data)
+        Returns:
+            Dict: Riepilogo della ricerca con il riferimento offers_ref
+        """
+        summary = {k: v for k, v in search_record.items() if k != 'offers'}
+        summary.setdefault('id', uuid.uuid4().hex)
+        offers = search_record.get('offers')
+        OfferStore.set_record_ref(summary, self.offer_store.append(summary['id'], offers) if offers else None)
+        return summary
+    
+    def get_offers(self, search_record: Dict) -> List[Dict]:
+        """
+        Carica le offerte di una ricerca dall'archivio separato
+        
+        Args:
+            search_record: Record restituito da get_price_history
+        
+        Returns:
+            List[Dict]: Offerte della ricerca
+        """
+        if 'offers' in search_record:
+            return search_record['offers']
+        ref = OfferStore.record_ref(search_record)
+        if ref is None:
+            return []
+        return self.offer_store.load(ref)
     
     def get_price_history(self, origin: str, destination: str, 
-                         departure_date: str, return_date: Optional[str] = None) -> List[Dict]:
+                         departure_date: str, return_date: Optional[str] = None,
+                         include_offers: bool = False) -> List[Dict]:
         """
         Recupera lo storico prezzi per una specifica rotta
         
+        Args:
+            include_offers: Carica anche le offerte complete di ogni ricerca
+        
         Returns:
             List[Dict]: Lista degli storici di ricerca per quella rotta
         """
-        data = self._load_data()
-        
+        # Filtra lo storico in streaming, senza caricare l'intero file
         history = [
-            search for search in data['searches']
+            search for search in self._iter_searches()
             if (search['route']['origin'] == origin and
                 search['route']['destination'] == destination and
                 search['route']['departure_date'] == departure_date and
                 search['route']['return_date'] == return_date)
         ]
         
+        return self._attach_offers(history, include_offers)
+    
+    def _attach_offers(self, history: List[Dict], include_offers: bool) -> List[Dict]:
+        """Aggiunge le offerte ai record se richieste, altrimenti le rimuove"""
+        if not include_offers:
+            for search in history:
+                search.pop('offers', None)
+            return history
+        
+        refs = [OfferStore.record_ref(s) for s in history if 'offers' not in s]
+        refs = [ref for ref in refs if ref is not None]
+        offers_by_ref = self.offer_store.load_many(refs) if refs else {}
+        for search in history:
+            if 'offers' not in search:
+                search['offers'] = offers_by_ref.get(OfferStore.record_ref(search), [])
         return history
     
+    def get_price_series(self, origin: str, destination: str,
+                         departure_date: str, return_date: Optional[str] = None) -> PriceSeries:
+        """
+        Recupera lo storico di una rotta come serie colonnare NumPy
+        
+        Returns:
+            PriceSeries: Timestamp, prezzi minimi e medi delle ricerche con prezzo
+        """
+        history = self.get_price_history(origin, destination, departure_date, return_date)
+        return PriceSeries.from_history(history)
+    
     def get_price_trend(self, origin: str, destination: str,
-                       departure_date: str, return_date: Optional[str] = None) -> Dict:
+                       departure_date: str, return_date: Optional[str] = None,
+                       rolling_window: int = 7) -> Dict:
         """
         Analizza il trend dei prezzi per una rotta
         
+        Args:
+            rolling_window: Numero di ricerche della media mobile
+        
         Returns:
             Dict: Statistiche sul trend dei prezzi
+        
+        Raises:
+            ValueError: Se rolling_window non è un intero positivo
         """
         history = self.get_price_history(origin, destination, departure_date, return_date)
+        return self.price_trend_from_history(history, rolling_window)
+    
+    def price_trend_from_history(self, history: List[Dict], rolling_window: int = 7) -> Dict:
+        """
+        Trend dei prezzi calcolato da uno storico già letto con get_price_history
+        (es. per non rileggerlo quando serve anche lo storico stesso)
+        
+        Args:
+            history: Record della rotta in ordine cronologico
+            rolling_window: Numero di ricerche della media mobile
+        
+        Returns:
+            Dict: Statistiche sul trend dei prezzi (come get_price_trend)
+        
+        Raises:
+            ValueError: Se rolling_window non è un intero positivo
+        """
+        if not isinstance(rolling_window, int) or rolling_window < 1:
+            raise ValueError(f"rolling_window deve essere un intero positivo (ricevuto {rolling_window!r})")
         
         if not history:
             return {
@@ -94,25 +291,45 @@ class PriceStorage:
                 'message': 'Nessuno storico disponibile per questa rotta'
             }
         
-        prices = [h['cheapest_price'] for h in history if h['cheapest_price']]
+        series = PriceSeries.from_history(history)
         
-        if not prices:
+        if not len(series):
             return {
                 'found': False,
                 'message': 'Nessun prezzo disponibile'
             }
         
+        prices = series.cheapest
+        rolling = series.rolling_mean(min(rolling_window, len(series)))
+        drawdown = series.drawdown_from_low()
+        
+        # Gli aggregati della retention hanno come prezzo il minimo della finestra:
+        # massimo, media e prezzo attuale vengono dai campi che riassumono le ricerche
+        priced = [h for h in history if h['cheapest_price']]
+        lowest = float(prices.min())
+        priced_samples = sum(h.get('priced_samples', 1) for h in priced)
+        first, last = priced[0], priced[-1]
+        current = float(last.get('last_cheapest_price', last['cheapest_price']))
+        initial = float(first.get('first_cheapest_price', first['cheapest_price']))
+        
         return {
             'found': True,
-            'searches_count': len(history),
-            'lowest_price': min(prices),
-            'highest_price': max(prices),
-            'average_price': sum(prices) / len(prices),
-            'current_price': prices[-1],
-            'price_change': prices[-1] - prices[0] if len(prices) > 1 else 0,
+            'searches_count': sum(h.get('samples', 1) for h in history),
+            'lowest_price': lowest,
+            'highest_price': float(max(h.get('max_cheapest_price', h['cheapest_price']) for h in priced)),
+            'average_price': float(sum(
+                h.get('avg_cheapest_price', h['cheapest_price']) * h.get('priced_samples', 1) for h in priced
+            ) / priced_samples),
+            'current_price': current,
+            'price_change': current - initial if priced_samples > 1 else 0,
             'currency': history[0]['currency'],
             'first_search': history[0]['timestamp'],
-            'last_search': history[-1]['timestamp']
+            'last_search': history[-1].get('last_timestamp', history[-1]['timestamp']),
+            'percentiles': series.percentiles(),
+            'rolling_mean': float(rolling[-1]),
+            'volatility': series.volatility(),
+            'drawdown_from_low': current / lowest - 1.0,
+            'max_drawdown_from_low': float(drawdown.max())
         }
     
     def get_all_routes(self) -> List[Dict]:
@@ -122,26 +339,76 @@ class PriceStorage:
         Returns:
             List[Dict]: Lista delle rotte uniche monitorate
         """
-        data = self._load_data()
-        routes = {}
+        return self._load_routes_index().routes()
+    
+    def get_route_summary(self, route: Dict) -> Optional[Dict]:
+        """
+        Riepilogo di una sola rotta (stesso formato di get_all_routes)
+        
+        Args:
+            route: Rotta (origin, destination, departure_date, return_date)
         
-        for search in data['searches']:
-            route = search['route']
-            key = f"{route['origin']}-{route['destination']}-{route['departure_date']}-{route.get('return_date')}"
+        Returns:
+            Optional[Dict]: Riepilogo, None se la rotta non è mai stata cercata
+        """
+        return self._load_routes_index().route(route)
+    
+    def _load_routes_index(self) -> RouteSummaryIndex:
+        """Riepilogo rotte salvato, ricostruito dallo storico se manca"""
+        routes_index = RouteSummaryIndex.load(self.routes_file)
+        
+        if routes_index is None:
+            with FileLock(self.lock_file):
+                routes_index = RouteSummaryIndex.build(self._iter_searches())
+                routes_index.save(self.routes_file)
+        
+        return routes_index
+    
+    def apply_retention(self, policy: Optional[RetentionPolicy] = None) -> Dict:
+        """
+        Applica la politica di conservazione: toglie le offerte alle ricerche vecchie
+        o già partite e aggrega per ora/giorno le ricerche più vecchie
+        
+        Args:
+            policy: Politica da applicare (default: RetentionPolicy())
+        
+        Returns:
+            Dict: Statistiche dell'operazione
+        """
+        with FileLock(self.lock_file):
+            data = self._load_data()
+            result = apply_retention(data['searches'], policy or RetentionPolicy())
+            records = result['records']
             
-            if key not in routes:
-                routes[key] = {
-                    'route': route,
-                    'searches_count': 0,
-                    'last_search': None,
-                    'last_price': None
-                }
+            # Compatta l'archivio offerte tenendo solo quelle ancora referenziate:
+            # le offerte vanno in un nuovo file, i record vengono salvati con i nuovi
+            # riferimenti e solo dopo il vecchio file viene eliminato
+            for idx, search in enumerate(records):
+                if 'offers' in search:
+                    records[idx] = self._store_offers(search)
+            mapping = self.offer_store.compact(
+                ref for ref in map(OfferStore.record_ref, records) if ref is not None
+            )
+            for search in records:
+                ref = OfferStore.record_ref(search)
+                if ref is not None:
+                    OfferStore.set_record_ref(search, mapping[ref])
             
-            routes[key]['searches_count'] += 1
-            routes[key]['last_search'] = search['timestamp']
-            routes[key]['last_price'] = search['cheapest_price']
+            data['searches'] = records
+            self._save_data(data)
+            self.offer_store.commit_compaction()
+            RouteSummaryIndex.build(records).save(self.routes_file)
         
-        return list(routes.values())
+        return result['stats']
+    
+    @staticmethod
+    def _route_key(route: Dict) -> str:
+        """Chiave univoca di una rotta (origine, destinazione, date)"""
+        return RouteSummaryIndex.route_key(route)
+    
+    def _iter_searches(self) -> Iterator[Dict]:
+        """Legge i record di ricerca uno alla volta (parsing incrementale del file JSON)"""
+        return iter_json_array(self.db_file, 'searches')
     
     def _load_data(self) -> Dict:
         """Carica i dati dal file JSON"""
@@ -150,5 +417,47 @@ class PriceStorage:
     
     def _save_data(self, data: Dict):
         """Salva i dati nel file JSON"""
-        with open(self.db_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        self._write_searches(data['searches'])
+    
+    def _write_searches(self, searches: Iterable[Dict]) -> int:
+        """
+        Scrive lo storico in streaming, un record per riga
+        Il rename atomico finale evita che i lettori vedano un file a metà
+        
+        Returns:
+            int: Numero di record scritti
+        """
+        count = 0
+        with atomic_writer(self.db_file) as f:
+            f.write('{"searches": [')
+            for search in searches:
+                f.write(',\n  ' if count else '\n  ')
+                f.write(json.dumps(search, ensure_ascii=False))
+                count += 1
+            f.write('\n]}\n')
+        return count
+
+
+def create_storage(backend: Optional[str] = None, db_file: Optional[str] = None) -> PriceStorage:
+    """
+    Crea lo storage in base al backend configurato
+    
+    Args:
+        backend: 'json', 'sqlite' o 'segments' (default: variabile PRICE_STORAGE_BACKEND, poi 'json')
+        db_file: Path del file dati (default dipende dal backend)
+    
+    Returns:
+        PriceStorage: Istanza dello storage scelto
+    """
+    backend = (backend or os.getenv('PRICE_STORAGE_BACKEND') or 'json').lower()
+    
+    if backend == 'json':
+        return PriceStorage(db_file or 'price_history.json')
+    if backend == 'sqlite':
+        from sqlite_storage import SQLitePriceStorage
+        return SQLitePriceStorage(db_file or 'price_history.db')
+    if backend == 'segments':
+        from segment_storage import SegmentLogPriceStorage
+        return SegmentLogPriceStorage(db_file or 'price_history_log')
+    
+    raise ValueError(f"Backend di storage non supportato: {backend}")
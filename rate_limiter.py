@@ -0,0 +1,179 @@
+"""
+Limitatore di richieste per l'API Amadeus
+Token bucket condiviso da tutti i client del processo (sincroni e asincroni),
+con ripetizione delle chiamate rifiutate per quota (429) o errori del server (5xx)
+dopo un'attesa esponenziale con jitter
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+
+# Stati HTTP per cui la richiesta viene ripetuta (None = errore di rete)
+RETRYABLE_STATUS = {None, 429, 500, 502, 503, 504}
+
+
+class AmadeusUnavailableError(Exception):
+    """L'API continua a rifiutare la richiesta (quota o errore del server) dopo tutti i tentativi"""
+
+    def __init__(self, status_code: Optional[int], message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class RateLimiter:
+    """Token bucket (in forma GCRA) con pausa globale e ripetizione con backoff"""
+
+    def __init__(self, rate: float = 10, burst: Optional[int] = None, max_retries: int = 4,
+                 base_delay: float = 0.5, max_delay: float = 30):
+        """
+        Args:
+            rate: Richieste al secondo sostenute
+            burst: Richieste consecutive ammesse senza attesa (default pari a rate)
+            max_retries: Tentativi ripetuti dopo un 429/5xx prima di arrendersi
+            base_delay: Attesa del primo tentativo ripetuto, in secondi
+            max_delay: Attesa massima tra due tentativi, in secondi
+        """
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._interval = 1.0 / rate
+        self._tolerance = (self.burst - 1) * self._interval
+        self._tat = 0.0  # istante teorico di arrivo della prossima richiesta
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.throttled_requests = 0
+        self.throttled_seconds = 0.0
+        self.retries = 0
+        self.backoff_seconds = 0.0
+        self.exhausted = 0
+
+    @classmethod
+    def from_env(cls) -> 'RateLimiter':
+        """Crea il limitatore da AMADEUS_RATE_LIMIT, AMADEUS_RATE_BURST e AMADEUS_MAX_RETRIES"""
+        burst = os.getenv('AMADEUS_RATE_BURST')
+        return cls(
+            rate=float(os.getenv('AMADEUS_RATE_LIMIT', '10')),
+            burst=int(burst) if burst else None,
+            max_retries=int(os.getenv('AMADEUS_MAX_RETRIES', '4'))
+        )
+
+    def set_rate(self, rate: float, burst: Optional[int] = None):
+        """
+        Cambia il ritmo sostenuto, ad esempio quando la quota è divisa tra più processi
+
+        Args:
+            rate: Richieste al secondo sostenute
+            burst: Richieste consecutive ammesse senza attesa (default pari a rate)
+        """
+        with self._lock:
+            self.rate = rate
+            self.burst = burst or max(1, int(rate))
+            self._interval = 1.0 / rate
+            self._tolerance = (self.burst - 1) * self._interval
+
+    def acquire(self) -> float:
+        """
+        Attende il turno per la prossima richiesta
+
+        Returns:
+            float: Secondi di attesa
+        """
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self) -> float:
+        """Come acquire, ma attende senza bloccare l'event loop"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def should_retry(self, status_code: Optional[int], attempt: int) -> bool:
+        """True se la richiesta fallita con questo stato va ripetuta"""
+        return status_code in RETRYABLE_STATUS and attempt < self.max_retries
+
+    def backoff(self, attempt: int, status_code: Optional[int] = None,
+                retry_after: Optional[float] = None) -> float:
+        """
+        Calcola l'attesa prima del prossimo tentativo (full jitter)
+        Dopo un 429 mette in pausa tutte le richieste del processo, non solo quella rifiutata
+
+        Args:
+            attempt: Numero del tentativo fallito (0 per il primo)
+            status_code: Stato HTTP della risposta
+            retry_after: Valore dell'header Retry-After, se presente
+
+        Returns:
+            float: Secondi da attendere prima di riprovare
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        with self._lock:
+            self.retries += 1
+            self.backoff_seconds += delay
+            if status_code == 429:
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    def give_up(self, status_code: Optional[int], error: Exception) -> AmadeusUnavailableError:
+        """Registra l'esaurimento dei tentativi e restituisce l'errore da sollevare"""
+        with self._lock:
+            self.exhausted += 1
+        return AmadeusUnavailableError(
+            status_code,
+            f"API Amadeus non disponibile dopo {self.max_retries + 1} tentativi: {error}"
+        )
+
+    def stats(self) -> Dict:
+        """Richieste, tempo di attesa per il limite e tentativi ripetuti"""
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'burst': self.burst,
+                'requests': self.requests,
+                'throttled_requests': self.throttled_requests,
+                'throttled_seconds': round(self.throttled_seconds, 3),
+                'retries': self.retries,
+                'backoff_seconds': round(self.backoff_seconds, 3),
+                'exhausted': self.exhausted
+            }
+
+    def _reserve(self) -> float:
+        """Prenota il prossimo slot libero e restituisce quanto attendere"""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._tat - self._tolerance, self._paused_until)
+            self._tat = max(self._tat, start) + self._interval
+
+            wait = start - now
+            self.requests += 1
+            if wait > 0:
+                self.throttled_requests += 1
+                self.throttled_seconds += wait
+            return wait
+
+
+_shared_limiter: Optional[RateLimiter] = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Limitatore condiviso da tutti i client del processo"""
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter.from_env()
+        return _shared_limiter
@@ -0,0 +1,204 @@
+"""
+Politica di conservazione dello storico prezzi
+Le ricerche recenti mantengono le offerte complete, quelle più vecchie vengono
+aggregate per ora e poi per giorno (min/media/max del prezzo più basso)
+
+Uso: python retention.py [--keep-offers-days 7] [--hourly-after-days 7] [--daily-after-days 30]
+"""
+import argparse
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional
+
+from route_index import RouteSummaryIndex
+
+
+class RetentionPolicy:
+    """Soglie di età oltre le quali le ricerche perdono le offerte o vengono aggregate"""
+
+    def __init__(self, keep_offers_days: int = 7, hourly_after_days: int = 7,
+                 daily_after_days: int = 30, drop_departed_offers: bool = True):
+        """
+        Args:
+            keep_offers_days: Giorni per cui le ricerche mantengono le offerte complete
+            hourly_after_days: Età oltre la quale le ricerche vengono aggregate per ora
+            daily_after_days: Età oltre la quale ricerche e aggregati orari diventano giornalieri
+            drop_departed_offers: Elimina le offerte delle rotte con partenza già passata
+        """
+        if not keep_offers_days <= hourly_after_days <= daily_after_days:
+            raise ValueError(
+                "Deve valere keep_offers_days <= hourly_after_days <= daily_after_days"
+            )
+        self.keep_offers_days = keep_offers_days
+        self.hourly_after_days = hourly_after_days
+        self.daily_after_days = daily_after_days
+        self.drop_departed_offers = drop_departed_offers
+
+
+def apply_retention(records: List[Dict], policy: RetentionPolicy,
+                    now: Optional[datetime] = None) -> Dict:
+    """
+    Applica la politica a una lista di record di ricerca (in ordine cronologico)
+
+    Args:
+        records: Record di ricerca e aggregati già esistenti
+        policy: Politica di conservazione
+        now: Istante di riferimento (default: adesso)
+
+    Returns:
+        Dict: 'records' (record risultanti in ordine cronologico),
+              'aggregated_ids' (id dei record assorbiti negli aggregati),
+              'pruned_ids' (id dei record conservati a cui sono state tolte le offerte),
+              'stats' (conteggi dell'operazione)
+    """
+    now = now or datetime.now()
+    today = now.date().isoformat()
+    offers_cutoff = now - timedelta(days=policy.keep_offers_days)
+    hourly_cutoff = now - timedelta(days=policy.hourly_after_days)
+    daily_cutoff = now - timedelta(days=policy.daily_after_days)
+
+    kept = []
+    buckets = {}
+    aggregated_ids = set()
+    pruned_ids = set()
+
+    for record in records:
+        timestamp = datetime.fromisoformat(record['timestamp'])
+        granularity = record.get('granularity')
+
+        if timestamp < daily_cutoff and granularity != 'day':
+            target = 'day'
+        elif timestamp < hourly_cutoff and granularity is None:
+            target = 'hour'
+        else:
+            target = granularity
+
+        if target is not None:
+            # Aggregati della stessa finestra vengono fusi tra loro e con i nuovi record
+            start = _bucket_start(timestamp, target)
+            key = (RouteSummaryIndex.route_key(record['route']), target, start)
+            buckets.setdefault(key, []).append(record)
+            continue
+
+        departed = policy.drop_departed_offers and record['route']['departure_date'] < today
+        if (timestamp < offers_cutoff or departed) and _has_offers(record):
+            record = _without_offers(record)
+            pruned_ids.add(record.get('id'))
+        kept.append(record)
+
+    for (_, granularity, start), group in buckets.items():
+        if len(group) == 1 and group[0].get('granularity') == granularity:
+            kept.append(group[0])
+            continue
+        kept.append(_aggregate(group, granularity, start))
+        aggregated_ids.update(r.get('id') for r in group)
+
+    kept.sort(key=lambda r: r['timestamp'])
+
+    return {
+        'records': kept,
+        'aggregated_ids': aggregated_ids,
+        'pruned_ids': pruned_ids,
+        'stats': {
+            'records_before': len(records),
+            'records_after': len(kept),
+            'aggregated': len(aggregated_ids),
+            'offers_pruned': len(pruned_ids)
+        }
+    }
+
+
+def _aggregate(group: List[Dict], granularity: str, start: datetime) -> Dict:
+    """Fonde ricerche e aggregati della stessa rotta e finestra in un solo aggregato"""
+    samples = priced = 0
+    low = high = None
+    cheapest_sum = average_sum = 0.0
+    average_count = 0
+    # Prima e ultima ricerca reali della finestra, per prezzo attuale e variazione
+    first = last = None
+
+    for record in sorted(group, key=lambda r: r['timestamp']):
+        record_samples = record.get('samples', 1)
+        record_priced = record.get('priced_samples', 1 if record.get('cheapest_price') is not None else 0)
+        samples += record_samples
+        priced += record_priced
+
+        if record_priced:
+            record_low = record['cheapest_price']
+            record_high = record.get('max_cheapest_price', record_low)
+            low = record_low if low is None else min(low, record_low)
+            high = record_high if high is None else max(high, record_high)
+            cheapest_sum += record.get('avg_cheapest_price', record_low) * record_priced
+            if first is None:
+                first = record.get('first_cheapest_price', record_low)
+            last_timestamp = record.get('last_timestamp', record['timestamp'])
+            if last is None or last_timestamp >= last[0]:
+                last = (last_timestamp, record.get('last_cheapest_price', record_low))
+        if record.get('average_price') is not None:
+            average_sum += record['average_price'] * record_samples
+            average_count += record_samples
+
+    return {
+        'id': uuid.uuid4().hex,
+        'timestamp': start.isoformat(),
+        'route': group[0]['route'],
+        'granularity': granularity,
+        'samples': samples,
+        'priced_samples': priced,
+        'offers_count': sum(r.get('offers_count', 0) for r in group),
+        'cheapest_price': low,
+        'avg_cheapest_price': cheapest_sum / priced if priced else None,
+        'max_cheapest_price': high,
+        'first_cheapest_price': first,
+        'last_cheapest_price': last[1] if last else None,
+        'last_timestamp': last[0] if last else max(r.get('last_timestamp', r['timestamp']) for r in group),
+        'average_price': average_sum / average_count if average_count else None,
+        'currency': group[0].get('currency', 'EUR'),
+        'offers_ref': None
+    }
+
+
+def _bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Inizio della finestra oraria o giornaliera che contiene il timestamp"""
+    if granularity == 'day':
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _has_offers(record: Dict) -> bool:
+    """True se il record ha ancora offerte incorporate o nell'archivio"""
+    return bool(record.get('offers')) or record.get('offers_ref') is not None
+
+
+def _without_offers(record: Dict) -> Dict:
+    """Copia del record senza offerte"""
+    record = {k: v for k, v in record.items() if k not in ('offers', 'offers_gen')}
+    record['offers_ref'] = None
+    return record
+
+
+def main():
+    from price_storage import create_storage
+
+    parser = argparse.ArgumentParser(description="Applica la politica di conservazione allo storico prezzi")
+    parser.add_argument('--keep-offers-days', type=int, default=7)
+    parser.add_argument('--hourly-after-days', type=int, default=7)
+    parser.add_argument('--daily-after-days', type=int, default=30)
+    parser.add_argument('--keep-departed-offers', action='store_true',
+                        help="Non eliminare le offerte delle rotte già partite")
+    args = parser.parse_args()
+
+    policy = RetentionPolicy(
+        keep_offers_days=args.keep_offers_days,
+        hourly_after_days=args.hourly_after_days,
+        daily_after_days=args.daily_after_days,
+        drop_departed_offers=not args.keep_departed_offers
+    )
+    stats = create_storage().apply_retention(policy)
+
+    print(f"✅ Record: {stats['records_before']} → {stats['records_after']}")
+    print(f"   Aggregati: {stats['aggregated']} | Offerte eliminate: {stats['offers_pruned']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Indice materializzato delle rotte monitorate
+Mantiene un riepilogo per rotta aggiornato a ogni salvataggio, così
+get_all_routes costa O(rotte) invece di O(ricerche)
+"""
+import json
+from typing import List, Dict, Iterable, Optional
+
+from file_lock import atomic_write_json
+
+
+class RouteSummaryIndex:
+    """Riepilogo incrementale (conteggi, ultimo prezzo, min/max/media) per rotta"""
+
+    def __init__(self, summaries: Optional[Dict[str, Dict]] = None):
+        """
+        Args:
+            summaries: Riepiloghi già calcolati, indicizzati per chiave rotta
+        """
+        self.summaries = summaries if summaries is not None else {}
+        self.metadata = {}
+
+    @classmethod
+    def build(cls, records: Iterable[Dict]) -> 'RouteSummaryIndex':
+        """Ricostruisce l'indice leggendo tutti i record di ricerca"""
+        index = cls()
+        for record in records:
+            index.update(record)
+        return index
+
+    @staticmethod
+    def route_key(route: Dict) -> str:
+        """Chiave univoca di una rotta (origine, destinazione, date)"""
+        return f"{route['origin']}-{route['destination']}-{route['departure_date']}-{route.get('return_date')}"
+
+    def update(self, record: Dict):
+        """Aggiorna il riepilogo della rotta con un nuovo record di ricerca"""
+        key = self.route_key(record['route'])
+        summary = self.summaries.get(key)
+        if summary is None:
+            summary = self.summaries[key] = {
+                'route': record['route'],
+                'searches_count': 0,
+                'records': 0,
+                'last_search': None,
+                'last_price': None,
+                'min_price': None,
+                'max_price': None,
+                'price_sum': 0.0,
+                'priced_count': 0
+            }
+
+        # Gli aggregati della retention valgono quanto le ricerche che riassumono
+        price = record.get('cheapest_price')
+        samples = record.get('samples', 1)
+        priced = record.get('priced_samples', 0 if price is None else 1)
+        summary['searches_count'] += samples
+        summary['records'] = summary.get('records', 0) + 1
+        summary['last_search'] = record.get('last_timestamp', record['timestamp'])
+        summary['last_price'] = record.get('last_cheapest_price', price)
+
+        if priced:
+            high = record.get('max_cheapest_price', price)
+            summary['min_price'] = price if summary['min_price'] is None else min(summary['min_price'], price)
+            summary['max_price'] = high if summary['max_price'] is None else max(summary['max_price'], high)
+            summary['price_sum'] += record.get('avg_cheapest_price', price) * priced
+            summary['priced_count'] += priced
+
+    def routes(self) -> List[Dict]:
+        """
+        Elenca le rotte nel formato di PriceStorage.get_all_routes
+
+        Returns:
+            List[Dict]: Una voce per rotta, in ordine di prima ricerca
+        """
+        return [self._entry(summary) for summary in self.summaries.values()]
+
+    def route(self, route: Dict) -> Optional[Dict]:
+        """Riepilogo di una rotta nel formato di get_all_routes (None se mai cercata)"""
+        summary = self.summaries.get(self.route_key(route))
+        return self._entry(summary) if summary else None
+
+    @staticmethod
+    def _entry(summary: Dict) -> Dict:
+        return {
+            'route': summary['route'],
+            'searches_count': summary['searches_count'],
+            'last_search': summary['last_search'],
+            'last_price': summary['last_price'],
+            'min_price': summary['min_price'],
+            'max_price': summary['max_price'],
+            'avg_price': (summary['price_sum'] / summary['priced_count']
+                          if summary['priced_count'] else None)
+        }
+
+    def searches_counts(self, routes: Iterable[Dict]) -> Dict[str, int]:
+        """Ricerche salvate per ciascuna delle rotte indicate (chiave rotta -> searches_count)"""
+        return {
+            key: self.summaries[key]['searches_count']
+            for key in map(self.route_key, routes)
+        }
+
+    def record_count(self) -> int:
+        """
+        Numero di record di ricerca letti dall'indice (un aggregato della
+        retention conta uno, anche se riassume più ricerche)
+        """
+        return sum(summary.get('records', summary['searches_count']) for summary in self.summaries.values())
+
+    @classmethod
+    def load(cls, path: str) -> Optional['RouteSummaryIndex']:
+        """Carica l'indice da file (None se assente o illeggibile)"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        index = cls(data.pop('routes', {}))
+        index.metadata = data
+        return index
+
+    def save(self, path: str, **metadata):
+        """
+        Salva l'indice su file in modo atomico
+
+        Args:
+            path: Path del file indice
+            **metadata: Campi aggiuntivi salvati accanto ai riepiloghi
+        """
+        atomic_write_json(path, dict(metadata, routes=self.summaries), ensure_ascii=False)
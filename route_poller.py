@@ -0,0 +1,311 @@
+"""
+Polling periodico delle rotte monitorate
+Riinterroga a intervalli regolari tutte le rotte di get_all_routes e salva i
+risultati nello storico, così i trend non dipendono dalle ricerche manuali.
+Le rotte sono in una coda a priorità per scadenza e vicinanza della partenza,
+eseguite da un pool di worker limitato; quelle già partite vengono scartate.
+Con --adaptive l'intervallo di ogni rotta dipende da volatilità del prezzo e
+giorni alla partenza (vedi polling_policy)
+
+Uso: python route_poller.py [--interval 3600] [--workers 4] [--once]
+                            [--adaptive --min-interval 900 --max-interval 86400]
+"""
+import argparse
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from amadeus_client import AmadeusFlightClient
+from polling_policy import AdaptivePollingPolicy
+from price_alerts import attach_alerts
+from price_storage import create_storage
+from rate_limiter import AmadeusUnavailableError
+from route_index import RouteSummaryIndex
+
+
+class RoutePoller:
+    """Scheduler delle ricerche periodiche sulle rotte dello storico"""
+
+    def __init__(self, client, storage, interval: float = 3600, max_workers: int = 4,
+                 refresh_interval: float = 300, max_results: int = 10,
+                 policy: Optional[AdaptivePollingPolicy] = None):
+        """
+        Args:
+            client: AmadeusFlightClient (o compatibile) per le ricerche
+            storage: Storage da cui leggere le rotte e in cui salvare i risultati
+            interval: Secondi tra due ricerche della stessa rotta
+            max_workers: Ricerche eseguite in parallelo
+            refresh_interval: Secondi tra due letture delle rotte dallo storage
+                (per includere quelle aggiunte nel frattempo)
+            max_results: Offerte richieste per ricerca
+            policy: Intervalli adattivi per rotta; in questo caso interval è
+                policy.base_interval, usato come riferimento del polling fisso
+        """
+        self.client = client
+        self.storage = storage
+        self.policy = policy
+        self.interval = policy.base_interval if policy else interval
+        self.max_workers = max_workers
+        self.refresh_interval = refresh_interval
+        self.max_results = max_results
+        if policy is not None and hasattr(storage, 'add_listener'):
+            # La policy tiene in memoria gli ultimi prezzi delle rotte
+            storage.add_listener(policy.observe)
+
+        # Voci della coda: (scadenza, giorni alla partenza, sequenza, chiave rotta)
+        self._queue: List[Tuple[float, int, int, str]] = []
+        self._routes: Dict[str, Dict] = {}
+        self._scheduled = set()
+        self._sequence = itertools.count()
+        self._last_refresh = None
+        self._last_polled: Dict[str, float] = {}
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'polls': 0,
+            'saved': 0,
+            'empty': 0,
+            'errors': 0,
+            'departed': 0,
+            # Ricerche che un polling fisso a `interval` avrebbe fatto nello stesso tempo
+            'fixed_schedule_calls': 0.0,
+            'api_calls_saved': 0.0
+        }
+
+    def refresh_routes(self, now: Optional[float] = None):
+        """
+        Aggiunge alla coda le rotte nuove dello storage, scarta quelle già partite
+        e dimentica quelle non più presenti (es. rimosse dalla retention)
+        """
+        now = time.time() if now is None else now
+        self._last_refresh = now
+        seen = set()
+
+        for entry in self.storage.get_all_routes():
+            route = entry['route']
+            key = RouteSummaryIndex.route_key(route)
+            seen.add(key)
+            if key in self._routes:
+                if self.policy is not None:
+                    self.policy.sync(route, entry['searches_count'])
+                continue
+            if self._days_to_departure(route) < 0:
+                continue
+
+            # La prossima ricerca è un intervallo dopo l'ultima già salvata
+            next_due = now
+            if entry.get('last_search'):
+                last_search = datetime.fromisoformat(entry['last_search']).timestamp()
+                interval = self._next_interval(route)
+                next_due = min(now + interval, last_search + interval)
+                self._last_polled[key] = last_search
+            self._routes[key] = route
+            self._schedule(key, next_due)
+
+        # Le voci in coda delle rotte rimosse vengono saltate all'estrazione
+        for key in [key for key in self._routes if key not in seen]:
+            route = self._routes.pop(key)
+            if self.policy is not None:
+                self.policy.forget(route)
+            with self._stats_lock:
+                self._last_polled.pop(key, None)
+
+    def run(self, stop_event: Optional[threading.Event] = None, once: bool = False):
+        """
+        Esegue il polling finché stop_event non viene impostato
+
+        Args:
+            stop_event: Evento per fermare il servizio (None per girare all'infinito)
+            once: Interroga una volta tutte le rotte e termina
+        """
+        stop_event = stop_event or threading.Event()
+        self.refresh_routes()
+        if once:
+            # Tutte le rotte diventano subito scadute, e non vengono ripianificate
+            self._queue = [(0, days, seq, key) for _, days, seq, key in self._queue]
+            heapq.heapify(self._queue)
+
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while not stop_event.is_set():
+                now = time.time()
+                if not once and now - self._last_refresh >= self.refresh_interval:
+                    self.refresh_routes(now)
+
+                # Avvia le rotte scadute finché ci sono worker liberi
+                while self._queue and self._queue[0][0] <= now and len(in_flight) < self.max_workers:
+                    _, _, _, key = heapq.heappop(self._queue)
+                    self._scheduled.discard(key)
+                    route = self._routes.get(key)
+                    if route is None:
+                        continue
+                    if self._days_to_departure(route) < 0:
+                        del self._routes[key]
+                        if self.policy is not None:
+                            self.policy.forget(route)
+                        self._incr('departed')
+                        continue
+                    in_flight[executor.submit(self._poll, key, route)] = key
+
+                if once and not self._queue and not in_flight:
+                    break
+
+                # Attende la fine di una ricerca o la prossima scadenza; con tutti
+                # i worker occupati la scadenza non conta (sarebbe un timeout 0)
+                timeout = self.refresh_interval
+                if self._queue and len(in_flight) < self.max_workers:
+                    timeout = min(timeout, max(0.0, self._queue[0][0] - time.time()))
+                if in_flight:
+                    done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        key = in_flight.pop(future)
+                        next_interval = future.result()
+                        if not once:
+                            self._schedule(key, time.time() + next_interval)
+                else:
+                    stop_event.wait(timeout)
+
+            # Fermato: attende le ricerche già in corso
+            for future in in_flight:
+                future.result()
+        self._settle_fixed_schedule()
+
+    def _poll(self, key: str, route: Dict) -> float:
+        """
+        Esegue la ricerca di una rotta e salva il risultato
+
+        Returns:
+            float: Secondi fino alla prossima ricerca della rotta
+        """
+        self._count_poll(key)
+        origin = route['origin']
+        destination = route['destination']
+        departure_date = route['departure_date']
+        return_date = route.get('return_date')
+
+        try:
+            if return_date:
+                offers = self.client.search_round_trip(
+                    origin, destination, departure_date, return_date,
+                    max_results=self.max_results
+                )
+            else:
+                offers = self.client.search_flights(
+                    origin, destination, departure_date,
+                    max_results=self.max_results
+                )
+            if offers:
+                self.storage.save_search(origin, destination, departure_date, return_date, offers)
+        except AmadeusUnavailableError as e:
+            print(f"⚠️ {origin}→{destination} {departure_date}: {e}")
+            self._incr('errors')
+            return self.interval
+        except Exception as e:
+            # Un errore su una rotta (API, lock, disco) non deve fermare il polling
+            print(f"❌ {origin}→{destination} {departure_date}: {type(e).__name__}: {e}")
+            self._incr('errors')
+            return self.interval
+
+        self._incr('saved' if offers else 'empty')
+
+        return self._next_interval(route)
+
+    def _next_interval(self, route: Dict) -> float:
+        """Intervallo fino alla prossima ricerca (adattivo se c'è una policy)"""
+        if self.policy is None:
+            return self.interval
+        try:
+            return self.policy.interval_for(route, self.storage)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Intervallo adattivo non calcolabile per {route['origin']}→{route['destination']}: {e}")
+            return self.interval
+
+    def _count_poll(self, key: str):
+        """Conta la ricerca e quante ne avrebbe fatte un polling fisso dalla precedente"""
+        now = time.time()
+        with self._stats_lock:
+            previous = self._last_polled.get(key)
+            self._last_polled[key] = now
+            self.stats['polls'] += 1
+            self.stats['fixed_schedule_calls'] += 1 if previous is None else (now - previous) / self.interval
+            self.stats['api_calls_saved'] = self.stats['fixed_schedule_calls'] - self.stats['polls']
+
+    def _settle_fixed_schedule(self):
+        """Aggiunge al confronto le ricerche fisse dall'ultima di ogni rotta fino a ora"""
+        now = time.time()
+        with self._stats_lock:
+            for key, previous in self._last_polled.items():
+                self.stats['fixed_schedule_calls'] += max(0.0, now - previous) / self.interval
+                self._last_polled[key] = now
+            self.stats['api_calls_saved'] = self.stats['fixed_schedule_calls'] - self.stats['polls']
+
+    def _schedule(self, key: str, next_due: float):
+        """Inserisce la rotta nella coda (una sola voce per rotta)"""
+        if key in self._scheduled or key not in self._routes:
+            return
+        self._scheduled.add(key)
+        days = self._days_to_departure(self._routes[key])
+        heapq.heappush(self._queue, (next_due, days, next(self._sequence), key))
+
+    def _incr(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    @staticmethod
+    def _days_to_departure(route: Dict) -> int:
+        """Giorni mancanti alla partenza (negativi se la data è passata)"""
+        departure = datetime.strptime(route['departure_date'], '%Y-%m-%d').date()
+        return (departure - date.today()).days
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--interval', type=float, default=3600, help="Secondi tra due ricerche della stessa rotta")
+    parser.add_argument('--workers', type=int, default=4, help="Ricerche in parallelo")
+    parser.add_argument('--refresh', type=float, default=300, help="Secondi tra due letture delle rotte")
+    parser.add_argument('--once', action='store_true', help="Interroga una volta tutte le rotte e termina")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="Intervallo per rotta in base a volatilità e giorni alla partenza")
+    parser.add_argument('--min-interval', type=float, default=900, help="Intervallo minimo adattivo")
+    parser.add_argument('--max-interval', type=float, default=24 * 3600, help="Intervallo massimo adattivo")
+    args = parser.parse_args()
+
+    client = AmadeusFlightClient()
+    storage = create_storage()
+    attach_alerts(storage)
+    policy = None
+    if args.adaptive:
+        policy = AdaptivePollingPolicy(base_interval=args.interval, min_interval=args.min_interval,
+                                       max_interval=args.max_interval)
+    poller = RoutePoller(client, storage, interval=args.interval, max_workers=args.workers,
+                         refresh_interval=args.refresh, policy=policy)
+
+    print("\n" + "=" * 50)
+    print("🔄 POLLING ROTTE")
+    print("=" * 50)
+    print(f"Intervallo: {args.interval:.0f}s{' (adattivo)' if policy else ''} | Worker: {args.workers}")
+    print("Premi CTRL+C per terminare\n")
+
+    stop_event = threading.Event()
+    try:
+        poller.run(stop_event, once=args.once)
+    except KeyboardInterrupt:
+        stop_event.set()
+    finally:
+        if hasattr(storage, 'close'):
+            storage.close()
+
+    stats = poller.stats
+    print(f"\n📊 Ricerche: {stats['polls']} | Salvate: {stats['saved']} | "
+          f"Senza offerte: {stats['empty']} | Errori: {stats['errors']} | "
+          f"Rotte partite: {stats['departed']}")
+    if policy:
+        print(f"💰 Chiamate API risparmiate rispetto al polling fisso: "
+              f"{stats['api_calls_saved']:.0f} su {stats['fixed_schedule_calls']:.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,462 @@
+"""
+Storage a log append-only segmentato per lo storico dei prezzi dei voli
+Ogni ricerca è una riga JSON aggiunta in coda al segmento attivo: un
+salvataggio costa O(1) e un crash può corrompere solo l'ultima riga
+"""
+import json
+import os
+import re
+import threading
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple
+
+from file_lock import FileLock, atomic_write_json
+from offer_store import OfferStore
+from price_storage import PriceStorage
+from retention import RetentionPolicy, apply_retention
+from route_index import RouteSummaryIndex
+
+
+SEGMENT_PATTERN = re.compile(r'^segment-(\d{6})\.jsonl$')
+
+
+class SegmentLogPriceStorage(PriceStorage):
+    """Gestisce lo storico prezzi come log di segmenti JSONL"""
+
+    def __init__(self, db_file='price_history_log', max_segment_bytes=4 * 1024 * 1024,
+                 compact_target_bytes=None, compact_interval=300, fsync=False):
+        """
+        Inizializza lo storage a segmenti
+
+        Args:
+            db_file (str): Directory che contiene i segmenti
+            max_segment_bytes (int): Dimensione oltre la quale il segmento attivo viene chiuso
+            compact_target_bytes (int): Dimensione massima dei segmenti prodotti dalla
+                compattazione (default: 16 volte max_segment_bytes)
+            compact_interval (int): Secondi tra due compattazioni in background
+                (0 o None per disattivarle)
+            fsync (bool): Forza la scrittura su disco dopo ogni salvataggio
+        """
+        self.max_segment_bytes = max_segment_bytes
+        self.compact_target_bytes = compact_target_bytes or max_segment_bytes * 16
+        self.fsync = fsync
+
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._indexes: Dict[int, Dict[str, List[int]]] = {}
+        self._active = 1
+        self._routes_index = RouteSummaryIndex()
+
+        super().__init__(db_file)
+
+        self._stop = threading.Event()
+        self._compactor = None
+        if compact_interval:
+            self._compactor = threading.Thread(
+                target=self._compaction_loop, args=(compact_interval,), daemon=True
+            )
+            self._compactor.start()
+
+    def _ensure_db_exists(self):
+        """Crea la directory e carica gli indici dei segmenti esistenti"""
+        os.makedirs(self.db_file, exist_ok=True)
+
+        # Gli indici vivono in memoria nel processo che scrive: un solo processo
+        # alla volta può aprire il log (con più worker usare il backend sqlite)
+        self._owner_lock = FileLock(os.path.join(self.db_file, 'LOCK'))
+        if not self._owner_lock.acquire(blocking=False):
+            raise RuntimeError(
+                f"Il log {self.db_file} è già aperto da un altro processo"
+            )
+
+        self.offer_store = OfferStore(os.path.join(self.db_file, 'offers.jsonl'))
+
+        self.merge_file = os.path.join(self.db_file, 'merge.json')
+        self._recover_merge()
+
+        numbers = self._segment_numbers()
+        if not numbers:
+            numbers = [1]
+            open(self._segment_path(1), 'ab').close()
+
+        for number in numbers[:-1]:
+            self._indexes[number] = self._load_index(number)
+
+        # Il segmento attivo viene sempre riscansionato (ed eventualmente riparato)
+        self._active = numbers[-1]
+        self._indexes[self._active] = self._scan_segment(self._segment_path(self._active), repair=True)
+
+        # Il riepilogo rotte salvato copre i segmenti fino a through_segment:
+        # quelli successivi vengono rigiocati
+        self.routes_file = os.path.join(self.db_file, 'routes.json')
+        self._routes_index = RouteSummaryIndex.load(self.routes_file) or RouteSummaryIndex()
+        through = self._routes_index.metadata.get('through_segment', 0)
+        for number in numbers:
+            if number > through:
+                for _, _, record in self._iter_lines(self._segment_path(number)):
+                    if record is not None:
+                        self._routes_index.update(record)
+
+    def save_searches(self, searches: Iterable[Dict]) -> int:
+        """
+        Salva più ricerche aprendo il segmento attivo una sola volta
+
+        Args:
+            searches: Dict con origin, destination, departure_date,
+                      return_date (opzionale) e offers, come per save_search
+
+        Returns:
+            int: Numero di ricerche salvate
+        """
+        searches = list(searches)
+
+        # Le offerte vengono scritte sotto lo stesso lock del log: apply_retention
+        # (che lo tiene) non può compattarle o eliminarne la generazione a metà salvataggio
+        with self._lock:
+            search_records = [
+                self._store_offers(self._build_search_record(
+                    search['origin'], search['destination'], search['departure_date'],
+                    search.get('return_date'), search['offers']
+                ))
+                for search in searches
+            ]
+            f = None
+            try:
+                for search_record in search_records:
+                    line = (json.dumps(search_record, ensure_ascii=False) + '\n').encode('utf-8')
+                    if f is None:
+                        f = open(self._segment_path(self._active), 'ab')
+                    offset = f.tell()
+                    f.write(line)
+
+                    key = self._route_key(search_record['route'])
+                    self._indexes[self._active].setdefault(key, []).append(offset)
+                    self._routes_index.update(search_record)
+
+                    if offset + len(line) >= self.max_segment_bytes:
+                        self._close_segment_file(f)
+                        f = None
+                        self._roll_segment()
+            finally:
+                if f is not None:
+                    self._close_segment_file(f)
+            searches_counts = self._routes_index.searches_counts(record['route'] for record in search_records)
+
+        self._notify(search_records, searches_counts)
+        return len(search_records)
+
+    def _close_segment_file(self, f):
+        """Scarica su disco e chiude il file del segmento attivo"""
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+        f.close()
+
+    def get_price_history(self, origin: str, destination: str,
+                         departure_date: str, return_date: Optional[str] = None,
+                         include_offers: bool = False) -> List[Dict]:
+        """
+        Recupera lo storico prezzi per una specifica rotta
+
+        Args:
+            include_offers: Carica anche le offerte complete di ogni ricerca
+
+        Returns:
+            List[Dict]: Lista degli storici di ricerca per quella rotta
+        """
+        key = self._route_key({
+            'origin': origin,
+            'destination': destination,
+            'departure_date': departure_date,
+            'return_date': return_date
+        })
+
+        with self._lock:
+            history = []
+            for number in sorted(self._indexes):
+                offsets = self._indexes[number].get(key)
+                # I segmenti senza la rotta non vengono nemmeno aperti
+                if offsets:
+                    history.extend(self._read_records(number, offsets))
+        return self._attach_offers(history, include_offers)
+
+    def get_all_routes(self) -> List[Dict]:
+        """
+        Recupera tutte le rotte monitorate
+
+        Returns:
+            List[Dict]: Lista delle rotte uniche monitorate
+        """
+        with self._lock:
+            return self._routes_index.routes()
+
+    def get_route_summary(self, route: Dict) -> Optional[Dict]:
+        """Riepilogo di una sola rotta (None se mai cercata)"""
+        with self._lock:
+            return self._routes_index.route(route)
+
+    def compact(self) -> int:
+        """
+        Unisce i segmenti chiusi consecutivi fino a compact_target_bytes,
+        scartando le righe corrotte
+
+        Returns:
+            int: Numero di segmenti eliminati
+        """
+        with self._compact_lock:
+            with self._lock:
+                sealed = [n for n in sorted(self._indexes) if n != self._active]
+
+            removed = 0
+            for run in self._compaction_runs(sealed):
+                self._merge_segments(run)
+                removed += len(run) - 1
+            return removed
+
+    def apply_retention(self, policy: Optional[RetentionPolicy] = None) -> Dict:
+        """
+        Applica la politica di conservazione riscrivendo l'intero log:
+        toglie le offerte alle ricerche vecchie o già partite e aggrega
+        per ora/giorno le ricerche più vecchie
+
+        Args:
+            policy: Politica da applicare (default: RetentionPolicy())
+
+        Returns:
+            Dict: Statistiche dell'operazione
+        """
+        with self._compact_lock, self._lock:
+            records = [
+                record
+                for number in sorted(self._indexes)
+                for _, _, record in self._iter_lines(self._segment_path(number))
+                if record is not None
+            ]
+            result = apply_retention(records, policy or RetentionPolicy())
+            kept = result['records']
+
+            # Il vecchio file delle offerte viene eliminato solo dopo che il log
+            # riscritto punta a quello nuovo
+            mapping = self.offer_store.compact(
+                ref for ref in map(OfferStore.record_ref, kept) if ref is not None
+            )
+            for record in kept:
+                ref = OfferStore.record_ref(record)
+                if ref is not None:
+                    OfferStore.set_record_ref(record, mapping[ref])
+
+            self._rewrite_log(kept)
+            self.offer_store.commit_compaction()
+        return result['stats']
+
+    def _rewrite_log(self, records: List[Dict]):
+        """Scrive i record in nuovi segmenti ed elimina quelli vecchi"""
+        old_numbers = sorted(self._indexes)
+        number = old_numbers[-1] + 1
+        indexes = {number: {}}
+        active_start = 0
+
+        out = open(self._segment_path(number), 'wb')
+        try:
+            for position, record in enumerate(records):
+                key = self._route_key(record['route'])
+                indexes[number].setdefault(key, []).append(out.tell())
+                out.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+
+                if out.tell() >= self.max_segment_bytes:
+                    out.flush()
+                    os.fsync(out.fileno())
+                    out.close()
+                    self._write_index(number, indexes[number])
+                    number += 1
+                    indexes[number] = {}
+                    active_start = position + 1
+                    out = open(self._segment_path(number), 'wb')
+            out.flush()
+            os.fsync(out.fileno())
+        finally:
+            out.close()
+
+        # Il riepilogo persistito copre solo i segmenti chiusi, come dopo un roll
+        routes_index = RouteSummaryIndex.build(records[:active_start])
+        routes_index.save(self.routes_file, through_segment=number - 1)
+        for record in records[active_start:]:
+            routes_index.update(record)
+
+        for old in old_numbers:
+            os.remove(self._segment_path(old))
+            if os.path.exists(self._index_path(old)):
+                os.remove(self._index_path(old))
+
+        self._indexes = indexes
+        self._active = number
+        self._routes_index = routes_index
+
+    def close(self):
+        """Ferma la compattazione in background e rilascia il log"""
+        self._stop.set()
+        if self._compactor:
+            self._compactor.join()
+        self._owner_lock.release()
+
+    def _compaction_loop(self, interval: int):
+        """Esegue periodicamente la compattazione finché lo storage è aperto"""
+        while not self._stop.wait(interval):
+            try:
+                self.compact()
+            except OSError as error:
+                print(f"Errore compattazione segmenti: {error}")
+
+    def _compaction_runs(self, sealed: List[int]) -> Iterator[List[int]]:
+        """Raggruppa i segmenti chiusi in sequenze da unire"""
+        run, run_size = [], 0
+        for number in sealed:
+            size = os.path.getsize(self._segment_path(number))
+            if run and run_size + size > self.compact_target_bytes:
+                if len(run) > 1:
+                    yield run
+                run, run_size = [], 0
+            run.append(number)
+            run_size += size
+        if len(run) > 1:
+            yield run
+
+    def _merge_segments(self, run: List[int]):
+        """
+        Riscrive una sequenza di segmenti chiusi in un unico segmento
+
+        L'unione è confermata dal file merge.json, scritto prima di sostituire
+        il primo segmento: se il processo si interrompe a metà, all'apertura
+        _recover_merge la completa (o scarta la copia non confermata)
+        """
+        target = run[0]
+        tmp_path = self._segment_path(target) + '.compact'
+
+        # I segmenti chiusi sono immutabili: la copia avviene senza bloccare le scritture
+        index = {}
+        with open(tmp_path, 'wb') as out:
+            for number in run:
+                for _, line, record in self._iter_lines(self._segment_path(number)):
+                    if record is None:
+                        continue
+                    index.setdefault(self._route_key(record['route']), []).append(out.tell())
+                    out.write(line)
+            out.flush()
+            os.fsync(out.fileno())
+
+        with self._lock:
+            atomic_write_json(self.merge_file, {'target': target, 'sources': run[1:]})
+            self._finish_merge(target, run[1:])
+            self._write_index(target, index)
+            os.remove(self.merge_file)
+
+            self._indexes[target] = index
+            for number in run[1:]:
+                del self._indexes[number]
+
+    def _finish_merge(self, target: int, sources: List[int]):
+        """Mette al suo posto il segmento unito ed elimina i segmenti sorgente (idempotente)"""
+        tmp_path = self._segment_path(target) + '.compact'
+        if os.path.exists(tmp_path):
+            os.replace(tmp_path, self._segment_path(target))
+        for path in [self._index_path(target)] + [
+            path for number in sources
+            for path in (self._segment_path(number), self._index_path(number))
+        ]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _recover_merge(self):
+        """Completa l'unione confermata interrotta da un crash e scarta le copie non confermate"""
+        try:
+            with open(self.merge_file, 'r', encoding='utf-8') as f:
+                merge = json.load(f)
+        except FileNotFoundError:
+            merge = None
+
+        if merge is not None:
+            # L'indice del segmento unito viene ricostruito da _load_index
+            self._finish_merge(merge['target'], merge['sources'])
+            os.remove(self.merge_file)
+
+        for name in os.listdir(self.db_file):
+            if name.endswith('.jsonl.compact'):
+                os.remove(os.path.join(self.db_file, name))
+
+    def _roll_segment(self):
+        """Chiude il segmento attivo e ne apre uno nuovo"""
+        self._write_index(self._active, self._indexes[self._active])
+        self._routes_index.save(self.routes_file, through_segment=self._active)
+        self._active += 1
+        open(self._segment_path(self._active), 'ab').close()
+        self._indexes[self._active] = {}
+
+    def _read_records(self, number: int, offsets: List[int]) -> List[Dict]:
+        """Legge i record alle posizioni indicate di un segmento"""
+        records = []
+        with open(self._segment_path(number), 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                records.append(json.loads(f.readline()))
+        return records
+
+    def _load_index(self, number: int) -> Dict[str, List[int]]:
+        """Carica l'indice di un segmento chiuso, ricostruendolo se manca"""
+        try:
+            with open(self._index_path(number), 'r', encoding='utf-8') as f:
+                return json.load(f)['routes']
+        except (OSError, ValueError, KeyError):
+            index = self._scan_segment(self._segment_path(number))
+            self._write_index(number, index)
+            return index
+
+    def _write_index(self, number: int, index: Dict[str, List[int]]):
+        """Salva l'indice di un segmento in modo atomico"""
+        atomic_write_json(self._index_path(number), {'routes': index})
+
+    def _scan_segment(self, path: str, repair: bool = False) -> Dict[str, List[int]]:
+        """
+        Costruisce l'indice rotta -> offset leggendo un segmento
+
+        Args:
+            path: Path del segmento
+            repair: Tronca l'ultima riga se incompleta (scrittura interrotta)
+        """
+        index = {}
+        for offset, line, record in self._iter_lines(path):
+            if not line.endswith(b'\n'):
+                if repair:
+                    with open(path, 'r+b') as f:
+                        f.truncate(offset)
+                break
+            if record is not None:
+                index.setdefault(self._route_key(record['route']), []).append(offset)
+        return index
+
+    @staticmethod
+    def _iter_lines(path: str) -> Iterator[Tuple[int, bytes, Optional[Dict]]]:
+        """Restituisce (offset, riga, record) per ogni riga; record è None se corrotta"""
+        with open(path, 'rb') as f:
+            offset = 0
+            for line in f:
+                try:
+                    record = json.loads(line) if line.endswith(b'\n') else None
+                except ValueError:
+                    record = None
+                yield offset, line, record
+                offset += len(line)
+
+    def _segment_numbers(self) -> List[int]:
+        """Numeri dei segmenti presenti su disco, in ordine"""
+        return sorted(
+            int(match.group(1))
+            for match in map(SEGMENT_PATTERN.match, os.listdir(self.db_file))
+            if match
+        )
+
+    def _segment_path(self, number: int) -> str:
+        """Path del file di un segmento"""
+        return os.path.join(self.db_file, f'segment-{number:06d}.jsonl')
+
+    def _index_path(self, number: int) -> str:
+        """Path dell'indice di un segmento"""
+        return os.path.join(self.db_file, f'segment-{number:06d}.idx.json')
@@ -0,0 +1,421 @@
+"""
+Polling delle rotte su più processi
+Le rotte di get_all_routes sono divise tra N processi worker con un hash
+consistente: ogni worker ha il proprio AmadeusFlightClient e un RoutePoller
+che interroga solo le rotte del suo shard. Il coordinatore riassegna gli shard
+quando un worker si aggiunge o termina (spostando solo le rotte necessarie),
+divide la quota API tra i worker e scrive i risultati nello storage a blocchi:
+è l'unico processo che scrive, quindi funziona con tutti i backend
+
+Uso: python sharded_poller.py [--workers 4] [--threads 2] [--interval 3600] [--once]
+Su Linux/macOS: kill -USR1 <pid> aggiunge un worker, kill -USR2 <pid> ne toglie uno
+"""
+import argparse
+import bisect
+import hashlib
+import itertools
+import multiprocessing
+import queue
+import signal
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Iterable, List, Optional
+
+from amadeus_client import AmadeusFlightClient
+from price_alerts import attach_alerts
+from price_storage import create_storage
+from rate_limiter import RateLimiter
+from route_index import RouteSummaryIndex
+from route_poller import RoutePoller
+
+
+def _hash(value: str) -> int:
+    """Hash stabile tra processi (hash() di Python cambia a ogni avvio)"""
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Anello di hash consistente: aggiungere o togliere un nodo sposta solo le sue chiavi"""
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 100):
+        """
+        Args:
+            nodes: Nodi iniziali
+            replicas: Punti sull'anello per nodo (più punti, shard più uniformi)
+        """
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = {}
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            self._owners[point] = node
+            bisect.insort(self._points, point)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            if self._owners.get(point) == node:
+                del self._owners[point]
+                self._points.remove(point)
+
+    def node_for(self, key: str) -> Optional[str]:
+        """Nodo proprietario della chiave (None se l'anello è vuoto)"""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+
+class ShardStorage:
+    """
+    Storage visto da un worker: legge le rotte del proprio shard e invia i
+    risultati al coordinatore invece di scriverli
+    """
+
+    def __init__(self, results):
+        self.results = results
+        self._routes: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def assign(self, routes: List[Dict]):
+        with self._lock:
+            self._routes = routes
+
+    def get_all_routes(self) -> List[Dict]:
+        with self._lock:
+            return list(self._routes)
+
+    def save_search(self, origin: str, destination: str, departure_date: str,
+                    return_date: Optional[str], offers: List[Dict]):
+        self.results.put(('search', {
+            'origin': origin,
+            'destination': destination,
+            'departure_date': departure_date,
+            'return_date': return_date,
+            'offers': offers
+        }))
+
+
+def run_worker(worker_id: str, inbox, results, options: Dict):
+    """
+    Processo worker: attende lo shard dal coordinatore e lo interroga finché
+    non riceve 'stop' (o, con once, una sola volta)
+    """
+    # CTRL+C arriva a tutto il gruppo: a fermare i worker ci pensa il coordinatore
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # La quota dell'account è divisa tra i worker attivi
+    limiter = RateLimiter.from_env()
+    total_rate, total_burst = limiter.rate, limiter.burst
+
+    shard = ShardStorage(results)
+    client = AmadeusFlightClient(rate_limiter=limiter)
+    poller = RoutePoller(client, shard, interval=options['interval'],
+                         max_workers=options['threads'],
+                         refresh_interval=options['reassign_delay'])
+    stop_event = threading.Event()
+    thread = None
+
+    while True:
+        command, payload = inbox.get()
+        if command == 'stop':
+            break
+        if command == 'assign':
+            workers = payload['workers']
+            limiter.set_rate(total_rate / workers, max(1, total_burst // workers))
+            shard.assign(payload['routes'])
+            if options['once']:
+                poller.run(stop_event, once=True)
+                break
+            if thread is None:
+                thread = threading.Thread(target=_run_poller, args=(poller, stop_event, inbox), daemon=True)
+                thread.start()
+        if command == 'crashed':
+            # Il processo esce con errore senza statistiche: il coordinatore lo
+            # considera perso e riassegna lo shard agli altri worker
+            print(f"❌ {worker_id}: polling interrotto ({payload})")
+            sys.exit(1)
+
+    stop_event.set()
+    if thread is not None:
+        thread.join()
+    results.put(('stats', worker_id, poller.stats))
+
+
+def _run_poller(poller: RoutePoller, stop_event: threading.Event, inbox):
+    """Thread di polling del worker: un errore non gestito ferma il worker"""
+    try:
+        poller.run(stop_event)
+    except Exception as e:
+        traceback.print_exc()
+        inbox.put(('crashed', f"{type(e).__name__}: {e}"))
+
+
+class ShardCoordinator:
+    """Avvia i worker, assegna gli shard e raccoglie i risultati nello storage"""
+
+    def __init__(self, storage, workers: int = 4, threads: int = 2, interval: float = 3600,
+                 refresh_interval: float = 300, reassign_delay: float = 5,
+                 flush_interval: float = 5, batch_size: int = 200, once: bool = False):
+        """
+        Args:
+            storage: Storage condiviso (letto per le rotte, scritto con save_searches)
+            workers: Processi worker iniziali
+            threads: Ricerche in parallelo per worker
+            interval: Secondi tra due ricerche della stessa rotta
+            refresh_interval: Secondi tra due letture delle rotte dallo storage
+            reassign_delay: Secondi entro cui un worker applica un nuovo shard
+            flush_interval: Secondi massimi prima di scrivere i risultati ricevuti
+            batch_size: Ricerche per scrittura
+            once: Ogni worker interroga una volta il proprio shard e termina
+        """
+        self.storage = storage
+        self.initial_workers = workers
+        self.options = {
+            'threads': threads,
+            'interval': interval,
+            'reassign_delay': reassign_delay,
+            'once': once
+        }
+        self.refresh_interval = refresh_interval
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.once = once
+
+        # spawn: i worker non ereditano connessioni e lock dello storage
+        self._context = multiprocessing.get_context('spawn')
+        self.results = self._context.Queue()
+        self.ring = HashRing()
+        self._workers: Dict[str, tuple] = {}
+        self._worker_ids = itertools.count(1)
+        self._owners: Dict[str, str] = {}
+        self._pending: List[Dict] = []
+        self._last_flush = time.time()
+        self._last_refresh = 0.0
+        self._rebalance_needed = False
+        self._scale_requests = 0
+
+        self.stats = {
+            'searches': 0,
+            'writes': 0,
+            'rebalances': 0,
+            'moved_routes': 0,
+            'workers_lost': 0
+        }
+        self.worker_stats: Dict[str, Dict] = {}
+
+    def add_worker(self) -> str:
+        """Avvia un worker e lo inserisce nell'anello (lo shard arriva al prossimo ribilanciamento)"""
+        worker_id = f"worker-{next(self._worker_ids)}"
+        inbox = self._context.Queue()
+        process = self._context.Process(
+            target=run_worker, args=(worker_id, inbox, self.results, self.options),
+            name=worker_id, daemon=True
+        )
+        process.start()
+        self._workers[worker_id] = (process, inbox)
+        self.ring.add(worker_id)
+        self._rebalance_needed = True
+        print(f"➕ {worker_id} avviato (pid {process.pid})")
+        return worker_id
+
+    def remove_worker(self, worker_id: Optional[str] = None) -> Optional[str]:
+        """Ferma un worker (l'ultimo avviato se non indicato); le sue rotte passano agli altri"""
+        active = sorted(self.ring.nodes, key=lambda w: int(w.split('-')[1]))
+        if worker_id is None and active:
+            worker_id = active[-1]
+        if worker_id not in self.ring.nodes or len(active) == 1:
+            return None
+        self.ring.remove(worker_id)
+        self._workers[worker_id][1].put(('stop', None))
+        self._rebalance_needed = True
+        print(f"➖ {worker_id} in chiusura")
+        return worker_id
+
+    def request_scale(self, delta: int):
+        """Chiede di aggiungere (delta > 0) o togliere worker al prossimo giro (es. da un segnale)"""
+        self._scale_requests += delta
+
+    def rebalance(self):
+        """Ricalcola gli shard dalle rotte dello storage e li invia ai worker"""
+        self.flush()
+        shards = {worker_id: [] for worker_id in self.ring.nodes}
+        owners = {}
+        moved = 0
+
+        for entry in self.storage.get_all_routes():
+            if RoutePoller._days_to_departure(entry['route']) < 0:
+                continue
+            key = RouteSummaryIndex.route_key(entry['route'])
+            owner = self.ring.node_for(key)
+            owners[key] = owner
+            if key in self._owners and self._owners[key] != owner:
+                moved += 1
+            shards[owner].append({'route': entry['route'], 'last_search': entry.get('last_search')})
+
+        for worker_id, routes in shards.items():
+            self._workers[worker_id][1].put(('assign', {'routes': routes, 'workers': len(shards)}))
+
+        self._owners = owners
+        self._last_refresh = time.time()
+        self._rebalance_needed = False
+        self.stats['rebalances'] += 1
+        self.stats['moved_routes'] += moved
+        sizes = ', '.join(f"{w}: {len(r)}" for w, r in sorted(shards.items()))
+        print(f"🔀 Shard assegnati ({len(owners)} rotte, {moved} spostate) - {sizes}")
+
+    def flush(self):
+        """Scrive nello storage i risultati ricevuti"""
+        if self._pending:
+            self.storage.save_searches(self._pending)
+            self.stats['writes'] += 1
+            self._pending = []
+        self._last_flush = time.time()
+
+    def run(self, stop_event: Optional[threading.Event] = None):
+        """
+        Coordina i worker finché stop_event non viene impostato (o, con once,
+        finché tutti hanno interrogato il proprio shard)
+        """
+        stop_event = stop_event or threading.Event()
+        for _ in range(self.initial_workers):
+            self.add_worker()
+
+        try:
+            while not stop_event.is_set():
+                self._drain(timeout=0.5)
+                self._check_workers()
+                if not self.ring.nodes:
+                    if not self.once:
+                        print("❌ Nessun worker attivo")
+                    break
+
+                while self._scale_requests > 0 and not self.once:
+                    self._scale_requests -= 1
+                    self.add_worker()
+                while self._scale_requests < 0 and not self.once:
+                    self._scale_requests += 1
+                    self.remove_worker()
+
+                if self._rebalance_needed or (
+                        not self.once and time.time() - self._last_refresh >= self.refresh_interval):
+                    self.rebalance()
+
+                if len(self._pending) >= self.batch_size or \
+                        time.time() - self._last_flush >= self.flush_interval:
+                    self.flush()
+        finally:
+            self._shutdown()
+
+    def _check_workers(self):
+        """Toglie dall'anello i worker terminati, per once quelli che hanno finito"""
+        for worker_id, (process, _) in list(self._workers.items()):
+            if process.is_alive():
+                continue
+            if worker_id not in self.worker_stats:
+                # Le statistiche inviate prima di uscire possono essere ancora in coda
+                self._drain(timeout=0.2)
+            if worker_id in self.ring.nodes:
+                self.ring.remove(worker_id)
+                if worker_id not in self.worker_stats:
+                    self.stats['workers_lost'] += 1
+                    print(f"⚠️ {worker_id} terminato (codice {process.exitcode}), shard riassegnato")
+                    self._rebalance_needed = not self.once
+            if worker_id in self.worker_stats:
+                del self._workers[worker_id]
+
+    def _drain(self, timeout: float):
+        """Riceve i messaggi dei worker (attende al più timeout per il primo)"""
+        while True:
+            try:
+                message = self.results.get(timeout=timeout)
+            except queue.Empty:
+                return
+            timeout = 0
+            if message[0] == 'search':
+                self._pending.append(message[1])
+                self.stats['searches'] += 1
+            elif message[0] == 'stats':
+                self.worker_stats[message[1]] = message[2]
+
+    def _shutdown(self):
+        """Ferma i worker, raccoglie gli ultimi risultati e li scrive"""
+        for worker_id, (process, inbox) in self._workers.items():
+            if process.is_alive():
+                inbox.put(('stop', None))
+        # La coda va svuotata prima del join, altrimenti i worker restano bloccati
+        while any(process.is_alive() for process, _ in self._workers.values()):
+            self._drain(timeout=0.2)
+        self._drain(timeout=0.2)
+        for process, _ in self._workers.values():
+            process.join()
+        self.flush()
+
+    def summary(self) -> Dict:
+        """Statistiche del coordinatore e somma di quelle dei worker"""
+        totals = {}
+        for stats in self.worker_stats.values():
+            for name, value in stats.items():
+                totals[name] = totals.get(name, 0) + value
+        return dict(self.stats, workers=totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help="Processi worker")
+    parser.add_argument('--threads', type=int, default=2, help="Ricerche in parallelo per worker")
+    parser.add_argument('--interval', type=float, default=3600, help="Secondi tra due ricerche della stessa rotta")
+    parser.add_argument('--refresh', type=float, default=300, help="Secondi tra due letture delle rotte")
+    parser.add_argument('--once', action='store_true', help="Interroga una volta tutte le rotte e termina")
+    args = parser.parse_args()
+
+    storage = create_storage()
+    attach_alerts(storage)
+    coordinator = ShardCoordinator(storage, workers=args.workers, threads=args.threads,
+                                   interval=args.interval, refresh_interval=args.refresh,
+                                   once=args.once)
+
+    print("\n" + "=" * 50)
+    print("🔄 POLLING ROTTE SU PIÙ PROCESSI")
+    print("=" * 50)
+    print(f"Worker: {args.workers} x {args.threads} ricerche | Intervallo: {args.interval:.0f}s")
+    print("Premi CTRL+C per terminare\n")
+
+    # CTRL+C e SIGTERM fermano il ciclo: run chiude i worker e scrive gli ultimi risultati
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda *_: coordinator.request_scale(1))
+        signal.signal(signal.SIGUSR2, lambda *_: coordinator.request_scale(-1))
+
+    start = time.time()
+    try:
+        coordinator.run(stop_event)
+    finally:
+        if hasattr(storage, 'close'):
+            storage.close()
+
+    summary = coordinator.summary()
+    workers = summary['workers']
+    print(f"\n📊 Ricerche: {workers.get('polls', 0)} | Salvate: {summary['searches']} "
+          f"in {summary['writes']} scritture | Errori: {workers.get('errors', 0)} | "
+          f"Ribilanciamenti: {summary['rebalances']} ({summary['moved_routes']} rotte spostate) | "
+          f"{time.time() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
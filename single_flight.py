@@ -0,0 +1,79 @@
+"""
+Coalescenza delle richieste identiche concorrenti (single-flight)
+Se più thread chiedono la stessa ricerca mentre è già in corso, solo il primo
+esegue la chiamata; gli altri attendono e ricevono lo stesso risultato
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    """Chiamata in corso per una chiave"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Gruppo di chiamate deduplicate per chiave (valido all'interno di un processo)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Esegue fn una sola volta per tutte le richieste concorrenti con la stessa chiave
+
+        Args:
+            key: Chiave della richiesta (es. la query normalizzata)
+            fn: Funzione da eseguire, senza argomenti
+
+        Returns:
+            Tuple[Any, bool]: Risultato di fn e True se è stato condiviso con un'altra richiesta
+
+        Raises:
+            Exception: L'eccezione sollevata da fn, propagata a tutti i chiamanti in attesa
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, call.waiters > 0
+
+    def stats(self) -> Dict[str, int]:
+        """Contatori delle chiamate eseguite e di quelle coalescenti"""
+        with self._lock:
+            return {
+                'executed': self.executed,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls)
+            }
@@ -0,0 +1,564 @@
+"""
+Storage SQLite per lo storico dei prezzi dei voli
+Stessa API di PriceStorage, ma ogni salvataggio è un INSERT invece di
+riscrivere l'intero file JSON
+"""
+import json
+import os
+import sqlite3
+import sys
+from typing import List, Dict, Optional, Iterable
+
+from offer_dedup import intern_offer, expand_offer, referenced_hashes
+from price_storage import PriceStorage
+from retention import RetentionPolicy, apply_retention
+from route_index import RouteSummaryIndex
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    origin TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    departure_date TEXT NOT NULL,
+    return_date TEXT,
+    offers_count INTEGER NOT NULL,
+    cheapest_price REAL,
+    average_price REAL,
+    currency TEXT,
+    granularity TEXT,
+    samples INTEGER NOT NULL DEFAULT 1,
+    priced_samples INTEGER,
+    avg_cheapest_price REAL,
+    max_cheapest_price REAL,
+    first_cheapest_price REAL,
+    last_cheapest_price REAL,
+    last_timestamp TEXT,
+    offers_pruned INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_searches_route
+    ON searches (origin, destination, departure_date, return_date);
+
+CREATE TABLE IF NOT EXISTS offers (
+    search_id INTEGER NOT NULL REFERENCES searches (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    price_total REAL,
+    currency TEXT,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (search_id, position)
+);
+
+CREATE TABLE IF NOT EXISTS interned (
+    hash TEXT PRIMARY KEY,
+    payload TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS route_summary (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    route_key TEXT NOT NULL UNIQUE,
+    origin TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    departure_date TEXT NOT NULL,
+    return_date TEXT,
+    searches_count INTEGER NOT NULL,
+    last_search TEXT,
+    last_price REAL,
+    min_price REAL,
+    max_price REAL,
+    price_sum REAL NOT NULL,
+    priced_count INTEGER NOT NULL
+);
+"""
+
+UPSERT_ROUTE_SUMMARY = """
+INSERT INTO route_summary (route_key, origin, destination, departure_date, return_date,
+                           searches_count, last_search, last_price, min_price,
+                           max_price, price_sum, priced_count)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (route_key) DO UPDATE SET
+    searches_count = searches_count + excluded.searches_count,
+    last_search = excluded.last_search,
+    last_price = excluded.last_price,
+    min_price = MIN(COALESCE(min_price, excluded.min_price),
+                    COALESCE(excluded.min_price, min_price)),
+    max_price = MAX(COALESCE(max_price, excluded.max_price),
+                    COALESCE(excluded.max_price, max_price)),
+    price_sum = price_sum + excluded.price_sum,
+    priced_count = priced_count + excluded.priced_count
+"""
+
+
+# Colonne aggiunte dopo la prima versione dello schema (migrate con ALTER TABLE)
+RETENTION_COLUMNS = {
+    'granularity': 'TEXT',
+    'samples': 'INTEGER NOT NULL DEFAULT 1',
+    'priced_samples': 'INTEGER',
+    'avg_cheapest_price': 'REAL',
+    'max_cheapest_price': 'REAL',
+    'first_cheapest_price': 'REAL',
+    'last_cheapest_price': 'REAL',
+    'last_timestamp': 'TEXT',
+    'offers_pruned': 'INTEGER NOT NULL DEFAULT 0'
+}
+
+
+class SQLitePriceStorage(PriceStorage):
+    """Gestisce lo storico prezzi in un database SQLite"""
+
+    def __init__(self, db_file='price_history.db'):
+        """
+        Inizializza lo storage SQLite
+
+        Args:
+            db_file (str): Path del database SQLite
+        """
+        super().__init__(db_file)
+
+    def _ensure_db_exists(self):
+        """Crea tabelle e indici se non esistono"""
+        conn = self._connect()
+        try:
+            # WAL: i lettori non bloccano lo scrittore; più processi scrivono in sicurezza
+            # serializzati dal lock di SQLite (attesa fino al timeout della connessione)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.executescript(SCHEMA)
+
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(searches)')}
+            for name, definition in RETENTION_COLUMNS.items():
+                if name not in columns:
+                    conn.execute(f'ALTER TABLE searches ADD COLUMN {name} {definition}')
+
+            # Database creati prima del riepilogo rotte: lo ricostruisce una volta
+            has_searches = conn.execute('SELECT 1 FROM searches LIMIT 1').fetchone()
+            has_summary = conn.execute('SELECT 1 FROM route_summary LIMIT 1').fetchone()
+            if has_searches and not has_summary:
+                with conn:
+                    self._rebuild_route_summary(conn)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Apre una connessione al database (una per operazione, thread-safe)"""
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA foreign_keys = ON')
+        return conn
+
+    def save_searches(self, searches: Iterable[Dict]) -> int:
+        """
+        Salva più ricerche in un'unica transazione
+
+        Args:
+            searches: Dict con origin, destination, departure_date,
+                      return_date (opzionale) e offers, come per save_search
+
+        Returns:
+            int: Numero di ricerche salvate
+        """
+        search_records = [
+            self._build_search_record(
+                search['origin'], search['destination'], search['departure_date'],
+                search.get('return_date'), search['offers']
+            )
+            for search in searches
+        ]
+
+        conn = self._connect()
+        try:
+            with conn:
+                for search_record in search_records:
+                    self._insert_record(conn, search_record)
+                # Letti nella stessa transazione: non includono salvataggi successivi
+                searches_counts = {}
+                for key in {self._route_key(record['route']) for record in search_records}:
+                    searches_counts[key] = conn.execute(
+                        'SELECT searches_count FROM route_summary WHERE route_key = ?', (key,)
+                    ).fetchone()[0]
+        finally:
+            conn.close()
+
+        self._notify(search_records, searches_counts)
+        return len(search_records)
+
+    def _insert_record(self, conn: sqlite3.Connection, search_record: Dict) -> int:
+        """Inserisce un record di ricerca con le sue offerte"""
+        route = search_record['route']
+        cursor = conn.execute(
+            """
+            INSERT INTO searches (timestamp, origin, destination, departure_date,
+                                  return_date, offers_count, cheapest_price,
+                                  average_price, currency, granularity, samples,
+                                  priced_samples, avg_cheapest_price, max_cheapest_price,
+                                  first_cheapest_price, last_cheapest_price, last_timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                search_record['timestamp'],
+                route['origin'],
+                route['destination'],
+                route['departure_date'],
+                route.get('return_date'),
+                search_record.get('offers_count', len(search_record.get('offers', []))),
+                search_record.get('cheapest_price'),
+                search_record.get('average_price'),
+                search_record.get('currency', 'EUR'),
+                search_record.get('granularity'),
+                search_record.get('samples', 1),
+                search_record.get('priced_samples'),
+                search_record.get('avg_cheapest_price'),
+                search_record.get('max_cheapest_price'),
+                search_record.get('first_cheapest_price'),
+                search_record.get('last_cheapest_price'),
+                search_record.get('last_timestamp')
+            )
+        )
+        search_id = cursor.lastrowid
+
+        # Itinerari e segmenti vanno nella tabella interned, una volta sola per contenuto
+        new_entries = {}
+        compact_offers = [
+            intern_offer(offer, {}, new_entries) for offer in search_record.get('offers', [])
+        ]
+        conn.executemany(
+            'INSERT OR IGNORE INTO interned (hash, payload) VALUES (?, ?)',
+            [(ref, json.dumps(value, ensure_ascii=False)) for ref, value in new_entries.items()]
+        )
+        conn.executemany(
+            """
+            INSERT INTO offers (search_id, position, price_total, currency, payload)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    search_id,
+                    position,
+                    offer.get('price', {}).get('total'),
+                    offer.get('price', {}).get('currency'),
+                    json.dumps(offer, ensure_ascii=False)
+                )
+                for position, offer in enumerate(compact_offers)
+            ]
+        )
+
+        self._update_route_summary(conn, search_record)
+        return search_id
+
+    def _update_route_summary(self, conn: sqlite3.Connection, search_record: Dict):
+        """Aggiorna il riepilogo della rotta nella stessa transazione dell'insert"""
+        route = search_record['route']
+        price = search_record.get('cheapest_price')
+        priced = search_record.get('priced_samples')
+        if priced is None:
+            priced = 0 if price is None else 1
+        conn.execute(
+            UPSERT_ROUTE_SUMMARY,
+            (
+                self._route_key(route),
+                route['origin'],
+                route['destination'],
+                route['departure_date'],
+                route.get('return_date'),
+                search_record.get('samples', 1),
+                search_record.get('last_timestamp') or search_record['timestamp'],
+                search_record.get('last_cheapest_price') or price,
+                price,
+                search_record.get('max_cheapest_price') or price,
+                (search_record.get('avg_cheapest_price') or price or 0.0) * priced,
+                priced
+            )
+        )
+
+    def _rebuild_route_summary(self, conn: sqlite3.Connection):
+        """Ricalcola la tabella route_summary dalle ricerche salvate"""
+        conn.execute('DELETE FROM route_summary')
+        rows = conn.execute('SELECT * FROM searches ORDER BY timestamp, id')
+        for row in rows.fetchall():
+            self._update_route_summary(conn, self._row_to_record(row))
+
+    def get_price_history(self, origin: str, destination: str,
+                         departure_date: str, return_date: Optional[str] = None,
+                         include_offers: bool = False) -> List[Dict]:
+        """
+        Recupera lo storico prezzi per una specifica rotta
+
+        Args:
+            include_offers: Carica anche le offerte complete di ogni ricerca
+
+        Returns:
+            List[Dict]: Lista degli storici di ricerca per quella rotta
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                """
+                SELECT * FROM searches
+                WHERE origin = ? AND destination = ? AND departure_date = ?
+                  AND return_date IS ?
+                ORDER BY timestamp, id
+                """,
+                (origin, destination, departure_date, return_date)
+            ).fetchall()
+
+            # La tabella offers viene letta solo se le offerte sono richieste
+            offers_by_search = {}
+            if rows and include_offers:
+                offer_rows = conn.execute(
+                    """
+                    SELECT o.search_id, o.payload FROM offers o
+                    JOIN searches s ON s.id = o.search_id
+                    WHERE s.origin = ? AND s.destination = ? AND s.departure_date = ?
+                      AND s.return_date IS ?
+                    ORDER BY o.search_id, o.position
+                    """,
+                    (origin, destination, departure_date, return_date)
+                ).fetchall()
+                lookup = self._interned_lookup(conn)
+                for offer_row in offer_rows:
+                    offers_by_search.setdefault(offer_row['search_id'], []).append(
+                        expand_offer(json.loads(offer_row['payload']), lookup)
+                    )
+        finally:
+            conn.close()
+
+        history = [self._row_to_record(row) for row in rows]
+        if include_offers:
+            for search in history:
+                search['offers'] = offers_by_search.get(search['id'], [])
+        return history
+
+    def get_offers(self, search_record: Dict) -> List[Dict]:
+        """
+        Carica le offerte di una ricerca dalla tabella offers
+
+        Args:
+            search_record: Record restituito da get_price_history
+
+        Returns:
+            List[Dict]: Offerte della ricerca
+        """
+        if 'offers' in search_record:
+            return search_record['offers']
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                'SELECT payload FROM offers WHERE search_id = ? ORDER BY position',
+                (search_record['id'],)
+            ).fetchall()
+            lookup = self._interned_lookup(conn)
+            return [expand_offer(json.loads(row['payload']), lookup) for row in rows]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _interned_lookup(conn: sqlite3.Connection):
+        """Funzione hash -> contenuto sulla tabella interned, con cache locale"""
+        cache = {}
+
+        def lookup(ref: str):
+            if ref not in cache:
+                row = conn.execute('SELECT payload FROM interned WHERE hash = ?', (ref,)).fetchone()
+                cache[ref] = json.loads(row['payload'])
+            return cache[ref]
+
+        return lookup
+
+    def get_all_routes(self) -> List[Dict]:
+        """
+        Recupera tutte le rotte monitorate
+
+        Returns:
+            List[Dict]: Lista delle rotte uniche monitorate
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT * FROM route_summary ORDER BY id').fetchall()
+        finally:
+            conn.close()
+
+        return RouteSummaryIndex({row['route_key']: self._row_to_summary(row) for row in rows}).routes()
+
+    def get_route_summary(self, route: Dict) -> Optional[Dict]:
+        """
+        Riepilogo di una sola rotta (stesso formato di get_all_routes)
+
+        Returns:
+            Optional[Dict]: Riepilogo, None se la rotta non è mai stata cercata
+        """
+        key = self._route_key(route)
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM route_summary WHERE route_key = ?', (key,)).fetchone()
+        finally:
+            conn.close()
+
+        if row is None:
+            return None
+        return RouteSummaryIndex({key: self._row_to_summary(row)}).route(route)
+
+    @staticmethod
+    def _row_to_summary(row: sqlite3.Row) -> Dict:
+        """Converte una riga di route_summary nel formato di RouteSummaryIndex"""
+        return {
+            'route': {
+                'origin': row['origin'],
+                'destination': row['destination'],
+                'departure_date': row['departure_date'],
+                'return_date': row['return_date']
+            },
+            'searches_count': row['searches_count'],
+            'last_search': row['last_search'],
+            'last_price': row['last_price'],
+            'min_price': row['min_price'],
+            'max_price': row['max_price'],
+            'price_sum': row['price_sum'],
+            'priced_count': row['priced_count']
+        }
+
+    def apply_retention(self, policy: Optional[RetentionPolicy] = None) -> Dict:
+        """
+        Applica la politica di conservazione: toglie le offerte alle ricerche vecchie
+        o già partite e aggrega per ora/giorno le ricerche più vecchie
+
+        Args:
+            policy: Politica da applicare (default: RetentionPolicy())
+
+        Returns:
+            Dict: Statistiche dell'operazione
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                rows = conn.execute('SELECT * FROM searches ORDER BY timestamp, id').fetchall()
+                existing_ids = {row['id'] for row in rows}
+                result = apply_retention(
+                    [self._row_to_record(row) for row in rows], policy or RetentionPolicy()
+                )
+
+                # Le offerte dei record aggregati vengono eliminate in cascata
+                conn.executemany(
+                    'DELETE FROM searches WHERE id = ?',
+                    [(search_id,) for search_id in result['aggregated_ids'] if search_id in existing_ids]
+                )
+                conn.executemany(
+                    'DELETE FROM offers WHERE search_id = ?',
+                    [(search_id,) for search_id in result['pruned_ids']]
+                )
+                conn.executemany(
+                    'UPDATE searches SET offers_pruned = 1 WHERE id = ?',
+                    [(search_id,) for search_id in result['pruned_ids']]
+                )
+                for record in result['records']:
+                    if record['id'] not in existing_ids:
+                        self._insert_record(conn, record)
+
+                self._rebuild_route_summary(conn)
+                self._prune_interned(conn)
+        finally:
+            conn.close()
+
+        return result['stats']
+
+    def _prune_interned(self, conn: sqlite3.Connection):
+        """Elimina dalla tabella interned itinerari e segmenti non più referenziati"""
+        lookup = self._interned_lookup(conn)
+        used = set()
+        for row in conn.execute('SELECT payload FROM offers'):
+            used.update(referenced_hashes(json.loads(row['payload']), lookup))
+
+        unused = [
+            (row['hash'],) for row in conn.execute('SELECT hash FROM interned').fetchall()
+            if row['hash'] not in used
+        ]
+        conn.executemany('DELETE FROM interned WHERE hash = ?', unused)
+
+    def import_json(self, json_file: str) -> int:
+        """
+        Importa in un'unica transazione lo storico di un file JSON esistente
+
+        Args:
+            json_file: Path del file price_history.json da importare
+
+        Returns:
+            int: Numero di ricerche importate
+
+        Raises:
+            FileNotFoundError: Se il file JSON non esiste
+            ValueError: Se il database contiene già delle ricerche (l'importazione
+                non è ripetibile: le ricerche verrebbero duplicate)
+        """
+        # PriceStorage creerebbe un file vuoto al posto di quello mancante
+        if not os.path.exists(json_file):
+            raise FileNotFoundError(f"File da importare non trovato: {json_file}")
+        source = PriceStorage(json_file)
+        imported = 0
+
+        conn = self._connect()
+        try:
+            with conn:
+                if conn.execute('SELECT 1 FROM searches LIMIT 1').fetchone():
+                    raise ValueError(
+                        f"Il database {self.db_file} contiene già delle ricerche: "
+                        f"importa su un database vuoto"
+                    )
+                for search_record in source._iter_searches():
+                    # Offerte già eliminate dalla retention: offers_ref c'è ma è vuoto
+                    pruned = 'offers_ref' in search_record and search_record['offers_ref'] is None
+                    # Supporta sia i record con offerte incorporate sia quelli con offers_ref
+                    search_record['offers'] = source.get_offers(search_record)
+                    search_id = self._insert_record(conn, search_record)
+                    if pruned:
+                        conn.execute('UPDATE searches SET offers_pruned = 1 WHERE id = ?', (search_id,))
+                    imported += 1
+        finally:
+            conn.close()
+
+        return imported
+
+    @staticmethod
+    def _row_to_record(row: sqlite3.Row) -> Dict:
+        """Converte una riga della tabella searches nel formato record di PriceStorage"""
+        record = {
+            'id': row['id'],
+            'timestamp': row['timestamp'],
+            'route': {
+                'origin': row['origin'],
+                'destination': row['destination'],
+                'departure_date': row['departure_date'],
+                'return_date': row['return_date']
+            },
+            'offers_count': row['offers_count'],
+            'cheapest_price': row['cheapest_price'],
+            'average_price': row['average_price'],
+            'currency': row['currency'],
+            # In SQLite il riferimento alle offerte è l'id stesso della ricerca
+            'offers_ref': row['id'] if row['offers_count'] and not row['offers_pruned'] else None
+        }
+        if row['granularity']:
+            record.update({
+                'granularity': row['granularity'],
+                'samples': row['samples'],
+                'priced_samples': row['priced_samples'],
+                'avg_cheapest_price': row['avg_cheapest_price'],
+                'max_cheapest_price': row['max_cheapest_price']
+            })
+            # Assenti negli aggregati creati prima che venissero salvati
+            for name in ('first_cheapest_price', 'last_cheapest_price', 'last_timestamp'):
+                if row[name] is not None:
+                    record[name] = row[name]
+        return record
+
+
+if __name__ == '__main__':
+    # Uso: python sqlite_storage.py [price_history.json] [price_history.db]
+    source = sys.argv[1] if len(sys.argv) > 1 else 'price_history.json'
+    target = sys.argv[2] if len(sys.argv) > 2 else 'price_history.db'
+
+    try:
+        imported = SQLitePriceStorage(target).import_json(source)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"✅ Importate {imported} ricerche da {source} in {target}")
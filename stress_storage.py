@@ -0,0 +1,99 @@
+"""
+Stress test dello storage con scrittori concorrenti su più processi
+Verifica che nessun record venga perso e che i lettori non vedano mai
+un file scritto a metà
+
+Uso: python stress_storage.py [--backend json|sqlite] [--processes 8] [--writes 50]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from price_storage import create_storage
+
+
+ROUTE = ('FCO', 'JFK', '2030-01-15', None)
+
+
+def _writer(backend, db_file, worker_id, writes):
+    """Salva `writes` ricerche sulla stessa rotta, ognuna con un'offerta riconoscibile"""
+    storage = create_storage(backend, db_file)
+    for i in range(writes):
+        offer = {
+            'id': f'{worker_id}-{i}',
+            'price': {'total': 100.0 + i, 'currency': 'EUR'},
+            'itineraries': []
+        }
+        storage.save_search(*ROUTE, [offer])
+    return writes
+
+
+def _reader(backend, db_file, duration):
+    """Legge il trend in loop per `duration` secondi; restituisce (letture, errori)"""
+    storage = create_storage(backend, db_file)
+    reads = errors = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        try:
+            storage.get_price_trend(*ROUTE)
+            storage.get_all_routes()
+            reads += 1
+        except Exception as e:
+            errors += 1
+            print(f"❌ Errore in lettura: {e}")
+    return reads, errors
+
+
+def run(backend, processes, writes, readers):
+    """Esegue lo stress test e restituisce True se non ci sono record persi"""
+    workdir = tempfile.mkdtemp(prefix='stress_storage_')
+    db_file = os.path.join(workdir, 'price_history.db' if backend == 'sqlite' else 'price_history.json')
+    create_storage(backend, db_file)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes + readers) as pool:
+        reader_futures = [pool.submit(_reader, backend, db_file, 2.0) for _ in range(readers)]
+        writer_futures = [pool.submit(_writer, backend, db_file, w, writes) for w in range(processes)]
+        written = sum(f.result() for f in writer_futures)
+        read_results = [f.result() for f in reader_futures]
+    elapsed = time.perf_counter() - start
+
+    storage = create_storage(backend, db_file)
+    history = storage.get_price_history(*ROUTE, include_offers=True)
+    stored_ids = {offer['id'] for search in history for offer in search['offers']}
+    expected_ids = {f'{w}-{i}' for w in range(processes) for i in range(writes)}
+    routes = storage.get_all_routes()
+    indexed = routes[0]['searches_count'] if routes else 0
+    read_errors = sum(errors for _, errors in read_results)
+
+    print(f"Backend: {backend} | processi: {processes} | scritture: {written} | {elapsed:.2f}s")
+    print(f"Record salvati: {len(history)} | offerte distinte: {len(stored_ids)} | "
+          f"riepilogo rotte: {indexed}")
+    print(f"Letture concorrenti: {sum(reads for reads, _ in read_results)} | errori: {read_errors}")
+
+    missing = expected_ids - stored_ids
+    if missing or len(history) != written or indexed != written or read_errors:
+        print(f"❌ FALLITO: {len(missing)} record persi")
+        return False
+
+    print("✅ Nessun record perso")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backend', choices=['json', 'sqlite'], default='json')
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=50)
+    parser.add_argument('--readers', type=int, default=2)
+    args = parser.parse_args()
+
+    ok = run(args.backend, args.processes, args.writes, args.readers)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Generatore di risposte sintetiche dell'API Amadeus (flight-offers)
+Produce dati raw con la stessa struttura delle risposte reali, deterministici
+per rotta e data, da usare nei benchmark e nel server mock
+"""
+import random
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+CARRIERS = ['AZ', 'AF', 'KL', 'LH', 'BA', 'IB', 'UA', 'DL', 'AA', 'EK', 'QR', 'TK', 'LX', 'OS', 'FR', 'U2']
+HUBS = ['CDG', 'AMS', 'FRA', 'MUC', 'LHR', 'MAD', 'ZRH', 'VIE', 'IST', 'DXB', 'DOH']
+AIRCRAFT = ['320', '321', '319', '32N', '738', '789', '788', '333', '359', '77W']
+
+
+def _format_duration(minutes: int) -> str:
+    """Durata in formato ISO 8601 (es. PT8H35M)"""
+    hours, minutes = divmod(minutes, 60)
+    return f"PT{hours}H{minutes}M" if minutes else f"PT{hours}H"
+
+
+def _generate_itinerary(rng: random.Random, origin: str, destination: str,
+                        date: str, carrier: str, segment_ids: List[int]) -> Dict:
+    """Itinerario diretto o con uno scalo in un hub"""
+    stops = [origin] + ([rng.choice([h for h in HUBS if h not in (origin, destination)])]
+                        if rng.random() < 0.6 else []) + [destination]
+
+    departure = datetime.strptime(date, '%Y-%m-%d') + timedelta(minutes=rng.randrange(6 * 60, 22 * 60, 5))
+    start = departure
+    segments = []
+    for leg_from, leg_to in zip(stops, stops[1:]):
+        minutes = rng.randrange(60, 9 * 60, 5)
+        arrival = departure + timedelta(minutes=minutes)
+        segment_ids[0] += 1
+        segments.append({
+            'departure': {'iataCode': leg_from, 'terminal': str(rng.randint(1, 3)),
+                          'at': departure.strftime('%Y-%m-%dT%H:%M:%S')},
+            'arrival': {'iataCode': leg_to, 'terminal': str(rng.randint(1, 3)),
+                        'at': arrival.strftime('%Y-%m-%dT%H:%M:%S')},
+            'carrierCode': carrier,
+            'number': str(rng.randint(100, 9999)),
+            'aircraft': {'code': rng.choice(AIRCRAFT)},
+            'operating': {'carrierCode': carrier},
+            'duration': _format_duration(minutes),
+            'id': str(segment_ids[0]),
+            'numberOfStops': 0,
+            'blacklistedInEU': False
+        })
+        departure = arrival + timedelta(minutes=rng.randrange(45, 4 * 60, 5))
+
+    total = int((arrival - start).total_seconds() // 60)
+    return {'duration': _format_duration(total), 'segments': segments}
+
+
+def generate_offers(origin: str, destination: str, departure_date: str,
+                    return_date: Optional[str] = None, count: int = 50,
+                    currency: str = 'EUR', seed: Optional[int] = None) -> List[Dict]:
+    """
+    Offerte raw sintetiche per una ricerca
+
+    Args:
+        origin: Codice IATA di partenza
+        destination: Codice IATA di destinazione
+        departure_date: Data di partenza YYYY-MM-DD
+        return_date: Data di ritorno (None per solo andata)
+        count: Numero di offerte
+        currency: Valuta dei prezzi
+        seed: Seme del generatore (default derivato da rotta e date, quindi
+              la stessa ricerca restituisce sempre gli stessi voli)
+
+    Returns:
+        list: Offerte nel formato del campo `data` della risposta Amadeus
+    """
+    if seed is None:
+        seed = zlib.crc32(f"{origin}{destination}{departure_date}{return_date}".encode('utf-8'))
+    rng = random.Random(seed)
+    base_price = rng.uniform(60, 900)
+    segment_ids = [0]
+
+    offers = []
+    for index in range(count):
+        carrier = rng.choice(CARRIERS)
+        itineraries = [_generate_itinerary(rng, origin, destination, departure_date, carrier, segment_ids)]
+        if return_date:
+            itineraries.append(_generate_itinerary(rng, destination, origin, return_date, carrier, segment_ids))
+
+        total = round(base_price * rng.uniform(0.8, 2.5), 2)
+        base = round(total * 0.78, 2)
+        offers.append({
+            'type': 'flight-offer',
+            'id': str(index + 1),
+            'source': 'GDS',
+            'instantTicketingRequired': False,
+            'nonHomogeneous': False,
+            'oneWay': False,
+            'lastTicketingDate': departure_date,
+            'numberOfBookableSeats': rng.randint(1, 9),
+            'itineraries': itineraries,
+            'price': {
+                'currency': currency,
+                'total': f"{total:.2f}",
+                'base': f"{base:.2f}",
+                'fees': [{'amount': '0.00', 'type': 'SUPPLIER'}, {'amount': '0.00', 'type': 'TICKETING'}],
+                'grandTotal': f"{total:.2f}"
+            },
+            'pricingOptions': {'fareType': ['PUBLISHED'], 'includedCheckedBagsOnly': False},
+            'validatingAirlineCodes': [carrier],
+            'travelerPricings': [{
+                'travelerId': '1',
+                'fareOption': 'STANDARD',
+                'travelerType': 'ADULT',
+                'price': {'currency': currency, 'total': f"{total:.2f}", 'base': f"{base:.2f}"},
+                'fareDetailsBySegment': [
+                    {
+                        'segmentId': segment['id'],
+                        'cabin': 'ECONOMY',
+                        'fareBasis': 'KNN0AAAA',
+                        'class': rng.choice('KLMNQSTV'),
+                        'includedCheckedBags': {'quantity': rng.randint(0, 1)}
+                    }
+                    for itinerary in itineraries for segment in itinerary['segments']
+                ]
+            }]
+        })
+    return offers
@@ -0,0 +1,181 @@
+"""
+Cache condivisa del token OAuth di Amadeus
+Worker gunicorn, CLI e GUI sullo stesso host riusano lo stesso token salvato
+su file invece di autenticarsi ciascuno al primo avvio. Il token viene
+rinnovato da un solo processo, prima della scadenza
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from amadeus.client.access_token import AccessToken
+
+from file_lock import FileLock, atomic_write_json
+
+TOKEN_PATH = '/v1/security/oauth2/token'
+
+
+class TokenCache:
+    """Token per credenziali e host, salvati in un file JSON protetto da lock"""
+
+    def __init__(self, path: str = '.amadeus_token.json', refresh_margin: float = 300):
+        """
+        Args:
+            path: File dei token (creato con permessi 0600)
+            refresh_margin: Secondi prima della scadenza in cui il token viene rinnovato
+        """
+        self.path = path
+        self.lock_file = path + '.lock'
+        self.refresh_margin = refresh_margin
+
+    @classmethod
+    def from_env(cls) -> Optional['TokenCache']:
+        """
+        Crea la cache da AMADEUS_TOKEN_CACHE (path del file)
+
+        Returns:
+            TokenCache: Cache configurata, o None se la variabile è vuota
+        """
+        path = os.getenv('AMADEUS_TOKEN_CACHE', '.amadeus_token.json')
+        return cls(path) if path else None
+
+    @staticmethod
+    def make_key(host: str, client_id: str) -> str:
+        """Chiave del token: hash di host e client id (l'id non viene salvato in chiaro)"""
+        return hashlib.blake2b(f"{host}:{client_id}".encode('utf-8'), digest_size=16).hexdigest()
+
+    def get_token(self, key: str, fetch: Callable[[], Dict]) -> Tuple[str, float]:
+        """
+        Token valido per la chiave, richiesto con fetch solo se serve
+
+        Args:
+            key: Chiave da make_key
+            fetch: Funzione che richiede un nuovo token e restituisce la risposta
+                   OAuth (access_token, expires_in)
+
+        Returns:
+            Tuple[str, float]: Token e istante di scadenza (epoch)
+        """
+        entry = self._read(key)
+        if self._is_fresh(entry):
+            return entry['access_token'], entry['expires_at']
+
+        lock = FileLock(self.lock_file)
+        # Token ancora valido ma vicino alla scadenza: lo rinnova un solo processo,
+        # gli altri continuano a usare quello attuale senza attendere
+        blocking = not self._is_valid(entry)
+        if not lock.acquire(blocking=blocking):
+            return entry['access_token'], entry['expires_at']
+        try:
+            entry = self._read(key)
+            if not self._is_fresh(entry):
+                entry = self._store(key, fetch())
+        finally:
+            lock.release()
+        return entry['access_token'], entry['expires_at']
+
+    async def get_token_async(self, key: str, fetch: Callable[[], Awaitable[Dict]]) -> Tuple[str, float]:
+        """Come get_token, con fetch asincrona; l'attesa del lock non blocca l'event loop"""
+        entry = self._read(key)
+        if self._is_fresh(entry):
+            return entry['access_token'], entry['expires_at']
+
+        lock = FileLock(self.lock_file)
+        blocking = not self._is_valid(entry)
+        if not await asyncio.to_thread(lock.acquire, blocking):
+            return entry['access_token'], entry['expires_at']
+        try:
+            entry = self._read(key)
+            if not self._is_fresh(entry):
+                entry = self._store(key, await fetch())
+        finally:
+            lock.release()
+        return entry['access_token'], entry['expires_at']
+
+    def invalidate(self, key: str, access_token: str):
+        """Scarta il token se è ancora quello salvato (es. dopo un 401)"""
+        with FileLock(self.lock_file):
+            tokens = self._read_all()
+            if tokens.get(key, {}).get('access_token') == access_token:
+                del tokens[key]
+                atomic_write_json(self.path, tokens)
+
+    def _is_fresh(self, entry: Optional[Dict]) -> bool:
+        """True se il token non va ancora rinnovato"""
+        return entry is not None and entry['expires_at'] - time.time() > self.refresh_margin
+
+    @staticmethod
+    def _is_valid(entry: Optional[Dict]) -> bool:
+        """True se il token è ancora utilizzabile (con qualche secondo di margine)"""
+        return entry is not None and entry['expires_at'] - time.time() > AccessToken.TOKEN_BUFFER
+
+    def _read(self, key: str) -> Optional[Dict]:
+        """Token salvato per la chiave, o None"""
+        return self._read_all().get(key)
+
+    def _read_all(self) -> Dict:
+        """Tutti i token salvati (file assente o illeggibile = nessun token)"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _store(self, key: str, response: Dict) -> Dict:
+        """Salva il token appena ottenuto (lock già acquisito)"""
+        entry = {
+            'access_token': response['access_token'],
+            'expires_at': time.time() + int(response.get('expires_in', 0))
+        }
+        tokens = self._read_all()
+        now = time.time()
+        tokens = {k: v for k, v in tokens.items() if v.get('expires_at', 0) > now}
+        tokens[key] = entry
+        atomic_write_json(self.path, tokens)
+        return entry
+
+
+class SharedAccessToken(AccessToken):
+    """AccessToken dell'SDK Amadeus che legge e rinnova il token tramite TokenCache"""
+
+    def __init__(self, client, cache: TokenCache):
+        super().__init__(client)
+        self.cache = cache
+        self.key = TokenCache.make_key(client.host, client.client_id)
+
+    def _bearer_token(self):
+        # Il file viene consultato solo quando il token in memoria si avvicina alla scadenza
+        if self.access_token is None or time.time() + self.cache.refresh_margin >= self.expires_at:
+            self.access_token, self.expires_at = self.cache.get_token(self.key, self._fetch)
+        return 'Bearer {0}'.format(self.access_token)
+
+    def invalidate(self, rejected_token: Optional[str] = None):
+        """
+        Scarta il token rifiutato dall'API (401), anche dalla cache condivisa;
+        un token già rinnovato nel frattempo da un'altra richiesta resta valido
+
+        Args:
+            rejected_token: Token usato dalla richiesta rifiutata (None = quello attuale)
+        """
+        rejected_token = rejected_token or self.access_token
+        if rejected_token is None:
+            return
+        self.cache.invalidate(self.key, rejected_token)
+        if self.access_token == rejected_token:
+            self.access_token, self.expires_at = None, 0
+
+    def _fetch(self) -> Dict:
+        """Richiede un nuovo token all'API"""
+        response = self.client._unauthenticated_request(
+            'POST',
+            TOKEN_PATH,
+            {
+                'grant_type': 'client_credentials',
+                'client_id': self.client.client_id,
+                'client_secret': self.client.client_secret
+            }
+        )
+        return response.result
@@ -0,0 +1,98 @@
+"""
+Verifica che la retention non cambi trend e riepilogo delle rotte
+Salva una serie di ricerche (in parte già aggregate), calcola trend e
+riepilogo, aggrega tutto con la retention e controlla che prezzo
+minimo/massimo/medio, prezzo attuale, variazione e ultima ricerca siano
+rimasti gli stessi
+
+Uso: python verify_retention.py [--backends json sqlite segments]
+"""
+import argparse
+import math
+import os
+import sys
+import tempfile
+
+from price_storage import create_storage
+from retention import RetentionPolicy
+
+
+ROUTE = ('FCO', 'JFK', '2030-01-15', None)
+PRICES = [230.0, 500.0, 100.0, 180.0, 140.0, 220.0]
+
+TREND_FIELDS = ('searches_count', 'lowest_price', 'highest_price', 'average_price',
+                'current_price', 'price_change', 'last_search')
+ROUTE_FIELDS = ('searches_count', 'last_price', 'last_search', 'min_price', 'max_price', 'avg_price')
+
+
+def _same(before, after) -> bool:
+    if isinstance(before, float) and isinstance(after, float):
+        return math.isclose(before, after, rel_tol=1e-9)
+    return before == after
+
+
+def run(backend: str) -> bool:
+    """Esegue la verifica su un backend e restituisce True se trend e riepilogo non cambiano"""
+    workdir = tempfile.mkdtemp(prefix='verify_retention_')
+    db_file = os.path.join(workdir, {
+        'json': 'price_history.json',
+        'sqlite': 'price_history.db',
+        'segments': 'price_history_log'
+    }[backend])
+    storage = create_storage(backend, db_file)
+
+    # Con tutte le soglie a 0 ogni ricerca viene aggregata per giorno: la prima
+    # metà viene aggregata subito, poi fusa con le ricerche successive
+    policy = RetentionPolicy(0, 0, 0)
+    for i, price in enumerate(PRICES):
+        offer = {'id': str(i), 'price': {'total': price, 'currency': 'EUR'}, 'itineraries': []}
+        storage.save_search(*ROUTE, [offer])
+        if i == len(PRICES) // 2 - 1:
+            storage.apply_retention(policy)
+
+    trend_before = storage.get_price_trend(*ROUTE)
+    route_before = storage.get_all_routes()[0]
+    expected = {
+        'searches_count': len(PRICES),
+        'lowest_price': min(PRICES),
+        'highest_price': max(PRICES),
+        'average_price': sum(PRICES) / len(PRICES),
+        'current_price': PRICES[-1],
+        'price_change': PRICES[-1] - PRICES[0]
+    }
+
+    stats = storage.apply_retention(policy)
+    trend_after = storage.get_price_trend(*ROUTE)
+    route_after = storage.get_all_routes()[0]
+    if hasattr(storage, 'close'):
+        storage.close()
+
+    print(f"Backend: {backend} | record: {stats['records_before']} -> {stats['records_after']}")
+    ok = stats['records_after'] < stats['records_before']
+    for field, value in expected.items():
+        if not _same(float(trend_before[field]), float(value)):
+            print(f"❌ trend.{field}: {trend_before[field]}, atteso {value}")
+            ok = False
+    for source, before, after, fields in (('trend', trend_before, trend_after, TREND_FIELDS),
+                                          ('rotta', route_before, route_after, ROUTE_FIELDS)):
+        for field in fields:
+            if not _same(before[field], after[field]):
+                print(f"❌ {source}.{field}: {before[field]} prima, {after[field]} dopo la retention")
+                ok = False
+
+    print("✅ Trend e riepilogo invariati" if ok else "❌ FALLITO")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backends', nargs='+', choices=['json', 'sqlite', 'segments'],
+                        default=['json', 'sqlite', 'segments'])
+    args = parser.parse_args()
+
+    results = [run(backend) for backend in args.backends]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()